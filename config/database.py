@@ -1,13 +1,32 @@
 """
 database.py
 
-Initializes the MongoDB connection and exposes database collections for use throughout the API.
+Initializes the storage backend and exposes database collections for use throughout the API.
 Loads credentials from environment variables and verifies the connection.
+
+The backend is selected with ``STORAGE_BACKEND``:
+    - ``mongo`` (default): connects to the MongoDB cluster.
+    - ``snapshot``: serves everything from a local snapshot file (``SNAPSHOT_PATH``),
+      without any database connection.
+
+With ``ANALYTICS_ENGINE=duckdb`` the last-price and price-index queries are answered from a
+DuckDB copy of the stations, reloaded periodically from the backend (see
+``storage/analytics.py``).
 """
 
 import os
+import time
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from storage.alerts import ALERT_NOTIFICATIONS_COLLECTION, ALERTS_COLLECTION
+from storage.alerts import ensure_indexes as ensure_alert_indexes
+from storage.analytics import SOURCE_PROJECTION, DuckDBStationStore
+from storage.mongo import MongoStationStore
+from storage.deadline import QUERY_MAX_TIME_MS
+from storage.price_index import PRICE_INDEX_COLLECTION
+from storage.resilience import RESILIENCE_ENABLED, ResilientStore
+from storage.slowlog import SlowQueryStore
+from storage.snapshot import MemoryCollection, SnapshotStationStore
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,22 +37,107 @@ DB_PASS = os.getenv("DB_PASS")
 DB_HOST = os.getenv("DB_HOST")
 DB_NAME = os.getenv("DB_NAME")
 
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshots/stations.bson.gz")
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "")
+
+# Sin timeout de socket, un servidor que deja de responder bloquea más allá de maxTimeMS
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", str(QUERY_MAX_TIME_MS + 5000)))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+
+STATIONS_COLLECTION = "stations2"
+USERS_COLLECTION = "users"
+
 # Create MongoDB connection string
 MONGO_URI = (
     f"mongodb+srv://{DB_USER}:{DB_PASS}@{DB_HOST}/?retryWrites=true&w=majority&appName=CoderCluster"
 )
 
-# Initialize MongoDB client and expose collections
-try:
-    client = MongoClient(MONGO_URI)
-    # Test the connection
-    client.admin.command("ping")
-    print("Pinged your deployment. You successfully connected to MongoDB!")
 
-    db = client[DB_NAME]  # The main MongoDB database instance
-    collection_name = db["stations2"]  # Collection for fuel stations
-    users_collection = db["users"]      # Collection for user accounts
+def connect() -> MongoClient:
+    """
+    Create a MongoDB client and verify the connection with a ping.
+
+    Returns:
+        MongoClient: A connected client.
+    """
+    mongo_client = MongoClient(
+        MONGO_URI,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    )
+    mongo_client.admin.command("ping")
+    return mongo_client
+
+
+if STORAGE_BACKEND == "snapshot":
+    # Modo sin base de datos: todo se sirve desde memoria
+    started = time.perf_counter()
+    station_store = SnapshotStationStore.load(SNAPSHOT_PATH)
+    print(
+        f"Loaded snapshot {SNAPSHOT_PATH} ({len(station_store.stations)} stations) "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
+
+    client = None
+    db = None
+    collection_name = None
+    users_collection = station_store.users
+    # Las alertas de precio viven sólo en memoria mientras dura el proceso
+    alerts_collection = MemoryCollection()
+    notifications_collection = MemoryCollection()
+
+elif STORAGE_BACKEND == "mongo":
+    # Initialize MongoDB client and expose collections
+    try:
+        client = connect()
+        print("Pinged your deployment. You successfully connected to MongoDB!")
+
+        db = client[DB_NAME]  # The main MongoDB database instance
+        collection_name = db[STATIONS_COLLECTION]  # Collection for fuel stations
+        users_collection = db[USERS_COLLECTION]  # Collection for user accounts
+        alerts_collection = db[ALERTS_COLLECTION]  # Price-alert subscriptions
+        notifications_collection = db[ALERT_NOTIFICATIONS_COLLECTION]
+        ensure_alert_indexes(alerts_collection, notifications_collection)
+        station_store = MongoStationStore(collection_name, db[PRICE_INDEX_COLLECTION])
+        station_store.ensure_indexes()
+
+    except Exception as e:
+        print(f"Error connecting to MongoDB: {e}")
+        raise
+
+else:
+    raise ValueError(
+        f"STORAGE_BACKEND desconocido: {STORAGE_BACKEND!r} (usar 'mongo' o 'snapshot')"
+    )
+
+backend_store = station_store
+"""The storage backend itself, without the wrappers below (for tools that need it)."""
+
+# Consultas analíticas desde una copia en DuckDB (ver storage/analytics.py)
+if ANALYTICS_ENGINE == "duckdb":
+    if STORAGE_BACKEND == "mongo":
+        source = lambda since: collection_name.find(
+            {"updatedAt": {"$gte": since}} if since is not None else {},
+            SOURCE_PROJECTION,
+            batch_size=1000,
+        )
+    else:
+        source = lambda since: [
+            station
+            for station in backend_store.stations
+            if since is None or (station.get("updatedAt") and station["updatedAt"] >= since)
+        ]
+    analytics_store = DuckDBStationStore(station_store, source)
+    station_store = analytics_store
+elif ANALYTICS_ENGINE:
+    raise ValueError(f"ANALYTICS_ENGINE desconocido: {ANALYTICS_ENGINE!r} (usar 'duckdb')")
+else:
+    analytics_store = None
+
+# Registrar las consultas lentas de las rutas (ver storage/slowlog.py)
+station_store = SlowQueryStore(station_store)
 
-except Exception as e:
-    print(f"Error connecting to MongoDB: {e}")
-    raise
+# Servir el último resultado bueno si MongoDB falla o se demora (ver storage/resilience.py)
+if RESILIENCE_ENABLED and STORAGE_BACKEND == "mongo":
+    station_store = ResilientStore(station_store)
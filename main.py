@@ -4,8 +4,46 @@ main.py
 Entry point for the FastAPI application. This file initializes the FastAPI app and includes all route modules for the API.
 """
 
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from routes import route, token, users
+from config.database import analytics_store, station_store
+from routes import alerts, changes, corridor, facets, route, search, stats, tiles, token, users
+from storage.catalog import CatalogRefresher
+from storage.resilience import StaleResponseMiddleware
+
+catalog = CatalogRefresher(
+    station_store,
+    [search.search_index, tiles.tile_pyramid, facets.facet_index, alerts.alert_index],
+)
+"""Keeps the in-process indexes (search, map tiles, facets, price alerts) in sync with the
+station catalog."""
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Build the in-process indexes at startup and keep refreshing them in the background,
+    along with the price-alert subscriptions and the analytics copy when it is enabled.
+
+    Args:
+        app (FastAPI): The application instance.
+    """
+    try:
+        await asyncio.to_thread(catalog.refresh)
+    except Exception as e:
+        print(f"Error loading station catalog: {e}")
+    refresher = asyncio.create_task(catalog.run())
+    # Las alertas cargan en segundo plano y se recargan para ver las de otros procesos
+    alert_reloader = asyncio.create_task(alerts.alert_index.run(alerts.stored_alerts))
+    # La copia analítica carga en segundo plano; hasta entonces responde el backend
+    analytics = asyncio.create_task(analytics_store.run()) if analytics_store else None
+    yield
+    refresher.cancel()
+    alert_reloader.cancel()
+    if analytics is not None:
+        analytics.cancel()
+
 
 app = FastAPI(
     title="Precio Nafta API",
@@ -18,10 +56,22 @@ app = FastAPI(
     license_info={
         "name": "MIT",
     },
+    lifespan=lifespan,
 )
 """The FastAPI application instance for the API."""
 
+# Marcar las respuestas servidas desde el último resultado bueno (Age, X-Cache-Status)
+app.add_middleware(StaleResponseMiddleware)
+
 # Include all routers with /api/v1 prefix
+# search va antes que route: /stations/search no debe resolverse como /stations/{station_id}
+app.include_router(search.router, prefix="/api/v1")
+app.include_router(tiles.router, prefix="/api/v1")
+app.include_router(facets.router, prefix="/api/v1")
+app.include_router(corridor.router, prefix="/api/v1")
 app.include_router(route.router, prefix="/api/v1")
+app.include_router(changes.router, prefix="/api/v1")
+app.include_router(stats.router, prefix="/api/v1")
+app.include_router(alerts.router, prefix="/api/v1")
 app.include_router(token.router, prefix="/api/v1")
 app.include_router(users.router, prefix="/api/v1")
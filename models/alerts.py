@@ -0,0 +1,116 @@
+"""
+alerts.py
+
+Defines Pydantic models for price-alert subscriptions and the notifications they produce.
+"""
+
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+MAX_ALERT_RADIUS_KM = 50
+
+
+class AlertCreate(BaseModel):
+    """
+    Represents a new price alert: notify when a product's price drops to or below a
+    threshold at a station in a region.
+
+    The region is either a town and/or province, or a circle around a point.
+
+    Attributes:
+        productId (int): The product to watch.
+        threshold (float): Notify when the latest price falls to this value or below.
+        province (Optional[str]): Only stations in this province.
+        town (Optional[str]): Only stations in this town.
+        near (Optional[List[float]]): Only stations near this ``[longitude, latitude]``.
+        radiusKm (float): Radius around ``near``, in kilometers.
+    """
+    productId: int
+    threshold: float = Field(..., gt=0)
+    province: Optional[str] = None
+    town: Optional[str] = None
+    near: Optional[List[float]] = None
+    radiusKm: float = Field(10.0, gt=0, le=MAX_ALERT_RADIUS_KM)
+
+    @field_validator("near")
+    @classmethod
+    def check_coordinates(cls, near: Optional[List[float]]) -> Optional[List[float]]:
+        """Ensure the point is a valid ``[longitude, latitude]`` pair."""
+        if near is not None and (
+            len(near) != 2 or not -180 <= near[0] <= 180 or not -90 <= near[1] <= 90
+        ):
+            raise ValueError(f"Coordenada inválida: {near} (se espera [longitud, latitud])")
+        return near
+
+    @model_validator(mode="after")
+    def check_region(self) -> "AlertCreate":
+        """Ensure exactly one kind of region is given."""
+        named = bool(self.province) or bool(self.town)
+        if named == (self.near is not None):
+            raise ValueError("Indicar una localidad y/o provincia, o bien un punto (near)")
+        return self
+
+
+class Alert(AlertCreate):
+    """
+    Represents a stored price alert.
+
+    Attributes:
+        id (str): The alert's unique ID.
+        createdAt (datetime): When the alert was created.
+    """
+    id: str
+    createdAt: datetime
+
+
+class AlertNotification(BaseModel):
+    """
+    Represents a price drop that triggered an alert.
+
+    An alert is triggered once each time the price crosses its threshold downwards, not
+    again while the price stays below it.
+
+    Attributes:
+        id (str): The notification's unique ID.
+        alertId (str): The alert that was triggered.
+        stationId (int): The station where the price dropped.
+        stationName (Optional[str]): The station's name.
+        town (Optional[str]): The station's town.
+        province (Optional[str]): The station's province.
+        productId (int): The product.
+        productName (Optional[str]): The product's name.
+        price (float): The new price.
+        previousPrice (Optional[float]): The price before the drop, if known.
+        threshold (float): The alert's threshold.
+        date (Optional[datetime]): When the station reported the new price.
+        createdAt (datetime): When the drop was detected.
+    """
+    id: str
+    alertId: str
+    stationId: int
+    stationName: Optional[str] = None
+    town: Optional[str] = None
+    province: Optional[str] = None
+    productId: int
+    productName: Optional[str] = None
+    price: float
+    previousPrice: Optional[float] = None
+    threshold: float
+    date: Optional[datetime] = None
+    createdAt: datetime
+
+
+class AlertNotificationPage(BaseModel):
+    """
+    Represents a page of the current user's alert notifications.
+
+    Attributes:
+        notifications (List[AlertNotification]): Notifications after the requested
+            position, oldest first.
+        nextToken (str): Opaque token to pass as ``since`` in the next request.
+        hasMore (bool): True if more notifications are available right away.
+    """
+    notifications: List[AlertNotification]
+    nextToken: str
+    hasMore: bool
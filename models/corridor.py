@@ -0,0 +1,50 @@
+"""
+corridor.py
+
+Defines Pydantic models for route-corridor searches.
+"""
+
+from typing import List, Literal
+from pydantic import BaseModel, Field, field_validator
+from models.stations import Station
+
+
+class AlongRouteQuery(BaseModel):
+    """
+    Represents a search for stations along a planned route.
+
+    Attributes:
+        route (List[List[float]]): The route as ``[longitude, latitude]`` vertices, in
+            driving order.
+        width_km (float): Maximum distance from the route, in kilometers.
+        product_id (int): Only stations selling this product, with its latest price.
+        order_by (str): 'position' (along the route) or 'price' (cheapest first).
+        limit (int): Maximum number of stations to return.
+    """
+    route: List[List[float]] = Field(..., min_length=2, max_length=10000)
+    width_km: float = Field(5.0, gt=0, le=50)
+    product_id: int
+    order_by: Literal["position", "price"] = "position"
+    limit: int = Field(50, ge=1, le=200)
+
+    @field_validator("route")
+    @classmethod
+    def check_coordinates(cls, route: List[List[float]]) -> List[List[float]]:
+        """Ensure every vertex is a valid ``[longitude, latitude]`` pair."""
+        for point in route:
+            if len(point) != 2 or not -180 <= point[0] <= 180 or not -90 <= point[1] <= 90:
+                raise ValueError(f"Coordenada inválida: {point} (se espera [longitud, latitud])")
+        return route
+
+
+class StationAlongRoute(Station):
+    """
+    Represents a station found along a route, with the latest price of the product.
+
+    Attributes:
+        routeKm (float): Distance from the start of the route to the point of the route
+            closest to the station.
+        offsetKm (float): Distance from the route to the station.
+    """
+    routeKm: float
+    offsetKm: float
@@ -0,0 +1,60 @@
+"""
+facets.py
+
+Defines Pydantic models for the facet counts shown next to the station filters.
+"""
+
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class FacetCount(BaseModel):
+    """
+    Represents one value of a station facet (a province, town or flag).
+
+    Attributes:
+        value (str): The value, as stored in the stations.
+        count (int): Number of stations with this value that match the other filters.
+        minPrice (Optional[float]): Lowest latest price of the filtered products among those
+            stations; only reported when a product filter is given.
+    """
+    value: str
+    count: int
+    minPrice: Optional[float] = None
+
+
+class ProductFacetCount(BaseModel):
+    """
+    Represents one product of the product facet.
+
+    Attributes:
+        productId (int): The product's unique ID.
+        productName (Optional[str]): The name of the product.
+        count (int): Number of stations selling the product that match the other filters.
+        minPrice (Optional[float]): Lowest latest price of the product among those stations.
+    """
+    productId: int
+    productName: Optional[str] = None
+    count: int
+    minPrice: Optional[float] = None
+
+
+class StationFacets(BaseModel):
+    """
+    Represents the facet counts for a set of station filters.
+
+    Each facet ignores its own filter, so a count is the number of stations ``/stations``
+    would match with that facet's filter set to the value.
+
+    Attributes:
+        total (int): Number of stations matching all the filters.
+        province (List[FacetCount]): Counts per province.
+        town (List[FacetCount]): Counts per town.
+        flag (List[FacetCount]): Counts per flag.
+        product (List[ProductFacetCount]): Counts per product.
+    """
+    total: int
+    province: List[FacetCount]
+    town: List[FacetCount]
+    flag: List[FacetCount]
+    product: List[ProductFacetCount]
@@ -0,0 +1,77 @@
+"""
+filters.py
+
+Defines the Pydantic models for the station filters and the price-history window shared by
+the query routes and the storage backends.
+"""
+
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class StationFilter(BaseModel):
+    """
+    Represents the optional filters accepted by the station and last-price routes.
+
+    Text filters are case-insensitive regular expressions, as in the query parameters.
+
+    Attributes:
+        province (Optional[str]): Filter by province name.
+        town (Optional[str]): Filter by town/locality name.
+        flag (Optional[str]): Filter by flag/brand name.
+        flag_id (Optional[int]): Filter by flag/brand ID.
+        product (Optional[str]): Filter by product name.
+        product_id (Optional[int]): Filter by product ID.
+    """
+
+    province: Optional[str] = None
+    town: Optional[str] = None
+    flag: Optional[str] = None
+    flag_id: Optional[int] = None
+    product: Optional[str] = None
+    product_id: Optional[int] = None
+
+    @property
+    def filters_products(self) -> bool:
+        """True if the filter restricts which products are returned."""
+        return bool(self.product) or self.product_id is not None
+
+
+class HistoryWindow(BaseModel):
+    """
+    Represents the part of each product's price history returned by the station routes.
+
+    Entries are kept if their date falls within the range; then only the last ``last_n``
+    of them, in recorded order, are kept. An empty window keeps the full history.
+
+    Attributes:
+        date_from (Optional[datetime]): Keep entries dated on or after this instant.
+        date_to (Optional[datetime]): Keep entries dated on or before this instant.
+        last_n (Optional[int]): Keep at most this many entries, the most recent ones.
+    """
+    date_from: Optional[datetime] = None
+    date_to: Optional[datetime] = None
+    last_n: Optional[int] = None
+
+    def trim(self, prices: List[dict]) -> List[dict]:
+        """
+        Apply the window to a price history.
+
+        Args:
+            prices (list): ``Price`` entries in recorded order.
+
+        Returns:
+            list: The entries inside the window (a new list).
+        """
+        if self.date_from is not None or self.date_to is not None:
+            prices = [
+                price
+                for price in prices
+                if price.get("date") is not None
+                and (self.date_from is None or price["date"] >= self.date_from)
+                and (self.date_to is None or price["date"] <= self.date_to)
+            ]
+        if self.last_n is not None:
+            prices = prices[-self.last_n :] if self.last_n > 0 else []
+        return list(prices)
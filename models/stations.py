@@ -5,7 +5,7 @@ Defines Pydantic models for geometry, price, product, and station entities used
 """
 
 from datetime import datetime  # Standard library
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel  # Third-party
 
 
@@ -67,3 +67,52 @@ class Station(BaseModel):
     flagId: int
     geometry: Geometry
     products: List[Product]
+
+
+class StationSearchResult(BaseModel):
+    """
+    Represents a station returned by the free-text search, with its relevance score.
+
+    Attributes:
+        stationId (int): The station's unique ID.
+        stationName (str): The name of the station.
+        address (str): The address of the station.
+        town (str): The town or locality where the station is located.
+        province (str): The province where the station is located.
+        flag (str): The flag/brand name.
+        flagId (int): The flag/brand ID.
+        score (float): Share of the query trigrams found in the station (0 to 1).
+    """
+    stationId: int
+    stationName: str
+    address: str
+    town: str
+    province: str
+    flag: str
+    flagId: int
+    score: float
+
+
+class StationChange(Station):
+    """
+    Represents a station returned by the delta sync, with its latest prices only.
+
+    Attributes:
+        updatedAt (Optional[datetime]): When the station document last changed.
+    """
+    updatedAt: Optional[datetime] = None
+
+
+class ChangeSet(BaseModel):
+    """
+    Represents a page of station changes for incremental client synchronization.
+
+    Attributes:
+        stations (List[StationChange]): Stations changed after the requested position,
+            oldest change first.
+        nextToken (str): Opaque token to pass as ``since`` in the next request.
+        hasMore (bool): True if more changes are available right away.
+    """
+    stations: List[StationChange]
+    nextToken: str
+    hasMore: bool
@@ -0,0 +1,35 @@
+"""
+stats.py
+
+Defines Pydantic models for aggregated price statistics.
+"""
+
+from datetime import datetime
+from typing import Optional
+from pydantic import BaseModel
+
+
+class PriceIndexPoint(BaseModel):
+    """
+    Represents one day of the daily price index of a product.
+
+    Attributes:
+        day (datetime): The day (UTC midnight).
+        productId (int): The product.
+        province (Optional[str]): The province, or None for the national index.
+        flag (Optional[str]): The flag, or None for all flags.
+        count (int): Number of stations that reported a price that day.
+        mean (float): Mean of the last price of each station that day.
+        median (float): Median of the last price of each station that day.
+        min (float): Lowest price.
+        max (float): Highest price.
+    """
+    day: datetime
+    productId: int
+    province: Optional[str] = None
+    flag: Optional[str] = None
+    count: int
+    mean: float
+    median: float
+    min: float
+    max: float
@@ -0,0 +1,48 @@
+"""
+tiles.py
+
+Defines Pydantic models for map tile responses.
+"""
+
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+
+class TileFeature(BaseModel):
+    """
+    Represents either a cluster of stations or a single station inside a map tile.
+
+    Attributes:
+        type (str): 'cluster' or 'station'.
+        coordinates (List[float]): Longitude and latitude (cluster centroid for clusters).
+        count (int): Number of stations represented (1 for a station).
+        stationId (Optional[int]): The station's unique ID (stations only).
+        stationName (Optional[str]): The name of the station (stations only).
+        flag (Optional[str]): The flag/brand name (stations only).
+        minPrices (Dict[int, float]): Lowest latest price per product ID.
+    """
+    type: str
+    coordinates: List[float]
+    count: int
+    stationId: Optional[int] = None
+    stationName: Optional[str] = None
+    flag: Optional[str] = None
+    minPrices: Dict[int, float]
+
+
+class Tile(BaseModel):
+    """
+    Represents the contents of a Web Mercator map tile.
+
+    Attributes:
+        z (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row.
+        clustered (bool): True if features are grid clusters, False if individual stations.
+        features (List[TileFeature]): The clusters or stations in the tile.
+    """
+    z: int
+    x: int
+    y: int
+    clustered: bool
+    features: List[TileFeature]
@@ -0,0 +1,238 @@
+"""
+alerts.py
+
+Route definitions for price-alert subscriptions and their notifications.
+
+Alerts are matched in-process by the engine in ``storage/alerts.py``, fed by the catalog
+refresher started in ``main.py``; clients read the notifications it writes instead of
+polling ``/last-prices``.
+"""
+
+import base64
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from pymongo.errors import PyMongoError
+from models.alerts import Alert, AlertCreate, AlertNotificationPage
+from config.database import alerts_collection, notifications_collection
+from storage.alerts import ALERT_NOTIFICATIONS_SETTLE_SECONDS, AlertIndex
+from auth import get_current_active_user
+
+ALERTS_PER_USER = int(os.getenv("ALERTS_PER_USER", "50"))
+
+router = APIRouter()
+
+alert_index = AlertIndex(notifications_collection)
+"""The shared alert matching engine, fed with price changes by the catalog refresher."""
+
+
+def stored_alerts():
+    """Return every stored subscription, for the matching engine to load."""
+    return alerts_collection.find({})
+
+
+def alert_serial(alert: dict) -> dict:
+    """Convert a stored alert or notification to its response shape."""
+    document = {key: value for key, value in alert.items() if key not in ("_id", "username")}
+    document["id"] = str(alert["_id"])
+    return document
+
+
+def encode_cursor(created_at: datetime, notification_id: str) -> str:
+    """
+    Encode a notification position as an opaque, URL-safe token.
+
+    Args:
+        created_at (datetime): ``createdAt`` of the last notification delivered.
+        notification_id (str): ID of the last notification delivered.
+
+    Returns:
+        str: The continuation token.
+    """
+    payload = json.dumps({"t": created_at.isoformat(), "id": notification_id}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(since: str) -> Tuple[datetime, Optional[str]]:
+    """
+    Parse the ``since`` parameter, which may be a continuation token or an ISO timestamp.
+
+    Args:
+        since (str): The value sent by the client.
+
+    Returns:
+        tuple: ``(createdAt, notification ID)``; the ID is None for plain timestamps.
+
+    Raises:
+        ValueError: If the value is neither a token nor an ISO timestamp.
+    """
+    try:
+        padded = since + "=" * (-len(since) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at, notification_id = datetime.fromisoformat(payload["t"]), payload["id"]
+        if not isinstance(notification_id, str):
+            raise TypeError(f"ID de notificación inválido: {notification_id!r}")
+    except (ValueError, TypeError, KeyError):
+        created_at = datetime.fromisoformat(since.replace("Z", "+00:00"))
+        notification_id = None
+
+    # MongoDB guarda las fechas en UTC sin zona horaria
+    if created_at.tzinfo is not None:
+        try:
+            created_at = created_at.astimezone(timezone.utc).replace(tzinfo=None)
+        except OverflowError as e:
+            raise ValueError(f"Fecha fuera de rango: {created_at}") from e
+    return created_at, notification_id
+
+
+@router.post("/alerts", status_code=201, tags=["Alerts"], response_model=Alert)
+def create_alert(alert: AlertCreate, current_user: dict = Depends(get_current_active_user)):
+    """
+    Subscribe the current user to a price alert.
+
+    Parameters:
+        alert (AlertCreate): The product, threshold and region to watch.
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Returns:
+        Alert: The stored alert.
+    Raises:
+        HTTPException: If the user reached the alert limit or a database error occurs.
+    """
+    try:
+        if alerts_collection.count_documents({"username": current_user.username}) >= (
+            ALERTS_PER_USER
+        ):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Se alcanzó el máximo de {ALERTS_PER_USER} alertas por usuario",
+            )
+        document = {
+            "username": current_user.username,
+            **alert.model_dump(),
+            "createdAt": datetime.utcnow(),
+        }
+        alerts_collection.insert_one(document)
+        alert_index.add(document)
+        return alert_serial(document)
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+
+
+@router.get("/alerts", tags=["Alerts"], response_model=List[Alert])
+def get_alerts(current_user: dict = Depends(get_current_active_user)):
+    """
+    Retrieve the current user's price alerts.
+
+    Parameters:
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Returns:
+        List[Alert]: The user's alerts, oldest first.
+    Raises:
+        HTTPException: If a database error occurs.
+    """
+    try:
+        alerts = alerts_collection.find(
+            {"username": current_user.username}, sort=[("createdAt", 1)]
+        )
+        return [alert_serial(alert) for alert in alerts]
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+
+
+@router.get("/alerts/notifications", tags=["Alerts"], response_model=AlertNotificationPage)
+def get_alert_notifications(
+    since: Optional[str] = Query(
+        None,
+        description="Token devuelto por la consulta anterior o fecha ISO 8601; "
+        "si se omite se devuelven las notificaciones desde el principio",
+    ),
+    limit: int = Query(100, ge=1, le=500, description="Límite de resultados (máx. 500)"),
+    current_user: dict = Depends(get_current_active_user),
+):
+    """
+    Retrieve the price drops that triggered the current user's alerts.
+
+    Clients keep the ``nextToken`` of the last page and pass it as ``since`` on the next
+    call. Notifications are ordered by ``(createdAt, id)``, so none is skipped when several
+    share an instant, and they only appear once ``ALERT_NOTIFICATIONS_SETTLE_SECONDS`` have
+    passed, when no write still in flight can land before them.
+
+    Parameters:
+        since (str, optional): Continuation token or ISO 8601 timestamp.
+        limit (int): Maximum number of notifications to return (default: 100, max: 500).
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Returns:
+        AlertNotificationPage: The notifications, oldest first, and the next token.
+    Raises:
+        HTTPException: If ``since`` is invalid or a database error occurs.
+    """
+    horizon = datetime.utcnow() - timedelta(seconds=ALERT_NOTIFICATIONS_SETTLE_SECONDS)
+    query = {"username": current_user.username, "createdAt": {"$lte": horizon}}
+    if since:
+        try:
+            created_at, notification_id = decode_cursor(since)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Parámetro since inválido: {since}",
+            ) from e
+        if notification_id is None:
+            query["createdAt"]["$gt"] = created_at
+        else:
+            query["$or"] = [
+                {"createdAt": {"$gt": created_at}},
+                {"createdAt": created_at, "_id": {"$gt": notification_id}},
+            ]
+    try:
+        notifications = list(
+            notifications_collection.find(query, sort=[("createdAt", 1), ("_id", 1)], limit=limit)
+        )
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+
+    if notifications:
+        next_token = encode_cursor(notifications[-1]["createdAt"], notifications[-1]["_id"])
+    elif since:
+        # Sin novedades: el cliente vuelve a consultar desde la misma posición
+        next_token = since
+    else:
+        next_token = encode_cursor(datetime(1970, 1, 1), "")
+    return {
+        "notifications": [alert_serial(notification) for notification in notifications],
+        "nextToken": next_token,
+        "hasMore": len(notifications) == limit,
+    }
+
+
+@router.delete("/alerts/{alert_id}", status_code=204, tags=["Alerts"])
+def delete_alert(alert_id: str, current_user: dict = Depends(get_current_active_user)):
+    """
+    Delete one of the current user's price alerts.
+
+    Parameters:
+        alert_id (str): The alert's ID.
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Raises:
+        HTTPException: If the alert does not exist (or belongs to another user) or a
+            database error occurs.
+    """
+    try:
+        result = alerts_collection.delete_one(
+            {"_id": ObjectId(alert_id), "username": current_user.username}
+        )
+    except InvalidId:
+        result = None
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"Error de base de datos: {str(e)}")
+    if result is None or not result.deleted_count:
+        raise HTTPException(status_code=404, detail="Alerta no encontrada")
+    alert_index.remove(alert_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,155 @@
+"""
+changes.py
+
+Route definitions for incremental (delta) synchronization.
+
+Clients keep an opaque continuation token and ask for the stations changed since that
+position. The position is ``(updatedAt, stationId)``, which is served by an indexed range
+scan, so the cost of a sync is proportional to the number of changes, not to the catalog.
+"""
+
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+from pymongo.errors import ExecutionTimeout, PyMongoError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from models.stations import ChangeSet
+from config.database import station_store
+from storage.deadline import ClientDisconnected, run_query
+from storage.resilience import CircuitOpenError
+from schemas.schema import list_serial
+from schemas.encoding import encoded_response
+from auth import get_current_active_user
+
+router = APIRouter()
+
+
+def encode_token(updated_at: datetime, station_id: int) -> str:
+    """
+    Encode a sync position as an opaque, URL-safe token.
+
+    Args:
+        updated_at (datetime): ``updatedAt`` of the last station delivered.
+        station_id (int): ID of the last station delivered.
+
+    Returns:
+        str: The continuation token.
+    """
+    payload = json.dumps({"t": updated_at.isoformat(), "id": station_id}).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_since(since: str) -> Tuple[datetime, Optional[int]]:
+    """
+    Parse the ``since`` parameter, which may be a continuation token or an ISO timestamp.
+
+    Args:
+        since (str): The value sent by the client.
+
+    Returns:
+        tuple: ``(updatedAt, stationId)``; the station ID is None for plain timestamps.
+
+    Raises:
+        ValueError: If the value is neither a token nor an ISO timestamp, or is out of range.
+    """
+    try:
+        padded = since + "=" * (-len(since) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        timestamp, station_id = datetime.fromisoformat(payload["t"]), int(payload["id"])
+    except (ValueError, TypeError, KeyError, OverflowError):
+        timestamp, station_id = datetime.fromisoformat(since.replace("Z", "+00:00")), None
+
+    # Un token alterado no debe llegar a la consulta (los enteros de BSON son de 64 bits)
+    if station_id is not None and not -(2**63) <= station_id < 2**63:
+        raise ValueError(f"stationId fuera de rango: {station_id}")
+    # MongoDB guarda las fechas en UTC sin zona horaria
+    if timestamp.tzinfo is not None:
+        try:
+            timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+        except OverflowError as e:
+            raise ValueError(f"Fecha fuera de rango: {timestamp}") from e
+    return timestamp, station_id
+
+
+@router.get("/changes", tags=["Sync"], response_model=ChangeSet)
+async def get_changes(
+    request: Request,
+    response: Response,
+    since: Optional[str] = Query(
+        None,
+        description="Token devuelto por la consulta anterior o fecha ISO 8601; "
+        "si se omite se devuelve el catálogo completo",
+    ),
+    limit: int = Query(500, ge=1, le=1000, description="Límite de estaciones (máx. 1000)"),
+    current_user: dict = Depends(get_current_active_user),
+):
+    """
+    Retrieve the stations (with their latest prices) changed after a sync position.
+
+    Parameters:
+        request (Request): The incoming request (for content negotiation).
+        response (Response): The outgoing response.
+        since (str, optional): Continuation token or ISO 8601 timestamp. Omit it for the
+            initial full sync.
+        limit (int): Maximum number of stations to return (default: 500, max: 1000).
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Returns:
+        ChangeSet: The changed stations, the next token and whether more changes remain.
+    Raises:
+        HTTPException: If ``since`` is invalid or a database/unexpected error occurs.
+    """
+    position: Tuple[Optional[datetime], Optional[int]] = (None, None)
+    if since:
+        try:
+            position = decode_since(since)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Parámetro since inválido: {since}",
+            ) from e
+
+    try:
+        stations = await run_query(
+            request, station_store, "find_changes", position[0], position[1], limit
+        )
+    except ClientDisconnected as e:
+        # Nadie va a leer la respuesta; las operaciones en la base ya se cancelaron
+        raise HTTPException(status_code=499, detail="Cliente desconectado") from e
+    except ExecutionTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"La consulta superó el tiempo límite: {str(e)}",
+        ) from e
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de datos no disponible temporalmente, reintentar más tarde",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        ) from e
+    except PyMongoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al acceder a la base de datos: {str(e)}",
+        ) from e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error inesperado: {str(e)}",
+        ) from e
+
+    if stations:
+        next_token = encode_token(stations[-1]["updatedAt"], stations[-1]["stationId"])
+    elif since:
+        # Sin cambios: el cliente vuelve a consultar desde la misma posición
+        next_token = since
+    else:
+        next_token = encode_token(datetime(1970, 1, 1), -1)
+
+    payload = {
+        "stations": list_serial(stations),
+        "nextToken": next_token,
+        "hasMore": len(stations) == limit,
+    }
+    return encoded_response(request, response, payload, ChangeSet)
@@ -0,0 +1,95 @@
+"""
+corridor.py
+
+Route definitions for route-corridor searches.
+
+Finds the stations within a given distance of a planned route (not around a single point),
+using the geospatial index of the storage backend, and returns them in driving order or
+cheapest first.
+"""
+
+import asyncio
+from typing import List
+from pymongo.errors import ExecutionTimeout, PyMongoError
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from models.corridor import AlongRouteQuery, StationAlongRoute
+from config.database import station_store
+from storage.deadline import ClientDisconnected, run_query
+from storage.resilience import CircuitOpenError
+from schemas.schema import individual_serial
+from schemas.encoding import encoded_response
+from storage.geo import Corridor
+from auth import get_current_active_user
+
+router = APIRouter()
+
+
+@router.post("/stations/along-route", tags=["Stations"], response_model=List[StationAlongRoute])
+async def get_stations_along_route(
+    request: Request,
+    response: Response,
+    query: AlongRouteQuery,
+    current_user: dict = Depends(get_current_active_user),
+):
+    """
+    Retrieve the stations within a corridor around a route, with the latest price of a
+    product.
+
+    Parameters:
+        request (Request): The incoming request (for content negotiation).
+        response (Response): The outgoing response.
+        query (AlongRouteQuery): The route, corridor width, product, ordering and limit.
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Returns:
+        List[StationAlongRoute]: Stations ordered by position along the route (or by
+        price), each with its distance along and from the route.
+    Raises:
+        HTTPException: If there is a database error or unexpected error.
+    """
+    try:
+        # Simplificar una ruta de miles de vértices lleva tiempo: fuera del event loop
+        corridor = await asyncio.to_thread(Corridor, query.route, query.width_km)
+        stations = await run_query(
+            request, station_store, "find_along_route", corridor, query.product_id
+        )
+    except ClientDisconnected as e:
+        # Nadie va a leer la respuesta; las operaciones en la base ya se cancelaron
+        raise HTTPException(status_code=499, detail="Cliente desconectado") from e
+    except ExecutionTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"La consulta superó el tiempo límite: {str(e)}",
+        ) from e
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de datos no disponible temporalmente, reintentar más tarde",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        ) from e
+    except PyMongoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al acceder a la base de datos: {str(e)}",
+        ) from e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error inesperado: {str(e)}",
+        ) from e
+
+    if query.order_by == "price":
+        # Más barata primero; a igual precio, la que aparece antes en el recorrido
+        stations.sort(
+            key=lambda station: (station["products"][0]["prices"][0]["price"], station["routeKm"])
+        )
+
+    payload = [
+        {
+            **individual_serial(station),
+            "routeKm": station["routeKm"],
+            "offsetKm": station["offsetKm"],
+        }
+        for station in stations[: query.limit]
+    ]
+    return encoded_response(request, response, payload, List[StationAlongRoute])
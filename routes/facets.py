@@ -0,0 +1,91 @@
+"""
+facets.py
+
+Route definitions for station facet counts.
+
+Facets are answered from the in-process bitmask index kept up to date by the catalog
+refresher started in ``main.py``; they never hit the database. Each response carries an
+ETag so filter UIs can revalidate cheaply.
+"""
+
+import os
+import re
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from models.facets import StationFacets
+from models.filters import StationFilter
+from storage.facets import FacetIndex
+from auth import get_current_active_user
+
+FACETS_MAX_AGE = int(os.getenv("FACETS_MAX_AGE", "60"))
+
+router = APIRouter()
+
+facet_index = FacetIndex()
+"""The shared facet index, refreshed incrementally from the station catalog."""
+
+
+@router.get("/stations/facets", tags=["Stations"], response_model=StationFacets)
+async def get_station_facets(
+    request: Request,
+    response: Response,
+    province: Optional[str] = Query(None, description="Filtrar por provincia"),
+    town: Optional[str] = Query(None, description="Filtrar por localidad"),
+    flag: Optional[str] = Query(
+        None, description="Filtrar por nombre de bandera (ej: YPF, Shell, Axion)"
+    ),
+    flag_id: Optional[int] = Query(None, description="Filtrar por ID de bandera"),
+    product: Optional[str] = Query(
+        None, description="Filtrar por nombre de producto (ej: Nafta, GNC, Gasoil)"
+    ),
+    product_id: Optional[int] = Query(None, description="Filtrar por ID de producto"),
+    current_user: dict = Depends(get_current_active_user),
+):
+    """
+    Retrieve the number of stations per province, town, flag and product for a set of
+    filters, with the lowest latest price of each.
+
+    Each facet ignores its own filter, so every count is what ``/stations`` would match with
+    that facet's filter set to the value.
+
+    Parameters:
+        request (Request): The incoming request (for revalidation).
+        response (Response): The outgoing response.
+        province (str, optional): Filter by province name (case-insensitive).
+        town (str, optional): Filter by town/locality name (case-insensitive).
+        flag (str, optional): Filter by flag/brand name (e.g., YPF, Shell, Axion).
+        flag_id (int, optional): Filter by flag/brand ID.
+        product (str, optional): Filter by product name (e.g., Nafta, GNC, Gasoil).
+        product_id (int, optional): Filter by product ID.
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Returns:
+        StationFacets: The total and the counts of each facet, largest first.
+    Raises:
+        HTTPException: If a text filter is not a valid regular expression.
+    """
+    filters = StationFilter(
+        province=province,
+        town=town,
+        flag=flag,
+        flag_id=flag_id,
+        product=product,
+        product_id=product_id,
+    )
+    try:
+        payload, version = facet_index.facets(filters)
+    except re.error as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Expresión regular inválida: {str(e)}",
+        ) from e
+
+    headers = {
+        "ETag": f'W/"{version}"',
+        "Cache-Control": f"private, max-age={FACETS_MAX_AGE}",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return payload
@@ -6,21 +6,84 @@ Route definitions for the API.
 This module contains the route handlers for the API endpoints, including station queries and price lookups. Each route is documented with its purpose, parameters, and return values.
 """
 
+import asyncio
+import os
+from datetime import date, datetime, time, timedelta
 from typing import Optional, List
-from pymongo.errors import PyMongoError
+from pymongo.errors import ExecutionTimeout, PyMongoError
 from fastapi import HTTPException, status, Depends
-from fastapi import Query
+from fastapi import Query, Request, Response
 from fastapi import APIRouter
+from models.filters import HistoryWindow, StationFilter
 from models.stations import Station
-from config.database import collection_name
+from config.database import station_store
+from storage.deadline import ClientDisconnected, run_query
+from storage.resilience import CircuitOpenError
 from schemas.schema import list_serial, individual_serial
+from schemas.encoding import encoded_response
+from storage.archive import merge_archived_prices
 from auth import get_current_active_user
 
+HISTORY_DEFAULT_DAYS = int(os.getenv("HISTORY_DEFAULT_DAYS", "90"))
+HISTORY_MAX_LAST_N = 1000
+
 router = APIRouter()
 
 
+def history_window(
+    history_from: Optional[date],
+    history_to: Optional[date],
+    history_last_n: Optional[int],
+    full_history: bool,
+) -> Optional[HistoryWindow]:
+    """
+    Build the price-history window of a station route from its query parameters.
+
+    Without any of them, the window is the last ``HISTORY_DEFAULT_DAYS`` days (whole days,
+    so equal requests on the same day share cache entries).
+
+    Args:
+        history_from (date, optional): First day of history.
+        history_to (date, optional): Last day of history, inclusive.
+        history_last_n (int, optional): Keep only this many entries per product.
+        full_history (bool): Return the whole history; excludes the other parameters.
+
+    Returns:
+        HistoryWindow | None: The window, or None for the full history.
+
+    Raises:
+        HTTPException: If the parameters contradict each other.
+    """
+    bounded = history_from is not None or history_to is not None or history_last_n is not None
+    if full_history:
+        if bounded:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="full_history no se puede combinar con history_from, history_to ni "
+                "history_last_n",
+            )
+        return None
+    if history_from is not None and history_to is not None and history_from > history_to:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Rango de historial inválido: history_from debe ser anterior a history_to",
+        )
+
+    if history_from is None and history_last_n is None:
+        history_from = (history_to or datetime.utcnow().date()) - timedelta(
+            days=HISTORY_DEFAULT_DAYS
+        )
+    return HistoryWindow(
+        date_from=datetime.combine(history_from, time.min) if history_from else None,
+        date_to=datetime.combine(history_to, time.max) if history_to else None,
+        last_n=history_last_n,
+    )
+
+
 @router.get("/stations", tags=["Stations"], response_model=List[Station])
 async def get_stations(
+    request: Request,
+    response: Response,
     province: Optional[str] = Query(None, description="Filtrar por provincia"),
     town: Optional[str] = Query(None, description="Filtrar por localidad"),
     flag: Optional[str] = Query(
@@ -32,12 +95,27 @@ async def get_stations(
     ),
     product_id: Optional[int] = Query(None, description="Filtrar por ID de producto"),
     limit: int = Query(20, ge=1, le=100, description="Límite de resultados (máx. 100)"),
+    history_from: Optional[date] = Query(
+        None,
+        description=f"Primer día del historial de precios (por defecto, {HISTORY_DEFAULT_DAYS} "
+        "días atrás)",
+    ),
+    history_to: Optional[date] = Query(None, description="Último día del historial de precios"),
+    history_last_n: Optional[int] = Query(
+        None,
+        ge=1,
+        le=HISTORY_MAX_LAST_N,
+        description="Sólo los últimos N precios de cada producto",
+    ),
+    full_history: bool = Query(False, description="Devolver el historial de precios completo"),
     current_user: dict = Depends(get_current_active_user),
 ):
     """
     Retrieve a list of stations filtered by optional parameters.
 
     Parameters:
+        request (Request): The incoming request (for content negotiation).
+        response (Response): The outgoing response.
         province (str, optional): Filter by province name (case-insensitive).
         town (str, optional): Filter by town/locality name (case-insensitive).
         flag (str, optional): Filter by flag/brand name (e.g., YPF, Shell, Axion).
@@ -45,79 +123,51 @@ async def get_stations(
         product (str, optional): Filter by product name (e.g., Nafta, GNC, Gasoil).
         product_id (int, optional): Filter by product ID.
         limit (int): Maximum number of results to return (default: 20, max: 100).
+        history_from (date, optional): First day of the price history returned.
+        history_to (date, optional): Last day of the price history returned.
+        history_last_n (int, optional): Return only the last N prices of each product.
+        full_history (bool): Return the full price history. Without any history parameter,
+            the last ``HISTORY_DEFAULT_DAYS`` days are returned.
         current_user (dict): The authenticated user (injected by dependency).
 
     Returns:
         List[Station]: A list of stations matching the filters.
     Raises:
-        HTTPException: If there is a database error or unexpected error.
+        HTTPException: If the history parameters are invalid, or there is a database error
+            or unexpected error.
     """
+    window = history_window(history_from, history_to, history_last_n, full_history)
 
     try:
-        # Construir el pipeline de agregación
-        pipeline = []
-
-        # Etapa de match con los filtros iniciales
-        match_stage = {}
-
-        # Filtros básicos
-        if province:
-            match_stage["province"] = {"$regex": province, "$options": "i"}
-        if town:
-            match_stage["town"] = {"$regex": town, "$options": "i"}
-        if flag:
-            match_stage["flag"] = {"$regex": flag, "$options": "i"}
-        if flag_id:
-            match_stage["flagId"] = flag_id
-
-        # Añadir la etapa de match inicial si hay filtros
-        if match_stage:
-            pipeline.append({"$match": match_stage})
-
-        # Limitar la cantidad de estaciones antes de descomponer productos
-        pipeline.append({"$limit": limit})
-
-        # Descomponer los productos
-        pipeline.append({"$unwind": "$products"})
-
-        # Añadir filtros de productos si existen
-        product_match = {}
-        if product:
-            product_match["products.productName"] = {"$regex": product, "$options": "i"}
-        if product_id is not None:
-            product_match["products.productId"] = product_id
-
-        if product_match:
-            pipeline.append({"$match": product_match})
-
-        # Agrupar para mantener la estructura de la estación
-        pipeline.append(
-            {
-                "$group": {
-                    "_id": "$_id",
-                    "stationId": {"$first": "$stationId"},
-                    "stationName": {"$first": "$stationName"},
-                    "address": {"$first": "$address"},
-                    "town": {"$first": "$town"},
-                    "province": {"$first": "$province"},
-                    "flag": {"$first": "$flag"},
-                    "flagId": {"$first": "$flagId"},
-                    "geometry": {"$first": "$geometry"},
-                    "products": {"$push": "$products"},
-                }
-            }
+        filters = StationFilter(
+            province=province,
+            town=town,
+            flag=flag,
+            flag_id=flag_id,
+            product=product,
+            product_id=product_id,
         )
+        stations = await run_query(request, station_store, "find_stations", filters, limit, window)
 
-        # Ejecutar la agregación
-        cursor = collection_name.aggregate(
-            pipeline,
-            allowDiskUse=True,
-            maxTimeMS=30000,
-            batchSize=100,
-        )
-
-        return list_serial(cursor)
+        # Completar el histórico con los precios archivados, si la ventana llega hasta ellos;
+        # leer Parquet bloquea, así que no se hace en el event loop
+        stations = await asyncio.to_thread(merge_archived_prices, stations, window=window)
+        return encoded_response(request, response, list_serial(stations), List[Station])
 
+    except ClientDisconnected as e:
+        # Nadie va a leer la respuesta; las operaciones en la base ya se cancelaron
+        raise HTTPException(status_code=499, detail="Cliente desconectado") from e
+    except ExecutionTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"La consulta superó el tiempo límite: {str(e)}",
+        ) from e
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de datos no disponible temporalmente, reintentar más tarde",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        ) from e
     except PyMongoError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -132,89 +182,74 @@ async def get_stations(
 
 @router.get("/stations/{station_id}", tags=["Stations"], response_model=Station)
 async def get_station(
+    request: Request,
+    response: Response,
     station_id: int,
     product: Optional[str] = Query(
         None, description="Filtrar por nombre de producto (ej: Nafta, GNC, Gasoil)"
     ),
     product_id: Optional[int] = Query(None, description="Filtrar por ID de producto"),
+    history_from: Optional[date] = Query(
+        None,
+        description=f"Primer día del historial de precios (por defecto, {HISTORY_DEFAULT_DAYS} "
+        "días atrás)",
+    ),
+    history_to: Optional[date] = Query(None, description="Último día del historial de precios"),
+    history_last_n: Optional[int] = Query(
+        None,
+        ge=1,
+        le=HISTORY_MAX_LAST_N,
+        description="Sólo los últimos N precios de cada producto",
+    ),
+    full_history: bool = Query(False, description="Devolver el historial de precios completo"),
     current_user: dict = Depends(get_current_active_user),
 ):
     """
     Retrieve a single station by its ID, with optional product filtering.
 
     Parameters:
+        request (Request): The incoming request (for content negotiation).
+        response (Response): The outgoing response.
         station_id (int): The unique ID of the station.
         product (str, optional): Filter by product name (e.g., Nafta, GNC, Gasoil).
         product_id (int, optional): Filter by product ID.
+        history_from (date, optional): First day of the price history returned.
+        history_to (date, optional): Last day of the price history returned.
+        history_last_n (int, optional): Return only the last N prices of each product.
+        full_history (bool): Return the full price history. Without any history parameter,
+            the last ``HISTORY_DEFAULT_DAYS`` days are returned.
         current_user (dict): The authenticated user (injected by dependency).
 
     Returns:
         Station: The station matching the ID and filters.
     Raises:
-        HTTPException: If the station is not found or a database/unexpected error occurs.
+        HTTPException: If the history parameters are invalid, the station is not found or a
+            database/unexpected error occurs.
     """
+    window = history_window(history_from, history_to, history_last_n, full_history)
 
     try:
-        # Construir el pipeline de agregación
-        pipeline = [
-            # Filtrar por station_id
-            {"$match": {"stationId": station_id}},
-            # Descomponer los productos
-            {"$unwind": "$products"},
-        ]
-
-        # Añadir filtros de productos si existen
-        product_match = {}
-        if product:
-            product_match["products.productName"] = {"$regex": product, "$options": "i"}
-        if product_id is not None:
-            product_match["products.productId"] = product_id
-
-        if product_match:
-            pipeline.append({"$match": product_match})
-
-        # Agrupar para mantener la estructura de la estación
-        pipeline.extend(
-            [
-                {
-                    "$group": {
-                        "_id": "$_id",
-                        "stationId": {"$first": "$stationId"},
-                        "stationName": {"$first": "$stationName"},
-                        "address": {"$first": "$address"},
-                        "town": {"$first": "$town"},
-                        "province": {"$first": "$province"},
-                        "flag": {"$first": "$flag"},
-                        "flagId": {"$first": "$flagId"},
-                        "geometry": {"$first": "$geometry"},
-                        "products": {"$push": "$products"},
-                    }
-                },
-                {"$limit": 1},  # Solo debería haber un resultado
-            ]
+        filters = StationFilter(product=product, product_id=product_id)
+        station = await run_query(
+            request, station_store, "get_station", station_id, filters, window
         )
-
-        # Ejecutar la agregación
-        result = list(collection_name.aggregate(pipeline))
-
-        if not result:
-            # Si no hay resultados, verificar si la estación existe sin filtros
-            station = collection_name.find_one({"stationId": station_id})
-            if not station:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Estación con ID {station_id} no encontrada",
-                )
-
-            # Si la estación existe pero no tiene productos que coincidan con los filtros
-            if product or product_id is not None:
-                station["products"] = []
-                return individual_serial(station)
-
-            return individual_serial(station)
-
-        return individual_serial(result[0])
-
+        if station is not None:
+            merged = await asyncio.to_thread(merge_archived_prices, [station], window=window)
+            station = merged[0]
+    except ClientDisconnected as e:
+        # Nadie va a leer la respuesta; las operaciones en la base ya se cancelaron
+        raise HTTPException(status_code=499, detail="Cliente desconectado") from e
+    except ExecutionTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"La consulta superó el tiempo límite: {str(e)}",
+        ) from e
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de datos no disponible temporalmente, reintentar más tarde",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        ) from e
     except PyMongoError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -226,9 +261,19 @@ async def get_station(
             detail=f"Error inesperado: {str(e)}",
         ) from e
 
+    if station is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Estación con ID {station_id} no encontrada",
+        )
+
+    return encoded_response(request, response, individual_serial(station), Station)
+
 
 @router.get("/last-prices", tags=["Last prices"], response_model=List[Station])
 async def get_stations_last_prices(
+    request: Request,
+    response: Response,
     province: Optional[str] = Query(None, description="Filtrar por provincia"),
     town: Optional[str] = Query(None, description="Filtrar por localidad"),
     flag: Optional[str] = Query(
@@ -246,6 +291,8 @@ async def get_stations_last_prices(
     Retrieve the most recent prices for all stations filtered by optional parameters.
 
     Parameters:
+        request (Request): The incoming request (for content negotiation).
+        response (Response): The outgoing response.
         province (str, optional): Filter by province name.
         town (str, optional): Filter by town/locality name.
         flag (str, optional): Filter by flag/brand name.
@@ -262,172 +309,48 @@ async def get_stations_last_prices(
     """
 
     try:
-        # Construir el pipeline de agregación
-        pipeline = []
-
-        # Etapa de match con los filtros iniciales
-        match_stage = {}
-
-        # Filtros básicos
-        if province:
-            match_stage["province"] = {"$regex": province, "$options": "i"}
-        if town:
-            match_stage["town"] = {"$regex": town, "$options": "i"}
-        if flag:
-            match_stage["flag"] = {"$regex": flag, "$options": "i"}
-        if flag_id:
-            match_stage["flagId"] = flag_id
-
-        # Añadir la etapa de match inicial si hay filtros
-        if match_stage:
-            pipeline.append({"$match": match_stage})
-
-        # Descomponer los productos
-        pipeline.append({"$unwind": "$products"})
-
-        # Añadir filtros de productos si existen
-        product_match = {}
-        if product:
-            product_match["products.productName"] = {"$regex": product, "$options": "i"}
-        if product_id:
-            product_match["products.productId"] = product_id
-
-        if product_match:
-            pipeline.append({"$match": product_match})
-
-        # Obtener solo el precio más reciente para cada producto en cada
-        # estación
-        pipeline.extend(
-            [
-                # Primero, obtener el precio más reciente para cada producto
-                {
-                    "$addFields": {
-                        "products.prices": {
-                            "$let": {
-                                "vars": {
-                                    "sorted": {
-                                        "$filter": {
-                                            "input": {
-                                                "$map": {
-                                                    "input": "$products.prices",
-                                                    "as": "price",
-                                                    "in": {
-                                                        "$cond": [
-                                                            {"$gt": ["$$price.date", None]},
-                                                            "$$price",
-                                                            None,
-                                                        ]
-                                                    },
-                                                }
-                                            },
-                                            "as": "price",
-                                            "cond": {"$ne": ["$$price", None]},
-                                        }
-                                    }
-                                },
-                                "in": {
-                                    "$cond": [
-                                        {"$gt": [{"$size": "$$sorted"}, 0]},
-                                        [
-                                            {"$arrayElemAt": ["$$sorted", -1]}
-                                        ],  # Tomar el más reciente
-                                        [],
-                                    ]
-                                },
-                            }
-                        }
-                    }
-                },
-                # Filtrar productos que no tienen precios
-                {"$match": {"products.prices.0": {"$exists": True}}},
-                # Agrupar por estación y producto
-                {
-                    "$group": {
-                        "_id": {"stationId": "$stationId", "productId": "$products.productId"},
-                        "stationId": {"$first": "$stationId"},
-                        "stationName": {"$first": "$stationName"},
-                        "address": {"$first": "$address"},
-                        "town": {"$first": "$town"},
-                        "province": {"$first": "$province"},
-                        "flag": {"$first": "$flag"},
-                        "flagId": {"$first": "$flagId"},
-                        "geometry": {"$first": "$geometry"},
-                        "latestPrice": {"$first": {"$arrayElemAt": ["$products.prices", 0]}},
-                        "productInfo": {
-                            "$first": {
-                                "productId": "$products.productId",
-                                "productName": "$products.productName",
-                            }
-                        },
-                    }
-                },
-                # Reconstruir la estructura de productos con el precio más
-                # reciente
-                {
-                    "$project": {
-                        "_id": 0,
-                        "stationId": 1,
-                        "stationName": 1,
-                        "address": 1,
-                        "town": 1,
-                        "province": 1,
-                        "flag": 1,
-                        "flagId": 1,
-                        "geometry": 1,
-                        "product": {
-                            "productId": "$productInfo.productId",
-                            "productName": "$productInfo.productName",
-                            "prices": ["$latestPrice"],
-                        },
-                    }
-                },
-                # Agrupar por estación para tener todos los productos juntos
-                {
-                    "$group": {
-                        "_id": "$stationId",
-                        "stationId": {"$first": "$stationId"},
-                        "stationName": {"$first": "$stationName"},
-                        "address": {"$first": "$address"},
-                        "town": {"$first": "$town"},
-                        "province": {"$first": "$province"},
-                        "flag": {"$first": "$flag"},
-                        "flagId": {"$first": "$flagId"},
-                        "geometry": {"$first": "$geometry"},
-                        "products": {"$push": "$product"},
-                    }
-                },
-                # Ordenar por ID de estación para consistencia
-                {"$sort": {"stationId": 1}},
-                # Limitar los resultados
-                {"$limit": limit},
-            ]
-        )
-
-        # Ejecutar la agregación con opciones de rendimiento
-        cursor = collection_name.aggregate(
-            pipeline,
-            allowDiskUse=True,
-            maxTimeMS=30000,  # 30 segundos de tiempo máximo
-            batchSize=100,  # Tamaño de lote para la paginación
+        filters = StationFilter(
+            province=province,
+            town=town,
+            flag=flag,
+            flag_id=flag_id,
+            product=product,
+            product_id=product_id,
         )
+        stations = await run_query(request, station_store, "find_last_prices", filters, limit)
 
-        return list_serial(cursor)
+        return encoded_response(request, response, list_serial(stations), List[Station])
 
+    except ClientDisconnected as e:
+        # Nadie va a leer la respuesta; las operaciones en la base ya se cancelaron
+        raise HTTPException(status_code=499, detail="Cliente desconectado") from e
+    except ExecutionTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"La consulta superó el tiempo límite: {str(e)}",
+        ) from e
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de datos no disponible temporalmente, reintentar más tarde",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        ) from e
     except PyMongoError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al acceder a la base de datos: {str(e)}",
-        )
+        ) from e
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error inesperado: {
-                str(e)}",
-        )
+            detail=f"Error inesperado: {str(e)}",
+        ) from e
 
 
 @router.get("/last-prices/{station_id}", tags=["Last prices"], response_model=Station)
 async def get_station_last_prices(
+    request: Request,
+    response: Response,
     station_id: int,
     product: Optional[str] = Query(
         None, description="Filtrar por nombre de producto (ej: Nafta, GNC, Gasoil)"
@@ -439,6 +362,8 @@ async def get_station_last_prices(
     Retrieve the most recent prices for a single station by station ID, with optional product filtering.
 
     Parameters:
+        request (Request): The incoming request (for content negotiation).
+        response (Response): The outgoing response.
         station_id (int): The unique ID of the station.
         product (str, optional): Filter by product name.
         product_id (int, optional): Filter by product ID.
@@ -451,97 +376,39 @@ async def get_station_last_prices(
     """
 
     try:
-        # Construir el pipeline de agregación
-        pipeline = [
-            # Filtrar por station_id
-            {"$match": {"stationId": station_id}},
-            # Descomponer los productos
-            {"$unwind": "$products"},
-        ]
-
-        # Añadir filtros de productos si existen
-        product_match = {}
-        if product:
-            product_match["products.productName"] = {"$regex": product, "$options": "i"}
-        if product_id is not None:
-            product_match["products.productId"] = product_id
-
-        if product_match:
-            pipeline.append({"$match": product_match})
-
-        # Etapa de descomponer los productos para poder ordenar los precios
-        pipeline.extend(
-            [
-                {"$unwind": "$products"},
-                # Filtrar productos si es necesario
-                {"$match": {"products.prices": {"$exists": True, "$ne": []}}},
-                # Ordenar los precios por fecha descendente (más reciente
-                # primero)
-                {
-                    "$addFields": {
-                        "products.prices": {
-                            "$sortArray": {
-                                "input": "$products.prices",
-                                # Ordenar por fecha descendente
-                                "sortBy": {"date": -1},
-                            }
-                        }
-                    }
-                },
-                # Tomar solo el precio más reciente
-                {"$addFields": {"products.prices": {"$slice": ["$products.prices", 1]}}},
-                # Volver a agrupar por estación usando solo el stationId como
-                # _id
-                {
-                    "$group": {
-                        "_id": "$stationId",
-                        "stationId": {"$first": "$stationId"},
-                        "stationName": {"$first": "$stationName"},
-                        "address": {"$first": "$address"},
-                        "town": {"$first": "$town"},
-                        "province": {"$first": "$province"},
-                        "flag": {"$first": "$flag"},
-                        "flagId": {"$first": "$flagId"},
-                        "geometry": {"$first": "$geometry"},
-                        "products": {"$push": "$products"},
-                    }
-                },
-                # Proyectar los campos finales
-                {
-                    "$project": {
-                        "stationId": 1,
-                        "stationName": 1,
-                        "address": 1,
-                        "town": 1,
-                        "province": 1,
-                        "flag": 1,
-                        "flagId": 1,
-                        "geometry": 1,
-                        "products": 1,
-                    }
-                },
-            ]
+        filters = StationFilter(product=product, product_id=product_id)
+        station = await run_query(
+            request, station_store, "get_station_last_prices", station_id, filters
         )
-
-        # Ejecutar la agregación
-        result = list(collection_name.aggregate(pipeline))
-
-        if not result:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"No se encontró la estación con ID {station_id} o no tiene productos que coincidan con los filtros",
-            )
-
-        return individual_serial(result[0])
-
+    except ClientDisconnected as e:
+        # Nadie va a leer la respuesta; las operaciones en la base ya se cancelaron
+        raise HTTPException(status_code=499, detail="Cliente desconectado") from e
+    except ExecutionTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"La consulta superó el tiempo límite: {str(e)}",
+        ) from e
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de datos no disponible temporalmente, reintentar más tarde",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        ) from e
     except PyMongoError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error al acceder a la base de datos: {str(e)}",
-        )
+        ) from e
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error inesperado: {
-                str(e)}",
+            detail=f"Error inesperado: {str(e)}",
+        ) from e
+
+    if station is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No se encontró la estación con ID {station_id} o no tiene productos que coincidan con los filtros",
         )
+
+    return encoded_response(request, response, individual_serial(station), Station)
@@ -0,0 +1,44 @@
+"""
+search.py
+
+Route definitions for free-text station search.
+
+Searches are answered from an in-process trigram index kept up to date by the catalog
+refresher started in ``main.py``; they never hit the database.
+"""
+
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from models.stations import StationSearchResult
+from storage.search import StationSearchIndex
+from auth import get_current_active_user
+
+router = APIRouter()
+
+search_index = StationSearchIndex()
+"""The shared search index, refreshed incrementally from the station catalog."""
+
+
+@router.get("/stations/search", tags=["Stations"], response_model=List[StationSearchResult])
+async def search_stations(
+    q: str = Query(..., min_length=1, description="Texto a buscar (nombre, dirección, localidad)"),
+    province: Optional[str] = Query(None, description="Restringir a una provincia"),
+    limit: int = Query(10, ge=1, le=50, description="Límite de resultados (máx. 50)"),
+    current_user: dict = Depends(get_current_active_user),
+):
+    """
+    Search stations by partial, misspelled or accent-less text.
+
+    Parameters:
+        q (str): Free text matched against station name, address, town and flag.
+        province (str, optional): Only return stations in this province.
+        limit (int): Maximum number of results to return (default: 10, max: 50).
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Returns:
+        List[StationSearchResult]: Matching stations, best match first.
+    """
+    return [
+        {**summary, "score": score}
+        for score, summary in search_index.search(q, limit=limit, province=province)
+    ]
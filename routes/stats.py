@@ -0,0 +1,103 @@
+"""
+stats.py
+
+Route definitions for aggregated price statistics.
+
+The daily price index is precomputed by the rollup job (see ``storage/price_index.py``),
+so a query reads at most one small document per day from a single index range.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from pymongo.errors import ExecutionTimeout, PyMongoError
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from models.stats import PriceIndexPoint
+from config.database import station_store
+from storage.deadline import ClientDisconnected, run_query
+from storage.resilience import CircuitOpenError
+from schemas.encoding import encoded_response
+from auth import get_current_active_user
+
+router = APIRouter()
+
+INDEX_DEFAULT_DAYS = 365
+INDEX_MAX_DAYS = 3660
+
+
+@router.get("/stats/index", tags=["Stats"], response_model=List[PriceIndexPoint])
+async def get_price_index(
+    request: Request,
+    response: Response,
+    product_id: int = Query(..., description="ID del producto"),
+    province: Optional[str] = Query(None, description="Provincia; si se omite, índice nacional"),
+    flag: Optional[str] = Query(None, description="Bandera; si se omite, todas las banderas"),
+    date_from: Optional[date] = Query(
+        None, alias="from", description="Primer día (por defecto, un año antes de 'to')"
+    ),
+    date_to: Optional[date] = Query(None, alias="to", description="Último día (por defecto, hoy)"),
+    current_user: dict = Depends(get_current_active_user),
+):
+    """
+    Retrieve the daily price index (mean, median, min, max and station count) of a product.
+
+    Parameters:
+        request (Request): The incoming request (for content negotiation).
+        response (Response): The outgoing response.
+        product_id (int): The product.
+        province (str, optional): Restrict the index to a province.
+        flag (str, optional): Restrict the index to a flag.
+        date_from (date, optional): First day (``from``). Defaults to one year before ``to``.
+        date_to (date, optional): Last day (``to``), inclusive. Defaults to today (UTC).
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Returns:
+        List[PriceIndexPoint]: One point per day with observations, oldest first.
+    Raises:
+        HTTPException: If the date range is invalid or a database/unexpected error occurs.
+    """
+    date_to = date_to or datetime.utcnow().date()
+    date_from = date_from or date_to - timedelta(days=INDEX_DEFAULT_DAYS)
+    if date_from > date_to or (date_to - date_from).days > INDEX_MAX_DAYS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Rango de fechas inválido: from debe ser anterior a to y abarcar como "
+            f"máximo {INDEX_MAX_DAYS} días",
+        )
+
+    try:
+        points = await run_query(
+            request,
+            station_store,
+            "find_price_index",
+            product_id,
+            province,
+            flag,
+            datetime.combine(date_from, datetime.min.time()),
+            datetime.combine(date_to, datetime.min.time()),
+        )
+    except ClientDisconnected as e:
+        # Nadie va a leer la respuesta; las operaciones en la base ya se cancelaron
+        raise HTTPException(status_code=499, detail="Cliente desconectado") from e
+    except ExecutionTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"La consulta superó el tiempo límite: {str(e)}",
+        ) from e
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Base de datos no disponible temporalmente, reintentar más tarde",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))},
+        ) from e
+    except PyMongoError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error al acceder a la base de datos: {str(e)}",
+        ) from e
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error inesperado: {str(e)}",
+        ) from e
+
+    return encoded_response(request, response, points, List[PriceIndexPoint])
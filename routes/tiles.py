@@ -0,0 +1,66 @@
+"""
+tiles.py
+
+Route definitions for map tiles.
+
+Tiles are answered from the in-process tile pyramid kept up to date by the catalog
+refresher started in ``main.py``. Each tile carries an ETag so clients can revalidate
+cheaply.
+"""
+
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response, status
+from models.tiles import Tile
+from storage.tiles import TilePyramid
+from auth import get_current_active_user
+
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", "60"))
+
+router = APIRouter()
+
+tile_pyramid = TilePyramid()
+"""The shared tile pyramid, refreshed incrementally from the station catalog."""
+
+
+@router.get("/stations/tiles/{z}/{x}/{y}", tags=["Stations"], response_model=Tile)
+async def get_tile(
+    request: Request,
+    response: Response,
+    z: int = Path(..., ge=0, le=22, description="Nivel de zoom"),
+    x: int = Path(..., ge=0, description="Columna del tile"),
+    y: int = Path(..., ge=0, description="Fila del tile"),
+    product_id: Optional[int] = Query(None, description="Filtrar por ID de producto"),
+    current_user: dict = Depends(get_current_active_user),
+):
+    """
+    Retrieve the stations in a map tile, clustered on a grid at low zoom levels.
+
+    Parameters:
+        z (int): Zoom level (0-22).
+        x (int): Tile column.
+        y (int): Tile row.
+        product_id (int, optional): Only include stations selling this product.
+        current_user (dict): The authenticated user (injected by dependency).
+
+    Returns:
+        Tile: Clusters (with station count and minimum latest prices) or individual stations.
+    Raises:
+        HTTPException: If the tile coordinates are outside the zoom level's grid.
+    """
+    if x >= 2**z or y >= 2**z:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tile {z}/{x}/{y} fuera de rango",
+        )
+
+    payload, version = tile_pyramid.tile(z, x, y, product_id)
+    headers = {
+        "ETag": f'W/"{version}"',
+        "Cache-Control": f"private, max-age={TILE_MAX_AGE}",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    response.headers.update(headers)
+    return payload
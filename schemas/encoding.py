@@ -0,0 +1,256 @@
+"""
+encoding.py
+
+Content negotiation for station responses.
+
+Besides the default JSON, clients can ask for compact binary encodings with the ``Accept``
+header, and for compressed bodies with ``Accept-Encoding``:
+
+    - ``application/msgpack``: MessagePack, dates as native timestamps (extension -1);
+    - ``application/cbor``: CBOR, dates as epoch timestamps (tag 1);
+    - ``; keys=1`` on either media type replaces field names with small integers from
+      ``KEY_DICTIONARIES[1]``, since the same names repeat in every station and price;
+    - ``Accept-Encoding: zstd`` or ``gzip`` compresses any of the above.
+
+Responses go through the route's response model first, so every encoding carries exactly
+the fields of the JSON response.
+"""
+
+import gzip
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+import cbor2
+import msgpack
+import zstandard
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+MEDIA_TYPES = {
+    JSON: JSON,
+    "application/*": JSON,
+    "*/*": JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    CBOR: CBOR,
+}
+COMPRESSION_MIN_BYTES = 1024
+VARY = "Accept, Accept-Encoding"
+
+# Versiones publicadas: nunca modificar una existente, sólo agregar nuevas
+KEY_DICTIONARIES = {
+    1: [
+        "stationId",
+        "stationName",
+        "address",
+        "town",
+        "province",
+        "flag",
+        "flagId",
+        "geometry",
+        "type",
+        "coordinates",
+        "products",
+        "productId",
+        "productName",
+        "prices",
+        "price",
+        "date",
+        "updatedAt",
+        "routeKm",
+        "offsetKm",
+        "stations",
+        "nextToken",
+        "hasMore",
+    ],
+}
+_KEY_CODES = {
+    version: {name: code for code, name in enumerate(names)}
+    for version, names in KEY_DICTIONARIES.items()
+}
+_zstd = zstandard.ZstdCompressor(level=3)
+
+
+def _parse_header(value: str) -> List[Tuple[str, dict, float]]:
+    entries = []
+    for position, item in enumerate(value.split(",")):
+        parts = [part.strip() for part in item.split(";")]
+        if not parts[0]:
+            continue
+        params = {}
+        for part in parts[1:]:
+            name, _, param = part.partition("=")
+            params[name.strip().lower()] = param.strip()
+        try:
+            quality = float(params.pop("q", 1))
+        except ValueError:
+            quality = 0.0
+        # A igual calidad gana el primero que envió el cliente
+        entries.append((parts[0].lower(), params, quality - position * 1e-6))
+    return entries
+
+
+def negotiate_media_type(accept: Optional[str]) -> Tuple[str, Optional[int]]:
+    """
+    Pick the response encoding from an ``Accept`` header.
+
+    Args:
+        accept (str, optional): The header value.
+
+    Returns:
+        tuple: The media type (``JSON``, ``MSGPACK`` or ``CBOR``) and the key dictionary
+        version requested, if any (binary encodings only).
+    """
+    best = (JSON, None, -1.0)
+    for media_type, params, quality in _parse_header(accept or ""):
+        if media_type in MEDIA_TYPES and quality > 0 and quality > best[2]:
+            keys = params.get("keys")
+            version = int(keys) if keys and keys.isdigit() else None
+            best = (MEDIA_TYPES[media_type], version, quality)
+    media_type, version, _ = best
+    if media_type == JSON or version not in KEY_DICTIONARIES:
+        version = None
+    return media_type, version
+
+
+def negotiate_compression(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the content coding from an ``Accept-Encoding`` header (zstd preferred over gzip).
+
+    Args:
+        accept_encoding (str, optional): The header value.
+
+    Returns:
+        str | None: ``zstd``, ``gzip`` or None.
+    """
+    accepted = {
+        coding: quality
+        for coding, _, quality in _parse_header(accept_encoding or "")
+        if quality > 0
+    }
+    for coding in ("zstd", "gzip"):
+        if coding in accepted:
+            return coding
+    return None
+
+
+def compress(body: bytes, coding: Optional[str]) -> bytes:
+    """
+    Compress a response body.
+
+    Args:
+        body (bytes): The encoded body.
+        coding (str, optional): ``zstd``, ``gzip`` or None (no compression).
+
+    Returns:
+        bytes: The compressed body.
+    """
+    if coding == "zstd":
+        return _zstd.compress(body)
+    if coding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def apply_key_dictionary(value: Any, version: int) -> Any:
+    """
+    Replace the dictionary keys of a payload with their codes in a key dictionary.
+
+    Keys that are not in the dictionary are kept as strings.
+
+    Args:
+        value: The payload (nested dicts and lists).
+        version (int): Key dictionary version.
+
+    Returns:
+        The payload with integer keys.
+    """
+    codes = _KEY_CODES[version]
+
+    def convert(node):
+        if isinstance(node, dict):
+            return {codes.get(key, key): convert(item) for key, item in node.items()}
+        if isinstance(node, list):
+            return [convert(item) for item in node]
+        return node
+
+    return convert(value)
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _msgpack_default(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return msgpack.Timestamp.from_datetime(value)
+        # MongoDB devuelve fechas UTC sin zona horaria; evitar from_datetime, que es lento
+        delta = value - _EPOCH
+        return msgpack.Timestamp(delta.days * 86400 + delta.seconds, delta.microseconds * 1000)
+    raise TypeError(f"Tipo no serializable en MessagePack: {type(value).__name__}")
+
+
+def encode(payload: Any, media_type: str, key_version: Optional[int] = None) -> bytes:
+    """
+    Encode an already validated payload.
+
+    Args:
+        payload: The payload, with native ``datetime`` values.
+        media_type (str): ``MSGPACK`` or ``CBOR``.
+        key_version (int, optional): Key dictionary version to apply.
+
+    Returns:
+        bytes: The encoded body.
+    """
+    if key_version is not None:
+        payload = apply_key_dictionary(payload, key_version)
+    if media_type == MSGPACK:
+        return msgpack.packb(payload, default=_msgpack_default, use_bin_type=True)
+    return cbor2.dumps(payload, datetime_as_timestamp=True, timezone=timezone.utc)
+
+
+@lru_cache(maxsize=None)
+def _adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def encoded_response(request: Request, response: Response, payload: Any, model) -> Any:
+    """
+    Encode a route's payload as negotiated by the request headers.
+
+    When the client asks for plain, uncompressed JSON the payload is returned unchanged,
+    so FastAPI serializes it exactly as before.
+
+    Args:
+        request (Request): The incoming request.
+        response (Response): The route's response, to mark it as negotiated.
+        payload: The route's payload (e.g. the output of ``list_serial``).
+        model: The route's response model, used to select and coerce the fields.
+
+    Returns:
+        The payload itself, or a ``Response`` with the encoded (and compressed) body.
+    """
+    media_type, key_version = negotiate_media_type(request.headers.get("accept"))
+    coding = negotiate_compression(request.headers.get("accept-encoding"))
+    if media_type == JSON and coding is None:
+        response.headers["Vary"] = VARY
+        return payload
+
+    adapter = _adapter(model)
+    validated = adapter.validate_python(payload)
+    if media_type == JSON:
+        body = adapter.dump_json(validated)
+    else:
+        body = encode(adapter.dump_python(validated), media_type, key_version)
+
+    content_type = media_type if key_version is None else f"{media_type}; keys={key_version}"
+    headers = {"Vary": VARY}
+    if coding is not None and len(body) >= COMPRESSION_MIN_BYTES:
+        body = compress(body, coding)
+        headers["Content-Encoding"] = coding
+    return Response(content=body, media_type=content_type, headers=headers)
@@ -0,0 +1,426 @@
+"""
+alerts.py
+
+Matching engine for price-alert subscriptions.
+
+Subscriptions live in the ``alerts`` collection, one document per alert with the username
+of its owner. The engine keeps them in memory, bucketed by ``(productId, region)``: a
+region is a normalized province/town pair or a grid cell (an alert around a point is
+registered in every cell its circle touches). Each bucket keeps its thresholds sorted, so
+the alerts triggered by a price drop from ``previous`` to ``price`` are one contiguous slice
+(``price <= threshold < previous``) found by bisection: a price change costs a few
+dictionary lookups plus the number of alerts it triggers, whatever the number of
+subscribers.
+
+Price changes come from the catalog refresher, which feeds the engine the latest price of
+every station it reloads. Triggered alerts are written to the ``alert_notifications``
+outbox with an ID derived from the alert and the price report, so a change seen twice (by
+a retried refresh or by several API workers) is stored once.
+
+Clients page through their notifications by ``(createdAt, _id)``. ``createdAt`` is stamped
+just before the insert, which the server aborts if it takes more than half of
+``ALERT_NOTIFICATIONS_SETTLE_SECONDS``; readers only see notifications older than that
+window, so a slow worker can no longer commit one behind a client's position.
+"""
+
+import asyncio
+import math
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import pymongo
+from dotenv import load_dotenv
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from storage.geo import EARTH_RADIUS_KM, distance_km
+from storage.search import normalize
+
+load_dotenv()
+
+ALERTS_COLLECTION = "alerts"
+ALERT_NOTIFICATIONS_COLLECTION = "alert_notifications"
+ALERT_CELL_DEGREES = 0.25  # Celdas de la grilla de alertas por cercanía (~25 km)
+ALERTS_RELOAD_SECONDS = int(os.getenv("ALERTS_RELOAD_SECONDS", "300"))
+ALERT_NOTIFICATIONS_TTL_DAYS = int(os.getenv("ALERT_NOTIFICATIONS_TTL_DAYS", "30"))
+ALERT_NOTIFICATIONS_SETTLE_SECONDS = float(os.getenv("ALERT_NOTIFICATIONS_SETTLE_SECONDS", "10"))
+
+DUPLICATE_KEY = 11000
+KM_PER_DEGREE = math.radians(EARTH_RADIUS_KM)
+
+BucketKey = Tuple[int, tuple]
+
+
+def ensure_indexes(alerts_collection, notifications_collection) -> None:
+    """
+    Create the indexes used by the alert routes and expire old notifications.
+
+    Args:
+        alerts_collection: The ``alerts`` collection.
+        notifications_collection: The ``alert_notifications`` collection.
+    """
+    alerts_collection.create_index([("username", ASCENDING)])
+    notifications_collection.create_index(
+        [("username", ASCENDING), ("createdAt", ASCENDING), ("_id", ASCENDING)]
+    )
+    # Reemplazado por el anterior, que también ordena las notificaciones del mismo instante
+    if "username_1_createdAt_1" in notifications_collection.index_information():
+        notifications_collection.drop_index("username_1_createdAt_1")
+    notifications_collection.create_index(
+        "createdAt", expireAfterSeconds=ALERT_NOTIFICATIONS_TTL_DAYS * 86400
+    )
+
+
+@lru_cache(maxsize=65536)
+def _name_key(name: str) -> str:
+    # Hay pocos nombres distintos de provincia y localidad: normalizar cada uno una vez
+    return normalize(name)
+
+
+def _cell(lon: float, lat: float) -> Tuple[int, int]:
+    return math.floor(lon / ALERT_CELL_DEGREES), math.floor(lat / ALERT_CELL_DEGREES)
+
+
+def _circle_cells(lon: float, lat: float, radius_km: float) -> List[Tuple[int, int]]:
+    # Celdas que toca el rectángulo que contiene al círculo
+    lat_span = radius_km / KM_PER_DEGREE
+    widest = min(abs(lat) + lat_span, 89.0)
+    lon_span = radius_km / (KM_PER_DEGREE * math.cos(math.radians(widest)))
+    west, south = _cell(lon - lon_span, lat - lat_span)
+    east, north = _cell(lon + lon_span, lat + lat_span)
+    return [(x, y) for x in range(west, east + 1) for y in range(south, north + 1)]
+
+
+def region_keys(alert: dict) -> List[tuple]:
+    """
+    Return the regions an alert is registered in.
+
+    Args:
+        alert (dict): An alert document.
+
+    Returns:
+        list: ``("name", province, town)`` with normalized names ("" for "any"), or one
+        ``("cell", x, y)`` per grid cell the alert's circle touches.
+    """
+    if alert.get("near"):
+        return _cell_keys(alert["near"], alert["radiusKm"])
+    return [("name", _name_key(alert.get("province") or ""), _name_key(alert.get("town") or ""))]
+
+
+def _cell_keys(near, radius_km: float) -> List[tuple]:
+    return [("cell", x, y) for x, y in _circle_cells(near[0], near[1], radius_km)]
+
+
+def station_keys(station: dict) -> List[tuple]:
+    """
+    Return the regions whose alerts may apply to a station.
+
+    Args:
+        station (dict): A catalog document.
+
+    Returns:
+        list: The named regions the station belongs to and its grid cell.
+    """
+    province = _name_key(station.get("province") or "")
+    town = _name_key(station.get("town") or "")
+    keys = []
+    if town:
+        keys.append(("name", "", town))
+    if province:
+        keys.append(("name", province, ""))
+        if town:
+            keys.append(("name", province, town))
+    coordinates = (station.get("geometry") or {}).get("coordinates")
+    if coordinates and len(coordinates) == 2:
+        keys.append(("cell",) + _cell(*coordinates))
+    return keys
+
+
+class AlertIndex:
+    """
+    In-memory index of alert subscriptions, matched against price changes.
+
+    Safe to update from the API routes while the catalog refresher feeds it from another
+    thread.
+
+    Attributes:
+        outbox: Collection that receives the notifications (None to only return them).
+    """
+
+    def __init__(self, outbox=None):
+        self.outbox = outbox
+        self._lock = threading.Lock()
+        # _buckets[(producto, región)] -> umbrales ordenados y el slot de cada alerta
+        self._buckets: Dict[BucketKey, Tuple[array, array]] = {}
+        # _records[slot] -> (id, usuario, umbral, punto, radio, producto, región por nombre)
+        self._records: Dict[int, tuple] = {}
+        self._slots: Dict[str, int] = {}
+        self._next_slot = 0
+        # Altas y bajas recibidas durante una recarga, para reaplicarlas al terminar
+        self._changes_during_load: Optional[List[Tuple[str, object]]] = None
+        # Último precio visto de cada (estación, producto)
+        self._latest: Dict[Tuple[int, int], float] = {}
+        self._stations: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    @staticmethod
+    def _record(alert: dict) -> tuple:
+        # Un mismo usuario suele tener varias alertas: compartir la cadena
+        return (
+            str(alert["_id"]),
+            sys.intern(alert["username"]),
+            float(alert["threshold"]),
+            tuple(alert["near"]) if alert.get("near") else None,
+            alert.get("radiusKm"),
+            alert["productId"],
+            None if alert.get("near") else region_keys(alert)[0],
+        )
+
+    @staticmethod
+    def _regions(record: tuple) -> List[tuple]:
+        # Las celdas de un círculo se recalculan en vez de guardarse en cada alerta
+        return _cell_keys(record[3], record[4]) if record[3] is not None else [record[6]]
+
+    def load(self, alerts: Iterable[dict]) -> int:
+        """
+        Replace every subscription with the given ones.
+
+        The new index is built aside and swapped in, so matching is never blocked for long;
+        alerts added or removed meanwhile are applied again after the swap.
+
+        Args:
+            alerts (iterable): Alert documents, as stored in the ``alerts`` collection.
+
+        Returns:
+            int: Number of alerts loaded.
+        """
+        with self._lock:
+            self._changes_during_load = []
+        pending: Dict[BucketKey, List[Tuple[float, int]]] = {}
+        records, slots = {}, {}
+        for slot, alert in enumerate(alerts):
+            record = self._record(alert)
+            records[slot] = record
+            slots[record[0]] = slot
+            for region in self._regions(record):
+                pending.setdefault((record[5], region), []).append((record[2], slot))
+
+        buckets = {}
+        for key, entries in pending.items():
+            entries.sort()
+            buckets[key] = (
+                array("d", (threshold for threshold, _ in entries)),
+                array("q", (slot for _, slot in entries)),
+            )
+        with self._lock:
+            self._buckets, self._records, self._slots = buckets, records, slots
+            self._next_slot = len(records)
+            changes, self._changes_during_load = self._changes_during_load, None
+            for change, value in changes:
+                if change == "add":
+                    self._add(value)
+                else:
+                    self._remove(value)
+            return len(self._records)
+
+    def add(self, alert: dict) -> None:
+        """
+        Register a new alert (or replace one with the same ID).
+
+        Args:
+            alert (dict): The alert document.
+        """
+        with self._lock:
+            if self._changes_during_load is not None:
+                self._changes_during_load.append(("add", alert))
+            self._add(alert)
+
+    def _add(self, alert: dict) -> None:
+        record = self._record(alert)
+        self._remove(record[0])
+        slot = self._slots[record[0]] = self._next_slot
+        self._next_slot += 1
+        self._records[slot] = record
+        for region in self._regions(record):
+            thresholds, members = self._buckets.setdefault(
+                (record[5], region), (array("d"), array("q"))
+            )
+            position = bisect_right(thresholds, record[2])
+            thresholds.insert(position, record[2])
+            members.insert(position, slot)
+
+    def remove(self, alert_id: str) -> None:
+        """
+        Unregister an alert (no-op if it is not registered).
+
+        Args:
+            alert_id (str): The alert's ID.
+        """
+        with self._lock:
+            if self._changes_during_load is not None:
+                self._changes_during_load.append(("remove", alert_id))
+            self._remove(alert_id)
+
+    def _remove(self, alert_id: str) -> None:
+        slot = self._slots.pop(alert_id, None)
+        if slot is None:
+            return
+        record = self._records.pop(slot)
+        for region in self._regions(record):
+            key = (record[5], region)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            thresholds, members = bucket
+            start = bisect_left(thresholds, record[2])
+            end = bisect_right(thresholds, record[2])
+            for position in range(start, end):
+                if members[position] == slot:
+                    del thresholds[position]
+                    del members[position]
+                    break
+            if not thresholds:
+                del self._buckets[key]
+
+    def match(
+        self,
+        station: dict,
+        product_id: int,
+        price: float,
+        previous: Optional[float] = None,
+    ) -> List[tuple]:
+        """
+        Return the alerts a price drop triggers: those whose threshold the price crossed.
+
+        Args:
+            station (dict): The catalog document of the station.
+            product_id (int): The product whose price changed.
+            price (float): The new price.
+            previous (float, optional): The previous price; None if the product is new at
+                the station, which triggers every alert at or above the new price.
+
+        Returns:
+            list: ``(id, username, threshold, ...)`` records of the triggered alerts.
+        """
+        coordinates = (station.get("geometry") or {}).get("coordinates")
+        triggered = []
+        with self._lock:
+            for region in station_keys(station):
+                bucket = self._buckets.get((product_id, region))
+                if bucket is None:
+                    continue
+                thresholds, members = bucket
+                start = bisect_left(thresholds, price)
+                end = len(thresholds) if previous is None else bisect_left(thresholds, previous)
+                for position in range(start, end):
+                    record = self._records[members[position]]
+                    # La grilla aproxima el círculo: confirmar la distancia
+                    if region[0] == "cell" and distance_km(record[3], coordinates) > record[4]:
+                        continue
+                    triggered.append(record)
+        return triggered
+
+    def upsert(self, station: dict) -> List[dict]:
+        """
+        Apply a station's latest prices, notifying the alerts triggered by price drops.
+
+        A station seen for the first time only records its prices: without a previous
+        price there is no drop to report (this is also what happens at startup).
+
+        Args:
+            station (dict): A catalog document (with the latest price of each product).
+
+        Returns:
+            list: The notifications produced.
+        """
+        station_id = station["stationId"]
+        known = station_id in self._stations
+        notifications, changes = [], {}
+        now = datetime.utcnow()
+        for product in station.get("products") or []:
+            prices = product.get("prices") or []
+            if not prices or prices[-1].get("price") is None:
+                continue
+            report = prices[-1]
+            key = (station_id, product.get("productId"))
+            previous = self._latest.get(key)
+            if previous == report["price"]:
+                continue
+            changes[key] = report["price"]
+            if not known or (previous is not None and report["price"] > previous):
+                continue
+            reported = report.get("date")
+            suffix = f"{station_id}:{reported.isoformat() if reported else report['price']}"
+            for alert_id, username, threshold, *_ in self.match(
+                station, key[1], report["price"], previous
+            ):
+                notifications.append(
+                    {
+                        "_id": f"{alert_id}:{suffix}",
+                        "alertId": alert_id,
+                        "username": username,
+                        "stationId": station_id,
+                        "stationName": station.get("stationName"),
+                        "town": station.get("town"),
+                        "province": station.get("province"),
+                        "productId": key[1],
+                        "productName": product.get("productName"),
+                        "price": report["price"],
+                        "previousPrice": previous,
+                        "threshold": threshold,
+                        "date": reported,
+                        "createdAt": now,
+                    }
+                )
+
+        # Entregar antes de registrar los precios: si falla, el próximo refresco reintenta
+        if notifications and self.outbox is not None:
+            self._deliver(notifications)
+        self._latest.update(changes)
+        self._stations.add(station_id)
+        return notifications
+
+    def _deliver(self, notifications: List[dict]) -> None:
+        # Una escritura que supera la mitad de la ventana se aborta en el servidor: nunca
+        # aparece detrás de la posición de un cliente que ya leyó ese instante
+        now = datetime.utcnow()
+        for notification in notifications:
+            notification["createdAt"] = now
+        try:
+            with pymongo.timeout(ALERT_NOTIFICATIONS_SETTLE_SECONDS / 2):
+                self.outbox.insert_many(notifications, ordered=False)
+        except BulkWriteError as e:
+            # Otra instancia (o un reintento) ya registró la misma notificación
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+
+    async def run(
+        self, source: Callable[[], Iterable[dict]], interval: int = ALERTS_RELOAD_SECONDS
+    ) -> None:
+        """
+        Load the subscriptions now and then reload them every ``interval`` seconds, forever,
+        without blocking the event loop, to pick up alerts created or deleted by other API
+        workers.
+
+        Args:
+            source (callable): Returns the alert documents.
+            interval (int): Seconds between loads.
+        """
+        while True:
+            try:
+                started = time.perf_counter()
+                count = await asyncio.to_thread(lambda: self.load(source()))
+                print(f"Loaded {count} price alerts in {time.perf_counter() - started:.1f}s")
+            except Exception as e:
+                print(f"Error loading price alerts: {e}")
+            await asyncio.sleep(interval)
@@ -0,0 +1,560 @@
+"""
+analytics.py
+
+DuckDB engine for the analytical station queries.
+
+``DuckDBStationStore`` wraps the primary backend and answers the queries that scan many
+stations, the last-price search and the price index, with vectorized SQL over a columnar,
+in-memory copy of ``stations2``; every other query, including single-station reads, is
+delegated to the primary backend. The copy is loaded once from the full station documents
+and then refreshed every ``ANALYTICS_REFRESH_SECONDS`` from the ``updatedAt`` watermark, like
+the catalog refresher: the rows of the stations changed since the last refresh are replaced
+in one transaction, so queries never see a partial update. Until the first load finishes,
+every query goes to the primary backend.
+
+Tables:
+    - ``stations``: one row per station document (``row`` numbers them in load order);
+    - ``latest``: the latest dated price of each product of each station, computed while
+      loading (among equal dates, the last recorded entry wins);
+    - ``daily``: the last price of each station, product and day, with the day of the
+      station's next report (``until``): in the price index the station counts with that
+      price every day up to then. Sorted by product and day so range scans skip most of
+      the table.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import duckdb
+import pyarrow as pa
+from bson import ObjectId
+from dotenv import load_dotenv
+
+from models.filters import HistoryWindow, StationFilter
+from storage.base import StationStore
+from storage.archive import archive_watermark
+from storage.geo import Corridor
+from storage.price_index import PRICE_INDEX_MAX_CARRY_DAYS, day_of, scope_key
+
+load_dotenv()
+
+ANALYTICS_REFRESH_SECONDS = int(os.getenv("ANALYTICS_REFRESH_SECONDS", "300"))
+ANALYTICS_THREADS = int(os.getenv("ANALYTICS_THREADS", "4"))
+
+# Campos que lee la carga desde MongoDB
+SOURCE_PROJECTION = {
+    "stationId": 1,
+    "stationName": 1,
+    "address": 1,
+    "town": 1,
+    "province": 1,
+    "flag": 1,
+    "flagId": 1,
+    "geometry": 1,
+    "products.productId": 1,
+    "products.productName": 1,
+    "products.prices": 1,
+    "updatedAt": 1,
+}
+
+STATION_COLUMNS = (
+    "stationName",
+    "address",
+    "town",
+    "province",
+    "flag",
+    "flagId",
+)
+
+# Primero las estaciones (límite incluido) y después sus productos, en filas planas: un
+# list() ordenado por estación cuesta más que toda la consulta
+LAST_PRICES_SQL = """
+WITH matched AS (
+    SELECT DISTINCT s.row, s.stationId
+    FROM stations s
+    JOIN latest l ON l.row = s.row
+    WHERE {conditions}
+    ORDER BY s.stationId, s.row
+    LIMIT ?
+)
+SELECT
+    s.row, s._id, s.stationId, s.stationName, s.address, s.town, s.province, s.flag, s.flagId,
+    s.geometryType, s.lon, s.lat,
+    l.productId, l.productName, l.price, l.date, l.priceId
+FROM matched m
+JOIN stations s ON s.row = m.row
+JOIN latest l ON l.row = m.row
+WHERE {product_conditions}
+ORDER BY s.stationId, s.row, l.position
+"""
+
+# Una observación por estación, producto y día: la última (misma regla que el rollup),
+# vigente hasta el próximo día informado o hasta que vence (PRICE_INDEX_MAX_CARRY_DAYS)
+DAILY_SQL = f"""
+WITH last_of_day AS (
+    SELECT p.row, p.productId, date_trunc('day', p.date) AS day, p.price
+    FROM prices_arrow p
+    QUALIFY row_number() OVER (
+        PARTITION BY p.row, p.productId, date_trunc('day', p.date)
+        ORDER BY p.date DESC, p.seq DESC
+    ) = 1
+)
+SELECT
+    row, productId, day, price,
+    least(
+        lead(day) OVER (PARTITION BY row, productId ORDER BY day),
+        day + INTERVAL {PRICE_INDEX_MAX_CARRY_DAYS + 1} DAY
+    ) AS until
+FROM last_of_day
+ORDER BY productId, day
+"""
+
+# Cada estación cuenta todos los días con su último precio vigente, hasta el último día con
+# datos. La suma va ordenada: en paralelo su último bit, y con él el redondeo de la media,
+# dependería del reparto entre hilos
+PRICE_INDEX_SQL = """
+WITH days AS (
+    SELECT unnest(generate_series(
+        ?::TIMESTAMP, least(?::TIMESTAMP, (SELECT max(day) FROM daily)), INTERVAL 1 DAY
+    )) AS day
+),
+spans AS (
+    SELECT d.day, d.until, d.price, s.province, s.flag
+    FROM daily d
+    JOIN stations s ON s.row = d.row
+    WHERE d.productId = ? AND d.day <= ? AND d.until > ? AND {conditions}
+)
+SELECT
+    days.day,
+    {province} AS province,
+    {flag} AS flag,
+    count(*) AS count,
+    fsum(s.price ORDER BY s.price) / count(*) AS mean,
+    median(s.price) AS median,
+    min(s.price) AS min,
+    max(s.price) AS max
+FROM days
+JOIN spans s ON s.day <= days.day AND days.day < s.until
+GROUP BY days.day
+ORDER BY days.day
+"""
+
+
+def load_tables(stations: Iterable[dict], first_row: int = 0) -> Dict[str, pa.Table]:
+    """
+    Turn station documents into the Arrow tables loaded into DuckDB.
+
+    Args:
+        stations (iterable): Station documents with their full price history.
+        first_row (int): ``row`` number of the first station.
+
+    Returns:
+        dict: ``stations``, ``latest`` and ``prices`` tables (``prices`` is the full
+        history, from which the ``daily`` table is derived).
+    """
+    station_columns: Dict[str, list] = {
+        name: []
+        for name in (
+            "row",
+            "_id",
+            "stationId",
+            *STATION_COLUMNS,
+            "provinceKey",
+            "flagKey",
+            "geometryType",
+            "lon",
+            "lat",
+            "updatedAt",
+        )
+    }
+    latest_columns: Dict[str, list] = {
+        name: []
+        for name in ("row", "position", "productId", "productName", "price", "date", "priceId")
+    }
+    price_columns: Dict[str, list] = {
+        name: [] for name in ("row", "productId", "price", "date", "seq")
+    }
+
+    for row, station in enumerate(stations, first_row):
+        geometry = station.get("geometry") or {}
+        coordinates = geometry.get("coordinates") or [None, None]
+        station_columns["row"].append(row)
+        station_columns["_id"].append(str(station["_id"]) if "_id" in station else None)
+        station_columns["stationId"].append(station.get("stationId"))
+        for field in STATION_COLUMNS:
+            station_columns[field].append(station.get(field))
+        station_columns["provinceKey"].append(scope_key(station.get("province")))
+        station_columns["flagKey"].append(scope_key(station.get("flag")))
+        station_columns["geometryType"].append(geometry.get("type"))
+        station_columns["lon"].append(coordinates[0] if len(coordinates) > 1 else None)
+        station_columns["lat"].append(coordinates[1] if len(coordinates) > 1 else None)
+        station_columns["updatedAt"].append(station.get("updatedAt"))
+
+        for position, product in enumerate(station.get("products") or []):
+            latest = None
+            for seq, price in enumerate(product.get("prices") or []):
+                date = price.get("date")
+                if date is None:
+                    continue
+                price_columns["row"].append(row)
+                price_columns["productId"].append(product.get("productId"))
+                price_columns["price"].append(price.get("price"))
+                price_columns["date"].append(date)
+                price_columns["seq"].append(seq)
+                if latest is None or date >= latest["date"]:
+                    latest = price
+            if latest is None:
+                continue
+            latest_columns["row"].append(row)
+            latest_columns["position"].append(position)
+            latest_columns["productId"].append(product.get("productId"))
+            latest_columns["productName"].append(product.get("productName"))
+            latest_columns["price"].append(latest.get("price"))
+            latest_columns["date"].append(latest["date"])
+            latest_columns["priceId"].append(str(latest["_id"]) if "_id" in latest else None)
+
+    schemas = {
+        "stations": {"row": pa.int32(), "stationId": pa.int64(), "flagId": pa.int64()},
+        "latest": {"row": pa.int32(), "position": pa.int32(), "productId": pa.int64()},
+        "prices": {"row": pa.int32(), "productId": pa.int64(), "seq": pa.int32()},
+    }
+    tables = {}
+    for name, columns in (
+        ("stations", station_columns),
+        ("latest", latest_columns),
+        ("prices", price_columns),
+    ):
+        tables[name] = pa.table(
+            {
+                column: pa.array(values, type=schemas[name].get(column))
+                for column, values in columns.items()
+            }
+        )
+    return tables
+
+
+def _text_condition(column: str) -> str:
+    # Mismo criterio que $regex con la opción "i" (los campos ausentes no coinciden)
+    return f"regexp_matches({column}, ?, 'i')"
+
+
+class DuckDBStationStore(StationStore):
+    """
+    Storage backend wrapper that serves analytical queries from DuckDB.
+
+    Attributes:
+        primary (StationStore): The backend that owns the data and serves the other
+            queries.
+        source (callable): Called with a watermark (None for every station), returns the
+            station documents, with their full price history, whose ``updatedAt`` is at or
+            after it.
+        loaded_at (datetime | None): When the current copy was last refreshed.
+        watermark (datetime | None): Highest ``updatedAt`` loaded so far.
+    """
+
+    def __init__(
+        self, primary: StationStore, source: Callable[[Optional[datetime]], Iterable[dict]]
+    ):
+        self.primary = primary
+        self.source = source
+        self.loaded_at: Optional[datetime] = None
+        self.watermark: Optional[datetime] = None
+        self._connection: Optional[duckdb.DuckDBPyConnection] = None
+        self._readers: Dict[duckdb.DuckDBPyConnection, int] = {}
+        self._next_row = 0
+        self._replaced_rows = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Atributos propios del backend principal (users, explain, ensure_indexes...)
+        return getattr(self.primary, name)
+
+    def refresh(self, full: bool = False) -> Dict[str, int]:
+        """
+        Bring the DuckDB copy up to date with the source.
+
+        The first call (or ``full=True``) loads every station into a new database and
+        swaps it in; later calls only replace the stations changed since the watermark.
+        The lookup is inclusive, so stations sharing the watermark are loaded again.
+
+        Args:
+            full (bool): Reload every station even if a copy is already loaded.
+
+        Returns:
+            dict: Rows loaded per table.
+        """
+        with self._refresh_lock:
+            if full or self._connection is None:
+                return self._reload()
+            return self._update()
+
+    def _reload(self) -> Dict[str, int]:
+        tables = load_tables(self.source(None))
+        connection = duckdb.connect(config={"threads": ANALYTICS_THREADS})
+        for name, table in tables.items():
+            connection.register(f"{name}_arrow", table)
+        connection.execute("CREATE TABLE stations AS SELECT * FROM stations_arrow")
+        connection.execute("CREATE TABLE latest AS SELECT * FROM latest_arrow")
+        connection.execute(f"CREATE TABLE daily AS {DAILY_SQL}")
+        for name in tables:
+            connection.unregister(f"{name}_arrow")
+        (watermark,) = connection.execute("SELECT max(updatedAt) FROM stations").fetchone()
+
+        with self._lock:
+            previous, self._connection = self._connection, connection
+            self._readers[connection] = 0
+            self._next_row = tables["stations"].num_rows
+            self._replaced_rows = 0
+            self.watermark = watermark
+            self.loaded_at = datetime.utcnow()
+            # Las consultas en curso terminan sobre la copia anterior; la cierra la última
+            self._release(previous)
+        return {name: table.num_rows for name, table in tables.items()}
+
+    def _update(self) -> Dict[str, int]:
+        tables = load_tables(self.source(self.watermark), first_row=self._next_row)
+        rows = {name: table.num_rows for name, table in tables.items()}
+        if not rows["stations"]:
+            self.loaded_at = datetime.utcnow()
+            return rows
+
+        cursor = self._connection.cursor()
+        try:
+            for name, table in tables.items():
+                cursor.register(f"{name}_arrow", table)
+            cursor.begin()
+            changed = (
+                "SELECT row FROM stations WHERE stationId IN (SELECT stationId FROM stations_arrow)"
+            )
+            replaced = 0
+            for name in ("daily", "latest", "stations"):
+                (deleted,) = cursor.execute(
+                    f"DELETE FROM {name} WHERE row IN ({changed})"
+                ).fetchone()
+                replaced += deleted
+            cursor.execute("INSERT INTO stations SELECT * FROM stations_arrow")
+            cursor.execute("INSERT INTO latest SELECT * FROM latest_arrow")
+            cursor.execute(f"INSERT INTO daily {DAILY_SQL}")
+            (watermark,) = cursor.execute("SELECT max(updatedAt) FROM stations_arrow").fetchone()
+            cursor.commit()
+
+            # Las filas borradas ocupan memoria hasta un checkpoint: compactar cuando
+            # superan la mitad de las vigentes
+            self._replaced_rows += replaced
+            (live,) = cursor.execute(
+                "SELECT (SELECT count(*) FROM daily) + (SELECT count(*) FROM latest)"
+            ).fetchone()
+            if self._replaced_rows > live / 2:
+                cursor.execute("CHECKPOINT")
+                self._replaced_rows = 0
+        finally:
+            cursor.close()
+
+        self._next_row += rows["stations"]
+        if watermark is not None and (self.watermark is None or watermark > self.watermark):
+            self.watermark = watermark
+        self.loaded_at = datetime.utcnow()
+        return rows
+
+    def _release(self, connection: Optional[duckdb.DuckDBPyConnection]) -> None:
+        # Con el lock tomado: cerrar una copia reemplazada cuando ya nadie la lee
+        if (
+            connection is not None
+            and connection is not self._connection
+            and not self._readers.get(connection)
+        ):
+            self._readers.pop(connection, None)
+            connection.close()
+
+    async def run(self, interval: int = ANALYTICS_REFRESH_SECONDS) -> None:
+        """
+        Load the copy now and then refresh it every ``interval`` seconds, forever, without
+        blocking the event loop.
+
+        Args:
+            interval (int): Seconds between refreshes.
+        """
+        while True:
+            try:
+                started = time.perf_counter()
+                rows = await asyncio.to_thread(self.refresh)
+                print(
+                    f"Refreshed analytics copy ({rows['stations']} stations, "
+                    f"{rows['prices']} prices) in {time.perf_counter() - started:.1f}s"
+                )
+            except Exception as e:
+                print(f"Error loading analytics copy: {e}")
+            await asyncio.sleep(interval)
+
+    def _query(self, sql: str, params: list) -> List[tuple]:
+        with self._lock:
+            connection = self._connection
+            self._readers[connection] += 1
+        try:
+            cursor = connection.cursor()
+            try:
+                return cursor.execute(sql, params).fetchall()
+            finally:
+                cursor.close()
+        finally:
+            with self._lock:
+                self._readers[connection] -= 1
+                self._release(connection)
+
+    @staticmethod
+    def _product_conditions(filters: StationFilter) -> Tuple[List[str], list]:
+        conditions, params = [], []
+        if filters.product_id is not None:
+            conditions.append("l.productId = ?")
+            params.append(filters.product_id)
+        if filters.product:
+            conditions.append(_text_condition("coalesce(l.productName, '')"))
+            params.append(filters.product)
+        return conditions, params
+
+    @staticmethod
+    def _documents(rows: List[tuple]) -> List[dict]:
+        # Filas ordenadas por estación: una por producto, con los campos de la estación
+        documents = []
+        current = None
+        for row in rows:
+            station_row, _id, station_id, *fields = row[:12]
+            geometry_type, lon, lat = fields[-3:]
+            product_id, product_name, price, date, price_id = row[12:]
+            if current is None or current[0] != station_row:
+                document = {"_id": ObjectId(_id) if _id else None, "stationId": station_id}
+                document.update(zip(STATION_COLUMNS, fields[:-3]))
+                document["geometry"] = (
+                    {"type": geometry_type, "coordinates": [lon, lat]} if geometry_type else None
+                )
+                document["products"] = []
+                documents.append(document)
+                current = (station_row, document)
+            entry = {"price": price, "date": date}
+            if price_id:
+                entry["_id"] = ObjectId(price_id)
+            current[1]["products"].append(
+                {"productId": product_id, "productName": product_name, "prices": [entry]}
+            )
+        return documents
+
+    def find_last_prices(self, filters: StationFilter, limit: int = 20) -> List[dict]:
+        """Return stations matching the filters with the latest price of each product."""
+        if self._connection is None:
+            return self.primary.find_last_prices(filters, limit)
+
+        conditions, params = [], []
+        if filters.flag_id is not None:
+            conditions.append("s.flagId = ?")
+            params.append(filters.flag_id)
+        for field in ("province", "town", "flag"):
+            value = getattr(filters, field)
+            if value:
+                conditions.append(_text_condition(f"s.{field}"))
+                params.append(value)
+        product_conditions, product_params = self._product_conditions(filters)
+        sql = LAST_PRICES_SQL.format(
+            conditions=" AND ".join((conditions + product_conditions) or ["TRUE"]),
+            product_conditions=" AND ".join(product_conditions or ["TRUE"]),
+        )
+        rows = self._query(sql, params + product_params + [limit] + product_params)
+        return self._documents(rows)
+
+    def find_price_index(
+        self,
+        product_id: int,
+        province: Optional[str],
+        flag: Optional[str],
+        date_from: datetime,
+        date_to: datetime,
+    ) -> List[dict]:
+        """
+        Return the daily price index of a product, computed from the price history.
+
+        Days before the archive watermark come from the primary backend: their prices are
+        no longer in ``stations2``, only in its frozen index.
+        """
+        if self._connection is None:
+            return self.primary.find_price_index(product_id, province, flag, date_from, date_to)
+
+        points = []
+        frozen_before = archive_watermark()
+        if frozen_before is not None and day_of(date_from) < day_of(frozen_before):
+            last_frozen = day_of(frozen_before) - timedelta(days=1)
+            points = self.primary.find_price_index(
+                product_id, province, flag, date_from, min(date_to, last_frozen)
+            )
+            date_from = day_of(frozen_before)
+            if date_from > date_to:
+                return points
+
+        conditions, params = [], []
+        if province:
+            conditions.append("s.provinceKey = ?")
+            params.append(scope_key(province))
+        if flag:
+            conditions.append("s.flagKey = ?")
+            params.append(scope_key(flag))
+        sql = PRICE_INDEX_SQL.format(
+            province="min(s.province)" if province else "NULL",
+            flag="min(s.flag)" if flag else "NULL",
+            conditions=" AND ".join(conditions or ["TRUE"]),
+        )
+        start, end = day_of(date_from), day_of(date_to)
+        rows = self._query(sql, [start, end, product_id, end, start] + params)
+        columns = ("day", "province", "flag", "count", "mean", "median", "min", "max")
+        for row in rows:
+            point = {"productId": product_id, **dict(zip(columns, row))}
+            # Redondeo de Python (al par), igual que el rollup
+            point["mean"], point["median"] = round(point["mean"], 3), round(point["median"], 3)
+            points.append(point)
+        return points
+
+    def find_stations(
+        self, filters: StationFilter, limit: int = 20, window: Optional[HistoryWindow] = None
+    ) -> List[dict]:
+        """Delegate to the primary backend."""
+        return self.primary.find_stations(filters, limit, window)
+
+    def get_station(
+        self, station_id: int, filters: StationFilter, window: Optional[HistoryWindow] = None
+    ) -> Optional[dict]:
+        """Delegate to the primary backend."""
+        return self.primary.get_station(station_id, filters, window)
+
+    def get_station_last_prices(self, station_id: int, filters: StationFilter) -> Optional[dict]:
+        """
+        Delegate to the primary backend: an indexed read of one station costs less there
+        than planning a DuckDB query.
+        """
+        return self.primary.get_station_last_prices(station_id, filters)
+
+    def find_along_route(self, corridor: Corridor, product_id: int) -> List[dict]:
+        """Delegate to the primary backend."""
+        return self.primary.find_along_route(corridor, product_id)
+
+    def iter_catalog(self, since: Optional[datetime] = None) -> Iterable[dict]:
+        """Delegate to the primary backend."""
+        return self.primary.iter_catalog(since)
+
+    def find_changes(
+        self,
+        since: Optional[datetime] = None,
+        after_station_id: Optional[int] = None,
+        limit: int = 500,
+    ) -> List[dict]:
+        """Delegate to the primary backend."""
+        return self.primary.find_changes(since, after_station_id, limit)
+
+    def docs_examined(self, pipeline: List[dict]) -> Optional[int]:
+        """Delegate to the primary backend."""
+        return self.primary.docs_examined(pipeline)
+
+    def cancel(self, comment: str) -> int:
+        """Delegate to the primary backend."""
+        return self.primary.cancel(comment)
@@ -0,0 +1,349 @@
+"""
+archive.py
+
+Cold-storage tier for old price history.
+
+Price observations older than the retention window are moved out of the hot ``stations2``
+collection into zstd-compressed Parquet files partitioned by province and month. History
+queries read them back through a memory-mapped dataset with partition pruning and predicate
+pushdown, and merge them with the hot data before serialization.
+"""
+
+import json
+import os
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+from pyarrow import fs
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from models.filters import HistoryWindow
+
+load_dotenv()
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "365"))
+
+MANIFEST_FILE = "_manifest.json"  # Los archivos con prefijo "_" no forman parte del dataset
+BATCH_ROWS = 100_000
+
+PARTITION_SCHEMA = pa.schema([("province", pa.string()), ("month", pa.string())])
+ARCHIVE_SCHEMA = (
+    pa.schema(
+        [
+            ("stationId", pa.int64()),
+            ("productId", pa.int64()),
+            ("priceId", pa.string()),
+            ("price", pa.float64()),
+            ("date", pa.timestamp("ms")),
+        ]
+    )
+    .append(PARTITION_SCHEMA.field("province"))
+    .append(PARTITION_SCHEMA.field("month"))
+)
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor="hive")
+
+
+def archive_cutoff(days: int = ARCHIVE_AFTER_DAYS, now: Optional[datetime] = None) -> datetime:
+    """
+    Compute the date before which price observations are considered cold.
+
+    Args:
+        days (int): Retention window of the hot collection, in days.
+        now (datetime, optional): Reference time. Defaults to the current UTC time.
+
+    Returns:
+        datetime: The archival cutoff.
+    """
+    return (now or datetime.utcnow()) - timedelta(days=days)
+
+
+def read_manifest(archive_dir: str = ARCHIVE_DIR) -> dict:
+    """
+    Read the archive manifest, which records up to which date prices have been archived.
+
+    Args:
+        archive_dir (str): Root directory of the archive.
+
+    Returns:
+        dict: The manifest contents, or an empty dict if the archive does not exist yet.
+    """
+    try:
+        with open(os.path.join(archive_dir, MANIFEST_FILE), encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return {}
+
+
+def archive_watermark(archive_dir: str = ARCHIVE_DIR) -> Optional[datetime]:
+    """
+    Return the cutoff of the most recent archival run.
+
+    Prices older than this date may live in the archive instead of the hot collection.
+
+    Args:
+        archive_dir (str): Root directory of the archive.
+
+    Returns:
+        datetime | None: The watermark, or None if nothing has been archived.
+    """
+    archived_before = read_manifest(archive_dir).get("archivedBefore")
+    return datetime.fromisoformat(archived_before) if archived_before else None
+
+
+def _write_manifest(archive_dir: str, cutoff: datetime, rows: int) -> None:
+    manifest = read_manifest(archive_dir)
+    previous = manifest.get("archivedBefore")
+    if previous is None or datetime.fromisoformat(previous) < cutoff:
+        manifest["archivedBefore"] = cutoff.isoformat()
+    manifest.setdefault("runs", []).append(
+        {"cutoff": cutoff.isoformat(), "rows": rows, "finishedAt": datetime.utcnow().isoformat()}
+    )
+    tmp_path = os.path.join(archive_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(tmp_path, os.path.join(archive_dir, MANIFEST_FILE))
+
+
+def _export_pipeline(cutoff: datetime) -> list:
+    """
+    Build the aggregation that lists every archivable price observation.
+
+    The most recent price of each product is never archived, so ``/last-prices`` keeps
+    working for stations that stopped reporting.
+    """
+    return [
+        {"$match": {"products.prices.date": {"$lt": cutoff}}},
+        {"$project": {"stationId": 1, "province": 1, "products": 1}},
+        {"$unwind": "$products"},
+        {
+            "$addFields": {
+                "bound": {"$min": [cutoff, {"$max": "$products.prices.date"}]},
+            }
+        },
+        {"$unwind": "$products.prices"},
+        {"$match": {"$expr": {"$lt": ["$products.prices.date", "$bound"]}}},
+        {
+            "$project": {
+                "_id": 0,
+                "stationId": 1,
+                "province": 1,
+                "bound": 1,
+                "productId": "$products.productId",
+                "priceId": {"$toString": "$products.prices._id"},
+                "price": "$products.prices.price",
+                "date": "$products.prices.date",
+            }
+        },
+    ]
+
+
+def _write_batch(rows: List[dict], archive_dir: str, basename: str) -> None:
+    table = pa.Table.from_pylist(rows, schema=ARCHIVE_SCHEMA)
+    ds.write_dataset(
+        table,
+        archive_dir,
+        format="parquet",
+        partitioning=PARTITIONING,
+        basename_template=basename + "-{i}.parquet",
+        existing_data_behavior="overwrite_or_ignore",
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+    )
+
+
+def archive_old_prices(
+    collection,
+    cutoff: datetime,
+    archive_dir: str = ARCHIVE_DIR,
+    dry_run: bool = False,
+) -> int:
+    """
+    Move price observations older than ``cutoff`` from the collection into the archive.
+
+    Rows are streamed from an aggregation cursor and written in batches, so memory use does
+    not depend on the size of the history. Prices are only removed from the hot collection
+    after every batch and the manifest have been written.
+
+    Args:
+        collection: The MongoDB stations collection.
+        cutoff (datetime): Observations strictly older than this date are archived.
+        archive_dir (str): Root directory of the archive.
+        dry_run (bool): If True, only count the archivable observations.
+
+    Returns:
+        int: The number of price observations archived (or archivable, in dry-run mode).
+    """
+    run_id = uuid.uuid4().hex[:12]
+    bounds: Dict[Tuple[int, int], datetime] = {}
+    rows: List[dict] = []
+    total = 0
+    batch_no = 0
+
+    cursor = collection.aggregate(_export_pipeline(cutoff), allowDiskUse=True, batchSize=5000)
+    for row in cursor:
+        bounds[(row["stationId"], row["productId"])] = row.pop("bound")
+        row["month"] = row["date"].strftime("%Y-%m")
+        rows.append(row)
+        total += 1
+        if len(rows) >= BATCH_ROWS:
+            if not dry_run:
+                _write_batch(rows, archive_dir, f"part-{run_id}-{batch_no}")
+            rows = []
+            batch_no += 1
+
+    if dry_run or total == 0:
+        return total
+
+    if rows:
+        _write_batch(rows, archive_dir, f"part-{run_id}-{batch_no}")
+    _write_manifest(archive_dir, cutoff, total)
+    _open_dataset.cache_clear()
+
+    # Quitar del almacenamiento caliente sólo lo que ya quedó escrito en el archivo
+    operations = [
+        UpdateOne(
+            {"stationId": station_id},
+            {"$pull": {"products.$[p].prices": {"date": {"$lt": bound}}}},
+            array_filters=[{"p.productId": product_id}],
+        )
+        for (station_id, product_id), bound in bounds.items()
+    ]
+    for start in range(0, len(operations), 1000):
+        collection.bulk_write(operations[start : start + 1000], ordered=False)
+
+    return total
+
+
+@lru_cache(maxsize=4)
+def _open_dataset(archive_dir: str, manifest_mtime: float) -> ds.Dataset:
+    # manifest_mtime sólo forma parte de la clave de caché: cada corrida invalida el dataset
+    return ds.dataset(
+        os.path.abspath(archive_dir),
+        format="parquet",
+        partitioning=PARTITIONING,
+        filesystem=fs.LocalFileSystem(use_mmap=True),
+    )
+
+
+def read_archived_prices(
+    station_ids: Iterable[int],
+    provinces: Optional[Iterable[str]] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    archive_dir: str = ARCHIVE_DIR,
+) -> Dict[Tuple[int, int], List[dict]]:
+    """
+    Read archived prices for a set of stations.
+
+    Province and month filters prune whole partitions; the station and date filters are
+    pushed down to the Parquet row-group statistics.
+
+    Args:
+        station_ids (Iterable[int]): Stations whose history is requested.
+        provinces (Iterable[str], optional): Provinces of those stations, used for pruning.
+        date_from (datetime, optional): Only return prices on or after this date.
+        date_to (datetime, optional): Only return prices on or before this date.
+        archive_dir (str): Root directory of the archive.
+
+    Returns:
+        dict: Price entries sorted by date, keyed by ``(stationId, productId)``.
+    """
+    station_ids = list(station_ids)
+    manifest_path = os.path.join(archive_dir, MANIFEST_FILE)
+    if not station_ids or not os.path.exists(manifest_path):
+        return {}
+
+    dataset = _open_dataset(archive_dir, os.path.getmtime(manifest_path))
+    expression = ds.field("stationId").isin(station_ids)
+    if provinces is not None:
+        expression &= ds.field("province").isin(list(provinces))
+    if date_from is not None:
+        expression &= ds.field("month") >= date_from.strftime("%Y-%m")
+        expression &= ds.field("date") >= pa.scalar(date_from, type=pa.timestamp("ms"))
+    if date_to is not None:
+        expression &= ds.field("month") <= date_to.strftime("%Y-%m")
+        expression &= ds.field("date") <= pa.scalar(date_to, type=pa.timestamp("ms"))
+
+    table = dataset.to_table(
+        columns=["stationId", "productId", "priceId", "price", "date"], filter=expression
+    ).sort_by([("stationId", "ascending"), ("productId", "ascending"), ("date", "ascending")])
+
+    prices: Dict[Tuple[int, int], List[dict]] = {}
+    seen = set()
+    for row in table.to_pylist():
+        key = (row["stationId"], row["productId"])
+        # Una corrida interrumpida puede haber escrito la misma observación dos veces
+        if (key, row["date"], row["price"]) in seen:
+            continue
+        seen.add((key, row["date"], row["price"]))
+        entry = {"price": row["price"], "date": row["date"]}
+        if row["priceId"] is not None:
+            entry["_id"] = row["priceId"]
+        prices.setdefault(key, []).append(entry)
+    return prices
+
+
+def merge_archived_prices(
+    stations: List[dict],
+    archive_dir: str = ARCHIVE_DIR,
+    window: Optional[HistoryWindow] = None,
+) -> List[dict]:
+    """
+    Prepend archived prices to the ``products.prices`` history of station documents.
+
+    Stations are modified in place. Archived entries that are still in the hot collection
+    (an archival run stopped before removing them) are skipped. The archive is only read
+    if the history window can include archived prices: it starts before the watermark, or
+    it asks for the last ``last_n`` entries and some product has fewer in the hot
+    collection. If nothing has been archived yet, this is a no-op.
+
+    Args:
+        stations (list): Station documents as returned by the database.
+        archive_dir (str): Root directory of the archive.
+        window (HistoryWindow, optional): The window the histories were trimmed to.
+            Defaults to the full history.
+
+    Returns:
+        list: The same station documents, with their history within the window.
+    """
+    watermark = archive_watermark(archive_dir)
+    if not stations or watermark is None:
+        return stations
+
+    window = window or HistoryWindow()
+    if window.date_from is not None and window.date_from >= watermark:
+        return stations
+    if window.last_n is not None and window.date_from is None:
+        # Con suficientes precios recientes, los archivados quedarían fuera del recorte
+        short = any(
+            len(product.get("prices") or []) < window.last_n
+            for station in stations
+            for product in station.get("products", [])
+        )
+        if not short:
+            return stations
+
+    archived = read_archived_prices(
+        {station["stationId"] for station in stations},
+        provinces={station.get("province") for station in stations},
+        date_from=window.date_from,
+        date_to=window.date_to,
+        archive_dir=archive_dir,
+    )
+    if not archived:
+        return stations
+
+    for station in stations:
+        for product in station.get("products", []):
+            older = archived.get((station["stationId"], product["productId"]))
+            if older:
+                # Si el job se interrumpió antes del $pull, lo archivado sigue también en caliente
+                hot = {(price.get("date"), price.get("price")) for price in product["prices"]}
+                older = [price for price in older if (price["date"], price["price"]) not in hot]
+                product["prices"] = window.trim(older + product["prices"])
+    return stations
@@ -0,0 +1,201 @@
+"""
+base.py
+
+Defines the storage-backend interface used by the station route handlers.
+
+Backends return raw station documents (the same shape MongoDB returns); serialization to
+API responses stays in ``schemas.schema`` so every backend produces identical responses.
+"""
+
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from models.filters import HistoryWindow, StationFilter
+from storage.geo import Corridor
+
+
+class StationStore(ABC):
+    """
+    Read access to the station catalog and its price history.
+
+    Every query method mirrors one route in ``routes/route.py`` and must return documents
+    with the same fields, filtering and ordering semantics as the pipelines in
+    ``storage.compiler``.
+    """
+
+    @abstractmethod
+    def find_stations(
+        self, filters: StationFilter, limit: int = 20, window: Optional[HistoryWindow] = None
+    ) -> List[dict]:
+        """
+        Return stations matching the filters, with the price history of each matching
+        product.
+
+        Stations without any matching product are skipped; the limit applies to the
+        stations returned.
+
+        Args:
+            filters (StationFilter): The station filters.
+            limit (int): Maximum number of stations to return.
+            window (HistoryWindow, optional): Part of each history to return (see
+                ``HistoryWindow.trim``). Defaults to the full history.
+
+        Returns:
+            list: Station documents.
+        """
+
+    @abstractmethod
+    def get_station(
+        self, station_id: int, filters: StationFilter, window: Optional[HistoryWindow] = None
+    ) -> Optional[dict]:
+        """
+        Return a single station, keeping only the products that match the filters.
+
+        Args:
+            station_id (int): The unique ID of the station.
+            filters (StationFilter): The product filters (station-level fields are ignored).
+            window (HistoryWindow, optional): Part of each history to return. Defaults to
+                the full history.
+
+        Returns:
+            dict | None: The station document (possibly with no products), or None if the
+            station does not exist.
+        """
+
+    @abstractmethod
+    def find_last_prices(self, filters: StationFilter, limit: int = 20) -> List[dict]:
+        """
+        Return stations matching the filters with only the latest price of each product.
+
+        The latest price is the dated entry with the most recent date. Products without
+        a dated price, and stations left without products, are skipped.
+
+        Args:
+            filters (StationFilter): The station filters.
+            limit (int): Maximum number of stations to return.
+
+        Returns:
+            list: Station documents sorted by station ID.
+        """
+
+    @abstractmethod
+    def get_station_last_prices(self, station_id: int, filters: StationFilter) -> Optional[dict]:
+        """
+        Return a single station with only the latest price of each matching product.
+
+        Args:
+            station_id (int): The unique ID of the station.
+            filters (StationFilter): The product filters (station-level fields are ignored).
+
+        Returns:
+            dict | None: The station document, or None if the station does not exist or
+            has no priced products matching the filters.
+        """
+
+    @abstractmethod
+    def find_along_route(self, corridor: Corridor, product_id: int) -> List[dict]:
+        """
+        Return the stations inside a route corridor that sell a product.
+
+        Args:
+            corridor (Corridor): The route and its width.
+            product_id (int): Only stations with a dated price for this product.
+
+        Returns:
+            list: Station documents with only the latest price of the product, annotated
+            with ``routeKm`` and ``offsetKm`` and sorted by ``routeKm`` (see
+            :meth:`Corridor.place`).
+        """
+
+    @abstractmethod
+    def find_price_index(
+        self,
+        product_id: int,
+        province: Optional[str],
+        flag: Optional[str],
+        date_from: datetime,
+        date_to: datetime,
+    ) -> List[dict]:
+        """
+        Return the daily price index of a product (see ``storage.price_index``).
+
+        Args:
+            product_id (int): The product.
+            province (str, optional): Province name (case and accents are ignored); None
+                for the national index.
+            flag (str, optional): Flag name; None for all flags.
+            date_from (datetime): First day.
+            date_to (datetime): Last day (inclusive).
+
+        Returns:
+            list: Index points sorted by ``day``.
+        """
+
+    @abstractmethod
+    def iter_catalog(self, since: Optional[datetime] = None) -> Iterable[dict]:
+        """
+        Yield every station with the latest price of each product, without the history.
+
+        Used to build and incrementally refresh in-process indexes.
+
+        Args:
+            since (datetime, optional): Only yield stations whose ``updatedAt`` is on or
+                after this date.
+
+        Returns:
+            Iterable[dict]: Station documents including ``updatedAt``.
+        """
+
+    @abstractmethod
+    def find_changes(
+        self,
+        since: Optional[datetime] = None,
+        after_station_id: Optional[int] = None,
+        limit: int = 500,
+    ) -> List[dict]:
+        """
+        Return catalog documents changed after a sync position, ordered by
+        ``(updatedAt, stationId)``.
+
+        Args:
+            since (datetime, optional): ``updatedAt`` of the sync position. If omitted,
+                every station with an ``updatedAt`` is returned (initial sync).
+            after_station_id (int, optional): Station ID of the sync position, used to page
+                through stations sharing the same ``updatedAt``. If omitted, only stations
+                updated strictly after ``since`` are returned.
+            limit (int): Maximum number of stations to return.
+
+        Returns:
+            list: Catalog documents (latest price of each product) including ``updatedAt``.
+        """
+
+    def docs_examined(self, pipeline: List[dict]) -> Optional[int]:
+        """
+        Return how many documents a compiled query examines, for diagnostics.
+
+        Backends that do not run the pipelines of ``storage.compiler`` directly cannot
+        tell, and return None.
+
+        Args:
+            pipeline (list): The compiled pipeline of the query.
+
+        Returns:
+            int | None: The number of documents examined, if known.
+        """
+        return None
+
+    def cancel(self, comment: str) -> int:
+        """
+        Stop the queries a request is still running, after its client disconnected.
+
+        Queries are tagged with the request's ``comment`` (see ``storage.deadline``).
+        Backends without server-side operations have nothing to stop and return 0.
+
+        Args:
+            comment (str): The request's tag.
+
+        Returns:
+            int: Number of operations stopped.
+        """
+        return 0
@@ -0,0 +1,113 @@
+"""
+catalog.py
+
+Keeps in-process indexes in sync with the station catalog.
+
+A single refresher polls the storage backend for stations whose ``updatedAt`` moved past
+the last seen value and feeds them to every registered index, so each index is built once
+at startup and then maintained incrementally. A deleted station never shows up in that
+delta, so every ``CATALOG_FULL_REFRESH_SECONDS`` the refresher scans the whole catalog and
+removes the stations it no longer contains.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional, Set
+
+from dotenv import load_dotenv
+
+from storage.base import StationStore
+
+load_dotenv()
+
+CATALOG_REFRESH_SECONDS = int(os.getenv("CATALOG_REFRESH_SECONDS", "60"))
+CATALOG_FULL_REFRESH_SECONDS = int(os.getenv("CATALOG_FULL_REFRESH_SECONDS", "3600"))
+
+
+class CatalogRefresher:
+    """
+    Incrementally refreshes in-process indexes from a storage backend.
+
+    Registered indexes must implement ``upsert(station: dict)``; they receive catalog
+    documents as yielded by :meth:`StationStore.iter_catalog`. Indexes that also implement
+    ``remove_station(station_id: int)`` are told about stations deleted from the catalog.
+
+    Attributes:
+        store (StationStore): The backend to poll.
+        indexes (list): The indexes kept in sync.
+        watermark (datetime | None): Highest ``updatedAt`` seen so far.
+        full_every (int): Seconds between full scans; 0 scans only at startup.
+    """
+
+    def __init__(
+        self,
+        store: StationStore,
+        indexes: Optional[List] = None,
+        full_every: int = CATALOG_FULL_REFRESH_SECONDS,
+    ):
+        self.store = store
+        self.indexes = list(indexes or [])
+        self.watermark: Optional[datetime] = None
+        self.full_every = full_every
+        self._lock = threading.Lock()
+        self._known: Set[int] = set()
+        self._next_full = 0.0
+
+    def refresh(self, full: Optional[bool] = None) -> int:
+        """
+        Pull stations changed since the watermark and apply them to every index.
+
+        The lookup is inclusive, so stations sharing the watermark timestamp are applied
+        again; upserts are idempotent. A full scan applies every station and then removes
+        from the indexes those that are no longer in the catalog.
+
+        Args:
+            full (bool, optional): Force (True) or skip (False) a full scan; by default one
+                runs at startup and then every ``full_every`` seconds.
+
+        Returns:
+            int: Number of stations applied.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if full is None:
+                full = self.watermark is None or (self.full_every > 0 and now >= self._next_full)
+            count = 0
+            watermark = self.watermark
+            seen = set()
+            for station in self.store.iter_catalog(since=None if full else self.watermark):
+                for index in self.indexes:
+                    index.upsert(station)
+                updated_at = station.get("updatedAt")
+                if updated_at is not None and (watermark is None or updated_at > watermark):
+                    watermark = updated_at
+                seen.add(station["stationId"])
+                count += 1
+            if full:
+                for station_id in self._known - seen:
+                    for index in self.indexes:
+                        if hasattr(index, "remove_station"):
+                            index.remove_station(station_id)
+                self._known = seen
+                self._next_full = now + self.full_every
+            else:
+                self._known |= seen
+            self.watermark = watermark
+            return count
+
+    async def run(self, interval: int = CATALOG_REFRESH_SECONDS) -> None:
+        """
+        Refresh every ``interval`` seconds, forever, without blocking the event loop.
+
+        Args:
+            interval (int): Seconds between refreshes.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                print(f"Error refreshing station catalog: {e}")
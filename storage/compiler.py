@@ -0,0 +1,389 @@
+"""
+compiler.py
+
+Compiles station filters into MongoDB aggregation pipelines.
+
+Every station route used to hand-build its own pipeline. They all follow the same shape
+now:
+
+    1. ``$match`` first, on indexed fields, including an ``$elemMatch`` on ``products`` so
+       stations without a matching product never leave the index scan;
+    2. ``$sort``/``$limit`` as soon as the result set is known;
+    3. a single ``$project`` that filters products and reduces price histories in place
+       (no ``$unwind``/``$group`` round trip).
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from models.filters import HistoryWindow, StationFilter
+
+STATION_FIELDS = (
+    "stationId",
+    "stationName",
+    "address",
+    "town",
+    "province",
+    "flag",
+    "flagId",
+    "geometry",
+)
+ALL_PRODUCTS = {"$ifNull": ["$products", []]}
+
+
+def _regex(pattern: str) -> dict:
+    return {"$regex": pattern, "$options": "i"}
+
+
+def match_stage(filters: StationFilter, priced: bool = False) -> dict:
+    """
+    Build the ``$match`` document for a set of filters.
+
+    Args:
+        filters (StationFilter): The station filters.
+        priced (bool): If True, only match stations where some matching product has at
+            least one dated price.
+
+    Returns:
+        dict: The match document.
+    """
+    match = {}
+    # Igualdades primero: son las que acotan los índices (flagId, products.productId)
+    if filters.flag_id is not None:
+        match["flagId"] = filters.flag_id
+    if filters.province:
+        match["province"] = _regex(filters.province)
+    if filters.town:
+        match["town"] = _regex(filters.town)
+    if filters.flag:
+        match["flag"] = _regex(filters.flag)
+
+    product = {}
+    if filters.product_id is not None:
+        product["productId"] = filters.product_id
+    if filters.product:
+        product["productName"] = _regex(filters.product)
+    if priced:
+        product["prices"] = {"$elemMatch": {"date": {"$type": "date"}}}
+
+    if product:
+        match["products"] = {"$elemMatch": product}
+    else:
+        match["products.0"] = {"$exists": True}
+    return match
+
+
+def filtered_products(filters: StationFilter) -> dict:
+    """
+    Build the expression that keeps only the products matching the filters.
+
+    Args:
+        filters (StationFilter): The station filters.
+
+    Returns:
+        dict: An aggregation expression evaluating to the list of products.
+    """
+    conditions = []
+    if filters.product_id is not None:
+        conditions.append({"$eq": ["$$product.productId", filters.product_id]})
+    if filters.product:
+        conditions.append(
+            {
+                "$regexMatch": {
+                    "input": {"$ifNull": ["$$product.productName", ""]},
+                    "regex": filters.product,
+                    "options": "i",
+                }
+            }
+        )
+    if not conditions:
+        return ALL_PRODUCTS
+    return {"$filter": {"input": ALL_PRODUCTS, "as": "product", "cond": {"$and": conditions}}}
+
+
+def latest_price(prices) -> dict:
+    """
+    Build the expression returning the most recent dated price of a history.
+
+    A single ``$reduce`` pass finds the maximum date without sorting the array; among
+    equal dates the last recorded entry wins.
+
+    Args:
+        prices: Expression evaluating to a list of ``Price`` entries.
+
+    Returns:
+        dict: An expression evaluating to a price entry, or null if none is dated.
+    """
+    return {
+        "$reduce": {
+            "input": {
+                "$filter": {
+                    "input": {"$ifNull": [prices, []]},
+                    "as": "price",
+                    "cond": {"$gt": ["$$price.date", None]},
+                }
+            },
+            "initialValue": None,
+            "in": {
+                "$cond": [
+                    {
+                        "$or": [
+                            {"$eq": ["$$value", None]},
+                            {"$gte": ["$$this.date", "$$value.date"]},
+                        ]
+                    },
+                    "$$this",
+                    "$$value",
+                ]
+            },
+        }
+    }
+
+
+def latest_products(products, drop_unpriced: bool = True) -> dict:
+    """
+    Build the expression that replaces each product's history with its latest price.
+
+    Args:
+        products: Expression evaluating to a list of products.
+        drop_unpriced (bool): If True, products without any dated price are removed.
+
+    Returns:
+        dict: An expression evaluating to products with ``prices`` holding at most one
+        entry.
+    """
+    mapped = {
+        "$map": {
+            "input": products,
+            "as": "product",
+            "in": {
+                "$let": {
+                    "vars": {"latest": latest_price("$$product.prices")},
+                    "in": {
+                        "productId": "$$product.productId",
+                        "productName": "$$product.productName",
+                        "prices": {
+                            "$cond": [{"$eq": ["$$latest", None]}, [], ["$$latest"]],
+                        },
+                    },
+                }
+            },
+        }
+    }
+    if not drop_unpriced:
+        return mapped
+    return {
+        "$filter": {
+            "input": mapped,
+            "as": "product",
+            "cond": {"$gt": [{"$size": "$$product.prices"}, 0]},
+        }
+    }
+
+
+def windowed_products(products, window: Optional[HistoryWindow]) -> dict:
+    """
+    Build the expression that trims each product's history to a window.
+
+    Entries are filtered by date with ``$filter`` and then cut to the most recent
+    ``last_n`` with ``$slice``, so the rest of the history never leaves the server.
+
+    Args:
+        products: Expression evaluating to a list of products.
+        window (HistoryWindow, optional): The window; None keeps the full history.
+
+    Returns:
+        dict: An expression evaluating to the products with trimmed ``prices``.
+    """
+    if window is None or window == HistoryWindow():
+        return products
+
+    prices = {"$ifNull": ["$$product.prices", []]}
+    bounds = []
+    if window.date_from is not None:
+        bounds.append({"$gte": ["$$price.date", window.date_from]})
+    if window.date_to is not None:
+        bounds.append({"$lte": ["$$price.date", window.date_to]})
+    if bounds:
+        # Los precios sin fecha quedan fuera de cualquier rango
+        bounds.append({"$gt": ["$$price.date", None]})
+        prices = {"$filter": {"input": prices, "as": "price", "cond": {"$and": bounds}}}
+    if window.last_n is not None:
+        prices = {"$slice": [prices, -window.last_n]} if window.last_n > 0 else []
+    return {
+        "$map": {
+            "input": products,
+            "as": "product",
+            "in": {"$mergeObjects": ["$$product", {"prices": prices}]},
+        }
+    }
+
+
+def _project(products, *extra_fields: str) -> dict:
+    projection = {field: 1 for field in STATION_FIELDS + extra_fields}
+    projection["products"] = products
+    return {"$project": projection}
+
+
+def compile_stations(
+    filters: StationFilter, limit: int, window: Optional[HistoryWindow] = None
+) -> List[dict]:
+    """
+    Compile the ``/stations`` query: stations with their price history.
+
+    Args:
+        filters (StationFilter): The station filters.
+        limit (int): Maximum number of stations.
+        window (HistoryWindow, optional): Part of the history to return. Defaults to all.
+
+    Returns:
+        list: The aggregation pipeline.
+    """
+    return [
+        {"$match": match_stage(filters)},
+        {"$limit": limit},
+        _project(windowed_products(filtered_products(filters), window)),
+    ]
+
+
+def compile_station(
+    station_id: int, filters: StationFilter, window: Optional[HistoryWindow] = None
+) -> List[dict]:
+    """
+    Compile the ``/stations/{station_id}`` query.
+
+    The station is returned even if none of its products match, so a miss needs no second
+    round trip to tell "unknown station" from "no matching products".
+
+    Args:
+        station_id (int): The unique ID of the station.
+        filters (StationFilter): The product filters (station-level fields are ignored).
+        window (HistoryWindow, optional): Part of the history to return. Defaults to all.
+
+    Returns:
+        list: The aggregation pipeline.
+    """
+    return [
+        {"$match": {"stationId": station_id}},
+        {"$limit": 1},
+        _project(windowed_products(filtered_products(filters), window)),
+    ]
+
+
+def compile_last_prices(filters: StationFilter, limit: int) -> List[dict]:
+    """
+    Compile the ``/last-prices`` query: stations with the latest price of each product.
+
+    Args:
+        filters (StationFilter): The station filters.
+        limit (int): Maximum number of stations.
+
+    Returns:
+        list: The aggregation pipeline, sorted by station ID.
+    """
+    return [
+        {"$match": match_stage(filters, priced=True)},
+        {"$sort": {"stationId": 1}},
+        {"$limit": limit},
+        _project(latest_products(filtered_products(filters))),
+    ]
+
+
+def compile_station_last_prices(station_id: int, filters: StationFilter) -> List[dict]:
+    """
+    Compile the ``/last-prices/{station_id}`` query.
+
+    Args:
+        station_id (int): The unique ID of the station.
+        filters (StationFilter): The product filters (station-level fields are ignored).
+
+    Returns:
+        list: The aggregation pipeline.
+    """
+    return [
+        {"$match": {"stationId": station_id}},
+        {"$limit": 1},
+        _project(latest_products(filtered_products(filters))),
+    ]
+
+
+def compile_along_route(corridor, product_id: int) -> List[dict]:
+    """
+    Compile the route-corridor query: stations inside the corridor selling a product,
+    with its latest price.
+
+    Each buffered segment is a separate ``$geoWithin`` clause of an ``$or``, so every clause
+    is served by the ``2dsphere`` index on ``geometry`` and no single polygon has to be a
+    valid (non self-intersecting) shape for long, winding routes.
+
+    Args:
+        corridor (Corridor): The corridor (see ``storage.geo``).
+        product_id (int): Only stations with a dated price for this product.
+
+    Returns:
+        list: The aggregation pipeline. Results are unordered; ``Corridor.place`` sorts them
+        along the route.
+    """
+    filters = StationFilter(product_id=product_id)
+    match = match_stage(filters, priced=True)
+    match["$or"] = [
+        {"geometry": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [ring]}}}}
+        for ring in corridor.polygons()
+    ]
+    return [
+        {"$match": match},
+        _project(latest_products(filtered_products(filters))),
+    ]
+
+
+def compile_catalog(since: Optional[datetime] = None) -> List[dict]:
+    """
+    Compile the catalog scan used to build in-process indexes.
+
+    Args:
+        since (datetime, optional): Only include stations updated on or after this date.
+
+    Returns:
+        list: The aggregation pipeline.
+    """
+    pipeline = []
+    if since is not None:
+        pipeline.append({"$match": {"updatedAt": {"$gte": since}}})
+    pipeline.append(_project(latest_products(ALL_PRODUCTS, drop_unpriced=False), "updatedAt"))
+    return pipeline
+
+
+def compile_changes(
+    since: Optional[datetime], after_station_id: Optional[int], limit: int
+) -> List[dict]:
+    """
+    Compile the delta-sync query: catalog documents after a ``(updatedAt, stationId)``
+    position.
+
+    The range on ``updatedAt`` is served by the ``(updatedAt, stationId)`` index, which also
+    provides the order; the ``$or`` only breaks ties between stations sharing a timestamp.
+
+    Args:
+        since (datetime, optional): ``updatedAt`` of the sync position.
+        after_station_id (int, optional): Station ID of the sync position.
+        limit (int): Maximum number of stations.
+
+    Returns:
+        list: The aggregation pipeline.
+    """
+    if since is None:
+        match = {"updatedAt": {"$type": "date"}}
+    elif after_station_id is None:
+        match = {"updatedAt": {"$gt": since}}
+    else:
+        match = {
+            "updatedAt": {"$gte": since},
+            "$or": [{"updatedAt": {"$gt": since}}, {"stationId": {"$gt": after_station_id}}],
+        }
+
+    return [
+        {"$match": match},
+        {"$sort": {"updatedAt": 1, "stationId": 1}},
+        {"$limit": limit},
+        _project(latest_products(ALL_PRODUCTS, drop_unpriced=False), "updatedAt"),
+    ]
@@ -0,0 +1,194 @@
+"""
+deadline.py
+
+Per-request deadlines for database queries, and server-side cancellation when the client
+goes away.
+
+The query budget of a request comes from the ``X-Request-Timeout-Ms`` header or, if it is
+absent, from the route's default in ``ROUTE_TIMEOUTS_MS``; either way it is capped at
+``QUERY_MAX_TIME_MS``. :func:`run_query` runs a backend call off the event loop with that
+deadline in its context: the MongoDB backend sends the remaining budget as ``maxTimeMS``
+and tags its commands with a per-request ``comment``. While the call runs the request is
+polled for a disconnect; if the client is gone, the tagged operations are killed on the
+server instead of running to completion. Behind ``ResilientStore`` the request waits on a
+shared call with its own tag, which the wrapper kills once no request waits for it.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from dotenv import load_dotenv
+from pymongo.errors import ExecutionTimeout
+from starlette.requests import Request
+
+load_dotenv()
+
+QUERY_MAX_TIME_MS = 30000  # 30 segundos de tiempo máximo
+DEADLINE_HEADER = "x-request-timeout-ms"
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.1"))
+
+# Presupuesto por defecto de cada consulta de las rutas, en milisegundos
+ROUTE_TIMEOUTS_MS = {
+    "find_stations": 10000,
+    "get_station": 5000,
+    "find_last_prices": 10000,
+    "get_station_last_prices": 5000,
+    "find_changes": 20000,
+    "find_along_route": 15000,
+    "find_price_index": 5000,
+}
+
+_deadline: contextvars.ContextVar[Optional["Deadline"]] = contextvars.ContextVar(
+    "deadline", default=None
+)
+
+
+class DeadlineExceeded(ExecutionTimeout):
+    """Raised before running a query whose request has no time left."""
+
+
+class ClientDisconnected(Exception):
+    """Raised by :func:`run_query` when the client disconnected while the query ran."""
+
+
+class Deadline:
+    """
+    Deadline and server-side tag of the queries of one request.
+
+    Attributes:
+        timeout_ms (float): The request's query budget.
+        expires_at (float): ``time.monotonic()`` value at which the budget runs out.
+        comment (str): Tag sent as the ``comment`` of every command of the request.
+    """
+
+    def __init__(self, timeout_ms: float):
+        self.timeout_ms = timeout_ms
+        self.expires_at = time.monotonic() + timeout_ms / 1000
+        self.comment = f"req-{uuid.uuid4().hex}"
+
+    def remaining_ms(self) -> float:
+        """Milliseconds left before the deadline (negative once it has passed)."""
+        return (self.expires_at - time.monotonic()) * 1000
+
+
+@contextmanager
+def use_deadline(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """
+    Make a deadline the current one for the queries run inside the block.
+
+    Args:
+        deadline (Deadline, optional): The deadline; None restores the default budget.
+
+    Yields:
+        Deadline | None: The same deadline.
+    """
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def max_time_ms() -> int:
+    """
+    Return the ``maxTimeMS`` for a query about to be sent.
+
+    Returns:
+        int: The remaining budget of the current request, or ``QUERY_MAX_TIME_MS`` outside
+        of a request.
+
+    Raises:
+        DeadlineExceeded: If the current request has no time left.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return QUERY_MAX_TIME_MS
+    remaining = int(deadline.remaining_ms())
+    if remaining <= 0:
+        raise DeadlineExceeded(
+            f"Tiempo límite de la consulta agotado ({deadline.timeout_ms:.0f} ms)"
+        )
+    return min(remaining, QUERY_MAX_TIME_MS)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Return the deadline of the current request, if any."""
+    return _deadline.get()
+
+
+def query_comment() -> Optional[str]:
+    """Return the tag of the current request's commands, if any."""
+    deadline = _deadline.get()
+    return deadline.comment if deadline is not None else None
+
+
+def request_timeout_ms(request: Request, method: str) -> float:
+    """
+    Compute the query budget of a request.
+
+    Args:
+        request (Request): The incoming request.
+        method (str): The backend method the route calls (a key of ``ROUTE_TIMEOUTS_MS``).
+
+    Returns:
+        float: The header's value if it is a positive number, else the route's default;
+        never more than ``QUERY_MAX_TIME_MS``.
+    """
+    timeout_ms = ROUTE_TIMEOUTS_MS.get(method, QUERY_MAX_TIME_MS)
+    header = request.headers.get(DEADLINE_HEADER)
+    if header:
+        try:
+            requested = float(header)
+        except ValueError:
+            requested = 0
+        if requested > 0:
+            timeout_ms = requested
+    return min(timeout_ms, QUERY_MAX_TIME_MS)
+
+
+def _invoke(deadline: Deadline, store, method: str, args: tuple) -> Any:
+    with use_deadline(deadline):
+        return getattr(store, method)(*args)
+
+
+async def run_query(request: Request, store, method: str, *args) -> Any:
+    """
+    Run a backend query for a request, bounded by its deadline and cancelled if the
+    client disconnects.
+
+    The query runs on a worker thread, so the event loop keeps serving other requests.
+
+    Args:
+        request (Request): The incoming request.
+        store (StationStore): The storage backend.
+        method (str): Name of the backend method.
+        *args: Positional arguments of the call.
+
+    Returns:
+        The result of the backend method.
+
+    Raises:
+        ClientDisconnected: If the client went away before the query finished; its
+            database operations have been killed.
+    """
+    deadline = Deadline(request_timeout_ms(request, method))
+    # Copia del contexto: el hilo ve el estado de la petición (p. ej. respuestas stale)
+    context = contextvars.copy_context()
+    future = asyncio.get_running_loop().run_in_executor(
+        None, functools.partial(context.run, _invoke, deadline, store, method, args)
+    )
+    while True:
+        done, _ = await asyncio.wait({future}, timeout=DISCONNECT_POLL_SECONDS)
+        if done:
+            return future.result()
+        if await request.is_disconnected():
+            await asyncio.to_thread(store.cancel, deadline.comment)
+            # La llamada termina sola (con error) al matarse la operación: nadie la espera
+            future.add_done_callback(lambda finished: finished.exception())
+            raise ClientDisconnected(f"Cliente desconectado durante {method}")
@@ -0,0 +1,313 @@
+"""
+facets.py
+
+In-process facet counts (stations per province, town, flag and product) for filter UIs.
+
+Every station gets a slot, and every facet value keeps the set of slots holding it as a
+bitmask (a Python int), so a filter is the AND of a few masks and the count of a facet
+value is the popcount of its mask ANDed with the filter: the cost depends on the number
+of distinct values, not on how many stations match. Minimum prices come from per-product
+lists of latest prices kept sorted, scanned from the cheapest until every counted value
+has its minimum, or, when few stations count, from those stations alone. The masks are
+maintained incrementally by the catalog refresher, and the facets of each filter
+combination are built once and reused until a station changes.
+"""
+
+import heapq
+import os
+import re
+import threading
+import uuid
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from models.filters import StationFilter
+
+load_dotenv()
+
+FACETS_CACHE_ENTRIES = int(os.getenv("FACETS_CACHE_ENTRIES", "1000"))
+
+FACET_FIELDS = ("province", "town", "flag")
+# Costo relativo de revisar una estación frente a avanzar un precio en la lista ordenada
+MEMBER_SCAN_COST = 4
+
+ProductKey = Tuple[Optional[int], Optional[str]]
+
+
+def _bits(mask: int, size: int) -> bytes:
+    # Probar un bit de un entero grande lo recorre entero; en bytes es O(1)
+    return mask.to_bytes((size + 7) // 8 or 1, "little")
+
+
+def _has(bits: bytes, slot: int) -> bool:
+    return bool(bits[slot >> 3] >> (slot & 7) & 1)
+
+
+def _members(mask: int, size: int) -> Iterable[int]:
+    for position, byte in enumerate(_bits(mask, size)):
+        while byte:
+            low = byte & -byte
+            yield (position << 3) + low.bit_length() - 1
+            byte ^= low
+
+
+class FacetIndex:
+    """
+    Bitmask index of the station catalog for facet counts.
+
+    The index is safe to query while it is being refreshed from another thread.
+
+    Attributes:
+        epoch (str): Identifies this process' index, so versions are not confused across
+            restarts.
+        version (int): Incremented whenever a station's facet values or prices change.
+    """
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._lock = threading.Lock()
+        self._slots: Dict[int, int] = {}
+        self._entries: Dict[int, dict] = {}
+        # _masks[campo][valor] -> bits de las estaciones con ese valor
+        self._masks: Dict[str, Dict[object, int]] = {
+            field: {} for field in FACET_FIELDS + ("flagId",)
+        }
+        self._product_masks: Dict[ProductKey, int] = {}
+        # Últimos precios de cada producto como (precio, slot), de menor a mayor
+        self._prices: Dict[ProductKey, List[Tuple[float, int]]] = {}
+        self._responses: Dict[tuple, dict] = {}
+
+    @staticmethod
+    def _entry(station: dict) -> dict:
+        products = {}
+        for item in station.get("products") or []:
+            prices = item.get("prices") or []
+            price = prices[-1].get("price") if prices else None
+            products[(item.get("productId"), item.get("productName"))] = price
+        entry = {field: station.get(field) for field in FACET_FIELDS + ("flagId",)}
+        entry["products"] = products
+        return entry
+
+    def upsert(self, station: dict) -> None:
+        """
+        Add a station to the index or replace its previous entry.
+
+        Args:
+            station (dict): A catalog document (with the latest price of each product).
+        """
+        entry = self._entry(station)
+        with self._lock:
+            slot = self._slots.get(station["stationId"])
+            if slot is None:
+                slot = self._slots[station["stationId"]] = len(self._slots)
+            elif self._entries[slot] == entry:
+                # El refresco reaplica estaciones sin cambios: no invalidar la caché
+                return
+            else:
+                self._place(slot, self._entries[slot], add=False)
+            self._entries[slot] = entry
+            self._place(slot, entry, add=True)
+            self.version += 1
+            self._responses.clear()
+
+    def remove_station(self, station_id: int) -> None:
+        """
+        Remove a deleted station from the counts, if present.
+
+        The station keeps its slot with no facet values and no products, which every
+        facet already ignores.
+
+        Args:
+            station_id (int): The unique ID of the station.
+        """
+        if station_id in self._slots:
+            self.upsert({"stationId": station_id})
+
+    @staticmethod
+    def _toggle(masks: Dict, key, bit: int, add: bool) -> None:
+        if add:
+            masks[key] = masks.get(key, 0) | bit
+        else:
+            remaining = masks.get(key, 0) & ~bit
+            if remaining:
+                masks[key] = remaining
+            else:
+                masks.pop(key, None)
+
+    def _place(self, slot: int, entry: dict, add: bool) -> None:
+        bit = 1 << slot
+        for field, masks in self._masks.items():
+            self._toggle(masks, entry[field], bit, add)
+        for key, price in entry["products"].items():
+            self._toggle(self._product_masks, key, bit, add)
+            if price is None:
+                continue
+            prices = self._prices.setdefault(key, [])
+            if add:
+                insort(prices, (price, slot))
+            else:
+                del prices[bisect_left(prices, (price, slot))]
+
+    def facets(self, filters: StationFilter) -> Tuple[dict, str]:
+        """
+        Return the facet counts for a set of station filters and a version tag for HTTP
+        caching.
+
+        Filters mean the same as in ``/stations``: text filters are case-insensitive
+        regular expressions and the product filters must hold for the same product.
+
+        Args:
+            filters (StationFilter): The station filters.
+
+        Returns:
+            tuple: The facets (see ``models.facets.StationFacets``) and a version string
+            that changes whenever any count may have changed.
+
+        Raises:
+            re.error: If a text filter is not a valid regular expression.
+        """
+        key = tuple(filters.model_dump().values())
+        with self._lock:
+            if key not in self._responses:
+                if len(self._responses) >= FACETS_CACHE_ENTRIES:
+                    del self._responses[next(iter(self._responses))]
+                self._responses[key] = self._build(filters)
+            return self._responses[key], f"{self.epoch}-{self.version}"
+
+    def _product_keys(self, filters: StationFilter) -> List[ProductKey]:
+        regex = re.compile(filters.product, re.IGNORECASE) if filters.product else None
+        return [
+            (product_id, name)
+            for product_id, name in self._product_masks
+            if (filters.product_id is None or product_id == filters.product_id)
+            and (regex is None or regex.search(name or ""))
+        ]
+
+    def _build(self, filters: StationFilter) -> dict:
+        everyone = (1 << len(self._slots)) - 1
+        # Máscara de cada filtro de estación presente
+        conditions: Dict[str, int] = {}
+        for field in FACET_FIELDS:
+            pattern = getattr(filters, field)
+            if pattern:
+                regex = re.compile(pattern, re.IGNORECASE)
+                mask = 0
+                for value, value_mask in self._masks[field].items():
+                    if value is not None and regex.search(value):
+                        mask |= value_mask
+                conditions[field] = mask
+        if filters.flag_id is not None:
+            conditions["flagId"] = self._masks["flagId"].get(filters.flag_id, 0)
+
+        # Sin filtro de producto, /stations igual exige al menos un producto
+        product_keys = self._product_keys(filters)
+        with_products = 0
+        for product_key in product_keys:
+            with_products |= self._product_masks[product_key]
+
+        def matching(*ignored: str) -> int:
+            mask = everyone
+            for field, condition in conditions.items():
+                if field not in ignored:
+                    mask &= condition
+            return mask
+
+        station_masks = {
+            "province": matching("province") & with_products,
+            "town": matching("town") & with_products,
+            "flag": matching("flag", "flagId") & with_products,
+        }
+        facets = {"total": (matching() & with_products).bit_count()}
+        for field, mask in station_masks.items():
+            counts = {}
+            for value, value_mask in self._masks[field].items():
+                count = (value_mask & mask).bit_count() if value is not None else 0
+                if count:
+                    counts[value] = count
+            facets[field] = counts
+
+        mins: Dict[str, Dict[object, float]] = {field: {} for field in FACET_FIELDS}
+        if filters.filters_products:
+            self._station_minimums(product_keys, station_masks, facets, mins)
+        for field in FACET_FIELDS:
+            facets[field] = [
+                {"value": value, "count": count, "minPrice": mins[field].get(value)}
+                for value, count in sorted(facets[field].items(), key=lambda i: (-i[1], i[0]))
+            ]
+        facets["product"] = self._product_facet(matching())
+        return facets
+
+    def _merged_prices(self, product_keys: Iterable[ProductKey]):
+        return heapq.merge(*(self._prices.get(key, []) for key in product_keys))
+
+    def _station_minimums(
+        self,
+        product_keys: List[ProductKey],
+        station_masks: Dict[str, int],
+        counts: Dict[str, Dict[object, int]],
+        mins: Dict[str, Dict[object, float]],
+    ) -> None:
+        scan_length = sum(len(self._prices.get(key, ())) for key in product_keys)
+        for field, mask in station_masks.items():
+            field_counts, field_mins = counts[field], mins[field]
+            if mask.bit_count() * MEMBER_SCAN_COST >= scan_length:
+                # De menor a mayor precio, el primero de cada valor es su mínimo y el
+                # recorrido termina apenas aparecen todos
+                bits = _bits(mask, len(self._slots))
+                for price, slot in self._merged_prices(product_keys):
+                    value = self._entries[slot][field]
+                    if value in field_counts and value not in field_mins and _has(bits, slot):
+                        field_mins[value] = price
+                        if len(field_mins) == len(field_counts):
+                            break
+                continue
+
+            # Pocas estaciones frente a la lista de precios: recorrer sólo esas
+            wanted = set(product_keys)
+            for slot in _members(mask, len(self._slots)):
+                entry = self._entries[slot]
+                prices = [
+                    price
+                    for key, price in entry["products"].items()
+                    if price is not None and key in wanted
+                ]
+                if prices:
+                    value, price = entry[field], min(prices)
+                    if value is not None and price < field_mins.get(value, price + 1):
+                        field_mins[value] = price
+
+    def _product_facet(self, mask: int) -> List[dict]:
+        by_product: Dict[int, List[ProductKey]] = {}
+        for product_id, name in self._product_masks:
+            if product_id is not None:
+                by_product.setdefault(product_id, []).append((product_id, name))
+
+        bits = _bits(mask, len(self._slots))
+        facet = []
+        for product_id, keys in by_product.items():
+            product_mask = 0
+            for product_key in keys:
+                product_mask |= self._product_masks[product_key]
+            count = (product_mask & mask).bit_count()
+            if not count:
+                continue
+            min_price = None
+            for price, slot in self._merged_prices(keys):
+                if _has(bits, slot):
+                    min_price = price
+                    break
+            # El nombre más usado, si un mismo producto aparece con varios
+            name = max(keys, key=lambda k: self._product_masks[k].bit_count())[1]
+            facet.append(
+                {
+                    "productId": product_id,
+                    "productName": name,
+                    "count": count,
+                    "minPrice": min_price,
+                }
+            )
+        facet.sort(key=lambda item: (-item["count"], item["productId"]))
+        return facet
@@ -0,0 +1,321 @@
+"""
+geo.py
+
+Geographic helpers shared by the spatial features of the API (map tiles, route corridors).
+
+Tiles follow the Web Mercator "slippy map" scheme used by OpenStreetMap and most map
+clients: zoom ``z`` splits the world into ``2**z x 2**z`` tiles, ``x`` grows eastwards and
+``y`` grows southwards.
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+MAX_LATITUDE = 85.05112878  # Límite de la proyección Web Mercator
+EARTH_RADIUS_KM = 6371.0088
+MAX_CORRIDOR_SEGMENTS = 200
+
+LonLat = Sequence[float]
+
+
+def tile_coordinates(lon: float, lat: float, zoom: int) -> Tuple[float, float]:
+    """
+    Project a longitude/latitude pair to fractional tile coordinates.
+
+    Args:
+        lon (float): Longitude in degrees.
+        lat (float): Latitude in degrees.
+        zoom (int): Zoom level.
+
+    Returns:
+        tuple: ``(x, y)`` tile coordinates; the integer parts identify the tile.
+    """
+    lat = max(min(lat, MAX_LATITUDE), -MAX_LATITUDE)
+    scale = 2**zoom
+    x = (lon + 180.0) / 360.0 * scale
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * scale
+    return x, y
+
+
+def tile_for(lon: float, lat: float, zoom: int) -> Tuple[int, int]:
+    """
+    Return the tile containing a point.
+
+    Args:
+        lon (float): Longitude in degrees.
+        lat (float): Latitude in degrees.
+        zoom (int): Zoom level.
+
+    Returns:
+        tuple: ``(x, y)`` integer tile indexes, clamped to the valid range.
+    """
+    x, y = tile_coordinates(lon, lat, zoom)
+    last = 2**zoom - 1
+    return min(max(int(x), 0), last), min(max(int(y), 0), last)
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """
+    Return the bounding box of a tile.
+
+    Args:
+        zoom (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row.
+
+    Returns:
+        tuple: ``(west, south, east, north)`` in degrees.
+    """
+    scale = 2**zoom
+
+    def latitude(row: float) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / scale))))
+
+    return x / scale * 360.0 - 180.0, latitude(y + 1), (x + 1) / scale * 360.0 - 180.0, latitude(y)
+
+
+def _to_plane(lon: float, lat: float, reference_lat: float) -> Tuple[float, float]:
+    # Proyección equirectangular local, en km; precisa para tramos de hasta ~100 km
+    scale = math.radians(EARTH_RADIUS_KM)
+    return lon * scale * math.cos(math.radians(reference_lat)), lat * scale
+
+
+def _from_plane(x: float, y: float, reference_lat: float) -> Tuple[float, float]:
+    scale = math.radians(EARTH_RADIUS_KM)
+    return x / (scale * math.cos(math.radians(reference_lat))), y / scale
+
+
+def distance_km(a: LonLat, b: LonLat) -> float:
+    """
+    Great-circle (haversine) distance between two points.
+
+    Args:
+        a (sequence): ``[lon, lat]`` of the first point.
+        b (sequence): ``[lon, lat]`` of the second point.
+
+    Returns:
+        float: The distance in kilometers.
+    """
+    lon1, lat1, lon2, lat2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def project_on_segment(point: LonLat, a: LonLat, b: LonLat) -> Tuple[float, float]:
+    """
+    Project a point on the segment ``a``-``b``.
+
+    Args:
+        point (sequence): ``[lon, lat]`` of the point.
+        a (sequence): ``[lon, lat]`` of the segment start.
+        b (sequence): ``[lon, lat]`` of the segment end.
+
+    Returns:
+        tuple: ``(t, offset_km)``: the fraction of the segment (0 to 1) where the closest
+        point lies, and the distance from the point to it.
+    """
+    reference_lat = (a[1] + b[1]) / 2
+    ax, ay = _to_plane(a[0], a[1], reference_lat)
+    bx, by = _to_plane(b[0], b[1], reference_lat)
+    px, py = _to_plane(point[0], point[1], reference_lat)
+    dx, dy = bx - ax, by - ay
+    length_squared = dx * dx + dy * dy
+    t = 0.0
+    if length_squared > 0:
+        t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_squared))
+    return t, math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def simplify_route(route: Sequence[LonLat], tolerance_km: float) -> List[List[float]]:
+    """
+    Simplify a polyline with the Douglas-Peucker algorithm.
+
+    Points closer than the tolerance to the previous kept point are dropped first, so
+    densely sampled GPS tracks are cheap to simplify.
+
+    Args:
+        route (sequence): ``[lon, lat]`` vertices.
+        tolerance_km (float): Maximum distance between the original and the simplified
+            polyline.
+
+    Returns:
+        list: The kept vertices, always including the first and the last one.
+    """
+    points = [[float(point[0]), float(point[1])] for point in route]
+    if len(points) <= 2:
+        return points
+
+    # Distancia equirectangular al cuadrado: suficiente para descartar puntos muy cercanos
+    km_per_degree = math.radians(EARTH_RADIUS_KM)
+    limit = (tolerance_km / km_per_degree) ** 2
+    thinned = [points[0]]
+    last_lon, last_lat = points[0]
+    scale = math.cos(math.radians(last_lat)) ** 2
+    for point in points[1:-1]:
+        d_lon, d_lat = point[0] - last_lon, point[1] - last_lat
+        if d_lon * d_lon * scale + d_lat * d_lat >= limit:
+            thinned.append(point)
+            last_lon, last_lat = point
+            scale = math.cos(math.radians(last_lat)) ** 2
+    thinned.append(points[-1])
+
+    keep = [False] * len(thinned)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(thinned) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest, farthest_offset = None, tolerance_km
+        for index in range(first + 1, last):
+            _, offset = project_on_segment(thinned[index], thinned[first], thinned[last])
+            if offset > farthest_offset:
+                farthest, farthest_offset = index, offset
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return [point for point, kept in zip(thinned, keep) if kept]
+
+
+class Corridor:
+    """
+    The area within a given distance of a route.
+
+    The route is simplified first (to at most ``MAX_CORRIDOR_SEGMENTS`` segments) and the
+    corridor is the union of one buffered rectangle per segment. Distances along and
+    across the route are measured on the simplified route, which stays within
+    ``tolerance_km`` of the original one.
+
+    Attributes:
+        route (list): The simplified route, as ``[lon, lat]`` vertices.
+        width_km (float): Maximum distance from the route.
+        tolerance_km (float): Simplification tolerance that was applied.
+        vertex_km (list): Distance along the route of each vertex.
+    """
+
+    def __init__(
+        self,
+        route: Sequence[LonLat],
+        width_km: float,
+        max_segments: int = MAX_CORRIDOR_SEGMENTS,
+    ):
+        tolerance = max(width_km / 10, 0.05)
+        simplified = simplify_route(route, tolerance)
+        while len(simplified) - 1 > max_segments:
+            tolerance *= 2
+            simplified = simplify_route(simplified, tolerance)
+
+        self.route = simplified
+        self.width_km = width_km
+        self.tolerance_km = tolerance
+        self._segments = list(self.segments())
+        self.vertex_km = [0.0]
+        for a, b in self._segments:
+            self.vertex_km.append(self.vertex_km[-1] + distance_km(a, b))
+
+    @property
+    def length_km(self) -> float:
+        """Length of the (simplified) route."""
+        return self.vertex_km[-1]
+
+    def segments(self) -> Iterable[Tuple[List[float], List[float]]]:
+        """Yield the ``(start, end)`` vertices of every segment of the route."""
+        if len(self.route) == 1:
+            yield self.route[0], self.route[0]
+        for index in range(len(self.route) - 1):
+            yield self.route[index], self.route[index + 1]
+
+    def polygons(self) -> List[List[List[float]]]:
+        """
+        Return one GeoJSON polygon ring per segment, buffered by the corridor width.
+
+        Returns:
+            list: Closed, counter-clockwise rings of ``[lon, lat]`` positions.
+        """
+        rings = []
+        width = self.width_km
+        for a, b in self._segments:
+            reference_lat = (a[1] + b[1]) / 2
+            ax, ay = _to_plane(a[0], a[1], reference_lat)
+            bx, by = _to_plane(b[0], b[1], reference_lat)
+            length = math.hypot(bx - ax, by - ay)
+            ux, uy = ((bx - ax) / length, (by - ay) / length) if length else (1.0, 0.0)
+            nx, ny = -uy, ux
+            corners = [
+                (ax - (ux + nx) * width, ay - (uy + ny) * width),
+                (bx + (ux - nx) * width, by + (uy - ny) * width),
+                (bx + (ux + nx) * width, by + (uy + ny) * width),
+                (ax - (ux - nx) * width, ay - (uy - ny) * width),
+            ]
+            ring = [list(_from_plane(x, y, reference_lat)) for x, y in corners]
+            rings.append(ring + [ring[0]])
+        return rings
+
+    def segment_bounds(self) -> List[Tuple[float, float, float, float]]:
+        """
+        Return the bounding box of every buffered segment.
+
+        Returns:
+            list: ``(west, south, east, north)`` in degrees, one per segment.
+        """
+        bounds = []
+        for ring in self.polygons():
+            lons = [point[0] for point in ring]
+            lats = [point[1] for point in ring]
+            bounds.append((min(lons), min(lats), max(lons), max(lats)))
+        return bounds
+
+    def locate(
+        self, point: LonLat, segments: Optional[Iterable[int]] = None
+    ) -> Optional[Tuple[float, float]]:
+        """
+        Locate a point relative to the route.
+
+        Args:
+            point (sequence): ``[lon, lat]`` of the point.
+            segments (iterable, optional): Only consider these segment indexes.
+
+        Returns:
+            tuple | None: ``(route_km, offset_km)``: distance along the route of the
+            closest point of the route, and distance to it; None if the point is farther
+            than the corridor width.
+        """
+        best = None
+        for index in segments if segments is not None else range(len(self._segments)):
+            a, b = self._segments[index]
+            t, offset = project_on_segment(point, a, b)
+            if offset <= self.width_km and (best is None or offset < best[1]):
+                segment_km = self.vertex_km[index + 1] - self.vertex_km[index]
+                best = (self.vertex_km[index] + t * segment_km, offset)
+        return best
+
+    def place(
+        self, stations: Iterable[dict], segments: Optional[Dict[int, Iterable[int]]] = None
+    ) -> List[dict]:
+        """
+        Keep the stations inside the corridor, annotated and ordered along the route.
+
+        Args:
+            stations (iterable): Station documents with a GeoJSON point ``geometry``.
+            segments (dict, optional): ``stationId -> segment indexes`` to consider for
+                each station, if already known.
+
+        Returns:
+            list: The stations with ``routeKm`` and ``offsetKm`` added, sorted by
+            ``routeKm`` (then station ID).
+        """
+        placed = []
+        for station in stations:
+            coordinates = (station.get("geometry") or {}).get("coordinates") or []
+            if len(coordinates) < 2 or None in coordinates[:2]:
+                continue
+            candidates = segments.get(station["stationId"]) if segments is not None else None
+            location = self.locate(coordinates, candidates)
+            if location is not None:
+                station["routeKm"] = round(location[0], 3)
+                station["offsetKm"] = round(location[1], 3)
+                placed.append(station)
+        placed.sort(key=lambda station: (station["routeKm"], station["stationId"]))
+        return placed
@@ -0,0 +1,322 @@
+"""
+importer.py
+
+Streaming import of the Secretaría de Energía fuel-price dataset into ``stations2``.
+
+The dataset ("Precios en surtidor - Resolución 314/2016") is a CSV with one row per station,
+product and schedule. It is read in fixed-size chunks with pandas, so memory stays bounded
+by the chunk size plus a small per-station state (a hash of the station's descriptive
+fields and the date of the last stored price of each product) loaded once from MongoDB.
+
+For each chunk:
+    1. stations that are new or whose descriptive fields changed are upserted;
+    2. only prices newer than the last stored one are appended, with a ``$push`` of the
+       whole product for new products or a positional ``$push`` into the existing one.
+
+Both phases are written with unordered ``bulk_write`` batches; phase 2 only starts once the
+stations it touches exist.
+"""
+
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from storage.price_index import mark_dirty
+
+# Columnas del CSV que se usan y su tipo
+CSV_COLUMNS = {
+    "idempresa": "Int64",
+    "empresa": "string",
+    "direccion": "string",
+    "localidad": "string",
+    "provincia": "string",
+    "idempresabandera": "Int64",
+    "empresabandera": "string",
+    "idproducto": "Int64",
+    "producto": "string",
+    "tipohorario": "string",
+    "precio": "float64",
+    "fecha_vigencia": "string",
+    "latitud": "float64",
+    "longitud": "float64",
+}
+DEFAULT_SCHEDULE = "Diurno"
+IMPORT_CHUNK_ROWS = 50_000
+IMPORT_BATCH_SIZE = 1_000
+
+
+@dataclass
+class ImportStats:
+    """
+    Counters of an import run.
+
+    Attributes:
+        rows (int): CSV rows read.
+        skipped_rows (int): Rows dropped as invalid or for another schedule.
+        stations_upserted (int): Stations created or with updated descriptive fields.
+        products_added (int): Products added to existing or new stations.
+        prices_added (int): Price entries appended.
+        changed_stations (set): IDs of every station that was written.
+        seconds (float): Wall-clock duration.
+    """
+
+    rows: int = 0
+    skipped_rows: int = 0
+    stations_upserted: int = 0
+    products_added: int = 0
+    prices_added: int = 0
+    changed_stations: set = field(default_factory=set)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        """Import throughput."""
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _text(value) -> Optional[str]:
+    return None if pd.isna(value) else str(value)
+
+
+def station_fields(row) -> dict:
+    """
+    Map a CSV row to the descriptive fields of a station document.
+
+    Args:
+        row: A row of the dataset (as produced by ``DataFrame.itertuples``).
+
+    Returns:
+        dict: The station fields, without products.
+    """
+    fields = {
+        "stationId": int(row.idempresa),
+        "stationName": _text(row.empresa),
+        "address": _text(row.direccion),
+        "town": _text(row.localidad),
+        "province": _text(row.provincia),
+        "flag": _text(row.empresabandera),
+        "flagId": None if pd.isna(row.idempresabandera) else int(row.idempresabandera),
+    }
+    if not pd.isna(row.latitud) and not pd.isna(row.longitud):
+        fields["geometry"] = {
+            "type": "Point",
+            "coordinates": [float(row.longitud), float(row.latitud)],
+        }
+    return fields
+
+
+def content_hash(fields: dict) -> str:
+    """
+    Hash the descriptive fields of a station, to skip unchanged stations.
+
+    Args:
+        fields (dict): The output of :func:`station_fields`.
+
+    Returns:
+        str: A hex digest.
+    """
+    encoded = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(encoded.encode("utf-8")).hexdigest()
+
+
+def load_state(collection) -> Dict[int, Tuple[Optional[str], Dict[int, datetime]]]:
+    """
+    Load the per-station state the importer compares against.
+
+    Args:
+        collection: The pymongo collection holding station documents.
+
+    Returns:
+        dict: ``stationId -> (contentHash, {productId: date of its last price})``.
+    """
+    pipeline = [
+        {
+            "$project": {
+                "_id": 0,
+                "stationId": 1,
+                "contentHash": 1,
+                "products": {
+                    "$map": {
+                        "input": {"$ifNull": ["$products", []]},
+                        "as": "product",
+                        "in": {
+                            "productId": "$$product.productId",
+                            "last": {"$max": "$$product.prices.date"},
+                        },
+                    }
+                },
+            }
+        }
+    ]
+    state = {}
+    for station in collection.aggregate(pipeline, allowDiskUse=True, batchSize=5000):
+        state[station["stationId"]] = (
+            station.get("contentHash"),
+            {product["productId"]: product.get("last") for product in station["products"]},
+        )
+    return state
+
+
+def read_chunks(source: str, chunk_rows: int = IMPORT_CHUNK_ROWS, encoding: str = "utf-8"):
+    """
+    Stream the dataset in chunks with only the columns the importer needs.
+
+    Args:
+        source (str): Path or URL of the CSV.
+        chunk_rows (int): Rows per chunk.
+        encoding (str): Encoding of the file.
+
+    Yields:
+        pandas.DataFrame: Chunks with ``fecha_vigencia`` parsed to datetimes.
+    """
+    reader = pd.read_csv(
+        source,
+        usecols=list(CSV_COLUMNS),
+        dtype=CSV_COLUMNS,
+        chunksize=chunk_rows,
+        encoding=encoding,
+    )
+    for chunk in reader:
+        chunk["fecha_vigencia"] = pd.to_datetime(
+            chunk["fecha_vigencia"], errors="coerce", format="mixed"
+        )
+        yield chunk
+
+
+def _flush(collection, operations: List[UpdateOne], batch_size: int) -> None:
+    for start in range(0, len(operations), batch_size):
+        collection.bulk_write(operations[start : start + batch_size], ordered=False)
+
+
+def import_prices(
+    collection,
+    source: str,
+    schedule: Optional[str] = DEFAULT_SCHEDULE,
+    chunk_rows: int = IMPORT_CHUNK_ROWS,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    encoding: str = "utf-8",
+    dry_run: bool = False,
+    progress: Optional[Callable[[int], None]] = None,
+    dirty_collection=None,
+) -> ImportStats:
+    """
+    Import a dataset file into the station collection.
+
+    Args:
+        collection: The pymongo collection holding station documents.
+        source (str): Path or URL of the CSV.
+        schedule (str, optional): Only import rows of this ``tipohorario`` (the API keeps
+            one price series per product). None imports every row.
+        chunk_rows (int): Rows read per chunk.
+        batch_size (int): Operations per ``bulk_write`` call.
+        encoding (str): Encoding of the file.
+        dry_run (bool): If True, compute the changes without writing them.
+        progress (callable, optional): Called with the number of rows of each chunk read.
+        dirty_collection (optional): The ``price_index_dirty`` collection; if given, the
+            days that received new prices are marked for the daily price index rollup.
+
+    Returns:
+        ImportStats: What was (or would have been) written.
+    """
+    started = time.perf_counter()
+    stats = ImportStats()
+    state = load_state(collection)
+
+    for chunk in read_chunks(source, chunk_rows, encoding):
+        stats.rows += len(chunk)
+        valid = chunk.dropna(subset=["idempresa", "idproducto", "precio", "fecha_vigencia"])
+        if schedule:
+            valid = valid[valid["tipohorario"].eq(schedule).fillna(False)]
+        stats.skipped_rows += len(chunk) - len(valid)
+        now = datetime.utcnow()
+
+        station_ops: List[UpdateOne] = []
+        # (stationId, productId) -> (productName, {fecha: precio})
+        new_prices: Dict[Tuple[int, int], Tuple[str, Dict[datetime, float]]] = {}
+
+        for row in valid.itertuples(index=False):
+            fields = station_fields(row)
+            station_id = fields["stationId"]
+            digest = content_hash(fields)
+            stored_hash, last_dates = state.get(station_id, (None, {}))
+            if stored_hash != digest:
+                station_ops.append(
+                    UpdateOne(
+                        {"stationId": station_id},
+                        {
+                            "$set": {**fields, "contentHash": digest, "updatedAt": now},
+                            "$setOnInsert": {"products": []},
+                        },
+                        upsert=True,
+                    )
+                )
+                state[station_id] = (digest, last_dates)
+                stats.changed_stations.add(station_id)
+
+            product_id = int(row.idproducto)
+            # MongoDB guarda milisegundos: truncar para que reimportar no duplique precios
+            date = pd.Timestamp(row.fecha_vigencia).to_pydatetime().replace(tzinfo=None)
+            date = date.replace(microsecond=date.microsecond // 1000 * 1000)
+            last = last_dates.get(product_id)
+            if last is None or date > last:
+                _, prices = new_prices.setdefault(
+                    (station_id, product_id), (_text(row.producto), {})
+                )
+                prices[date] = float(row.precio)
+
+        price_ops: List[UpdateOne] = []
+        observations = set()
+        for (station_id, product_id), (product_name, prices) in new_prices.items():
+            entries = [
+                {"_id": ObjectId(), "price": price, "date": date}
+                for date, price in sorted(prices.items())
+            ]
+            last_dates = state[station_id][1]
+            if product_id in last_dates:
+                price_ops.append(
+                    UpdateOne(
+                        {"stationId": station_id, "products.productId": product_id},
+                        {
+                            "$push": {"products.$.prices": {"$each": entries}},
+                            "$set": {"updatedAt": now},
+                        },
+                    )
+                )
+            else:
+                product = {
+                    "_id": ObjectId(),
+                    "productId": product_id,
+                    "productName": product_name,
+                    "prices": entries,
+                }
+                price_ops.append(
+                    UpdateOne(
+                        {"stationId": station_id},
+                        {"$push": {"products": product}, "$set": {"updatedAt": now}},
+                    )
+                )
+                stats.products_added += 1
+            observations.update((product_id, entry["date"]) for entry in entries)
+            last_dates[product_id] = entries[-1]["date"]
+            stats.prices_added += len(entries)
+            stats.changed_stations.add(station_id)
+
+        stats.stations_upserted += len(station_ops)
+        if not dry_run:
+            # Las estaciones deben existir antes de agregarles productos
+            _flush(collection, station_ops, batch_size)
+            _flush(collection, price_ops, batch_size)
+            if dirty_collection is not None:
+                mark_dirty(dirty_collection, observations)
+        if progress is not None:
+            progress(len(chunk))
+
+    stats.seconds = time.perf_counter() - started
+    return stats
@@ -0,0 +1,233 @@
+"""
+mongo.py
+
+MongoDB implementation of the station storage backend.
+
+Pipelines are produced by ``storage.compiler``; this module only runs them and creates the
+indexes they rely on.
+"""
+
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from pymongo import ASCENDING, GEOSPHERE
+from pymongo.errors import OperationFailure
+
+from models.filters import HistoryWindow, StationFilter
+from storage.base import StationStore
+from storage.deadline import QUERY_MAX_TIME_MS, max_time_ms, query_comment
+from storage.geo import Corridor
+from storage.price_index import ensure_indexes as ensure_price_index_indexes
+from storage.price_index import query_filter
+from storage.compiler import (
+    compile_along_route,
+    compile_catalog,
+    compile_changes,
+    compile_last_prices,
+    compile_station,
+    compile_station_last_prices,
+    compile_stations,
+)
+
+
+# Índices que necesitan las consultas de este backend
+STATION_INDEXES = [
+    [("stationId", ASCENDING)],
+    [("updatedAt", ASCENDING), ("stationId", ASCENDING)],
+    [("flagId", ASCENDING), ("stationId", ASCENDING)],
+    [("products.productId", ASCENDING), ("stationId", ASCENDING)],
+    [("province", ASCENDING)],
+    [("town", ASCENDING)],
+]
+GEO_INDEX = [("geometry", GEOSPHERE)]
+
+
+def plan_stages(explain: dict) -> List[str]:
+    """
+    Collect the stage names of every winning plan in an ``explain`` result.
+
+    Args:
+        explain (dict): The output of :meth:`MongoStationStore.explain`.
+
+    Returns:
+        list: Stage names (e.g. ``IXSCAN``, ``FETCH``, ``COLLSCAN``), outermost first.
+    """
+    stages = []
+
+    def walk(node, in_plan=False):
+        if isinstance(node, dict):
+            if in_plan and "stage" in node:
+                stages.append(node["stage"])
+            for key, value in node.items():
+                walk(value, in_plan or key in ("winningPlan", "queryPlan"))
+        elif isinstance(node, list):
+            for item in node:
+                walk(item, in_plan)
+
+    walk(explain)
+    return stages
+
+
+class MongoStationStore(StationStore):
+    """
+    Station storage backed by the ``stations2`` MongoDB collection.
+
+    Attributes:
+        collection: The pymongo collection holding station documents.
+        price_index: The pymongo collection holding the daily price index.
+    """
+
+    def __init__(self, collection, price_index=None):
+        self.collection = collection
+        self.price_index = price_index
+
+    def ensure_indexes(self) -> None:
+        """Create the indexes the station queries rely on (no-op if they already exist)."""
+        for keys in STATION_INDEXES:
+            self.collection.create_index(keys)
+        try:
+            self.collection.create_index(GEO_INDEX)
+        except OperationFailure as e:
+            # Un documento con geometry inválida impide crear el índice; el resto sigue andando
+            print(f"Error creating geospatial index: {e}")
+        if self.price_index is not None:
+            ensure_price_index_indexes(self.collection, self.price_index)
+
+    def explain(self, pipeline: List[dict], verbosity: str = "queryPlanner") -> dict:
+        """
+        Return the query planner's explanation of a pipeline.
+
+        Args:
+            pipeline (list): An aggregation pipeline.
+            verbosity (str): ``queryPlanner`` (the default) only plans the query;
+                ``executionStats`` also runs it and reports what it examined.
+
+        Returns:
+            dict: The ``explain`` output.
+        """
+        return self.collection.database.command(
+            "explain",
+            {
+                "aggregate": self.collection.name,
+                "pipeline": pipeline,
+                "cursor": {},
+                "maxTimeMS": QUERY_MAX_TIME_MS,
+            },
+            verbosity=verbosity,
+        )
+
+    def docs_examined(self, pipeline: List[dict]) -> Optional[int]:
+        """Run the pipeline under ``explain`` and return the documents it examined."""
+        totals = []
+
+        def walk(node):
+            if isinstance(node, dict):
+                for key, value in node.items():
+                    if key == "totalDocsExamined":
+                        totals.append(value)
+                    else:
+                        walk(value)
+            elif isinstance(node, list):
+                for item in node:
+                    walk(item)
+
+        # Una entrada por cursor (y por shard, en clusters fragmentados)
+        walk(self.explain(pipeline, verbosity="executionStats"))
+        return sum(totals) if totals else None
+
+    def _aggregate(self, pipeline: List[dict]) -> List[dict]:
+        return list(
+            self.collection.aggregate(
+                pipeline,
+                allowDiskUse=True,
+                maxTimeMS=max_time_ms(),
+                batchSize=100,
+                comment=query_comment(),
+            )
+        )
+
+    def find_stations(
+        self, filters: StationFilter, limit: int = 20, window: Optional[HistoryWindow] = None
+    ) -> List[dict]:
+        """Return stations matching the filters with their price history."""
+        return self._aggregate(compile_stations(filters, limit, window))
+
+    def get_station(
+        self, station_id: int, filters: StationFilter, window: Optional[HistoryWindow] = None
+    ) -> Optional[dict]:
+        """Return a single station, keeping only the products that match the filters."""
+        result = self._aggregate(compile_station(station_id, filters, window))
+        return result[0] if result else None
+
+    def find_last_prices(self, filters: StationFilter, limit: int = 20) -> List[dict]:
+        """Return stations matching the filters with the latest price of each product."""
+        return self._aggregate(compile_last_prices(filters, limit))
+
+    def get_station_last_prices(self, station_id: int, filters: StationFilter) -> Optional[dict]:
+        """Return a single station with the latest price of each matching product."""
+        result = self._aggregate(compile_station_last_prices(station_id, filters))
+        if not result or not result[0]["products"]:
+            return None
+        return result[0]
+
+    def find_along_route(self, corridor: Corridor, product_id: int) -> List[dict]:
+        """Return stations inside a route corridor with the latest price of a product."""
+        return corridor.place(self._aggregate(compile_along_route(corridor, product_id)))
+
+    def find_price_index(
+        self,
+        product_id: int,
+        province: Optional[str],
+        flag: Optional[str],
+        date_from: datetime,
+        date_to: datetime,
+    ) -> List[dict]:
+        """Return the daily price index of a product, read from ``price_index_daily``."""
+        cursor = self.price_index.find(
+            query_filter(product_id, province, flag, date_from, date_to),
+            {"_id": 0, "provinceKey": 0, "flagKey": 0, "updatedAt": 0},
+            max_time_ms=max_time_ms(),
+            comment=query_comment(),
+        )
+        return list(cursor.sort("day", ASCENDING))
+
+    def cancel(self, comment: str) -> int:
+        """
+        Kill the operations this client is running on the server under a request's tag.
+
+        Args:
+            comment (str): The ``comment`` the request's commands were sent with.
+
+        Returns:
+            int: Number of operations killed.
+        """
+        admin = self.collection.database.client.admin
+        killed = 0
+        try:
+            operations = admin.aggregate(
+                [
+                    {"$currentOp": {"allUsers": False, "idleConnections": False}},
+                    {"$match": {"command.comment": comment}},
+                    {"$project": {"opid": 1}},
+                ]
+            )
+            for operation in operations:
+                admin.command("killOp", op=operation["opid"])
+                killed += 1
+        except OperationFailure as e:
+            # Sin permisos de $currentOp/killOp (p. ej. clusters compartidos): queda maxTimeMS
+            print(f"Error cancelling operations {comment}: {e}")
+        return killed
+
+    def iter_catalog(self, since: Optional[datetime] = None) -> Iterable[dict]:
+        """Yield every station with the latest price of each product, without the history."""
+        return self.collection.aggregate(compile_catalog(since), allowDiskUse=True, batchSize=1000)
+
+    def find_changes(
+        self,
+        since: Optional[datetime] = None,
+        after_station_id: Optional[int] = None,
+        limit: int = 500,
+    ) -> List[dict]:
+        """Return catalog documents changed after a sync position, oldest change first."""
+        return self._aggregate(compile_changes(since, after_station_id, limit))
@@ -0,0 +1,497 @@
+"""
+price_index.py
+
+Daily price index: mean, median, minimum, maximum and number of stations per
+day × product × province × flag, plus the province-wide, flag-wide and national totals.
+
+The index is materialized in the ``price_index_daily`` collection and maintained
+incrementally: writers mark the ``(product, day)`` pairs affected by new observations in
+``price_index_dirty`` and the rollup job recomputes only those days. Each station counts
+once per day with the last price it had reported by the end of that day, for up to
+``PRICE_INDEX_MAX_CARRY_DAYS`` days after that report: stations that do not report every
+day keep their price in the index, and stations that stop reporting drop out of it. A
+report therefore affects its own day and the following ``PRICE_INDEX_MAX_CARRY_DAYS``
+days, and marks them all.
+
+Days older than the archive watermark (see ``storage.archive``) are frozen: their prices
+may no longer be in the hot collection, so they are never recomputed. The latest price of
+each product is never archived, so later days still carry it.
+"""
+
+import heapq
+import os
+import statistics
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from pymongo import ASCENDING, DeleteMany, UpdateOne
+
+from storage.archive import archive_watermark
+from storage.search import normalize
+
+load_dotenv()
+
+# Días que una estación sigue contando con su último precio después de informarlo
+PRICE_INDEX_MAX_CARRY_DAYS = int(os.getenv("PRICE_INDEX_MAX_CARRY_DAYS", "30"))
+
+PRICE_INDEX_COLLECTION = "price_index_daily"
+DIRTY_COLLECTION = "price_index_dirty"
+ROLLUP_WINDOW_DAYS = 31
+
+# (día, provincia, bandera) -> último precio conocido de cada estación al final del día
+Groups = Dict[Tuple[datetime, Optional[str], Optional[str]], List[float]]
+# día -> estación -> último precio informado ese día
+Changes = Dict[datetime, Dict[int, float]]
+
+
+def day_of(value: datetime) -> datetime:
+    """Truncate a date to the start of its (UTC) day."""
+    return datetime(value.year, value.month, value.day)
+
+
+def day_range(first: datetime, last: datetime) -> List[datetime]:
+    """Return every day from ``first`` to ``last`` (inclusive)."""
+    days = []
+    day = day_of(first)
+    while day <= last:
+        days.append(day)
+        day += timedelta(days=1)
+    return days
+
+
+def scope_key(value: Optional[str]) -> Optional[str]:
+    """
+    Normalize a province or flag name for lookups (None stands for "all").
+
+    Args:
+        value (str, optional): The name as stored or as sent by a client.
+
+    Returns:
+        str | None: The lookup key.
+    """
+    return normalize(value) if value else None
+
+
+def summarize(prices: List[float]) -> dict:
+    """
+    Compute the statistics of one index point.
+
+    Args:
+        prices (list): One price per station.
+
+    Returns:
+        dict: ``count``, ``mean``, ``median``, ``min`` and ``max``.
+    """
+    return {
+        "count": len(prices),
+        "mean": round(statistics.fmean(prices), 3),
+        "median": round(statistics.median(prices), 3),
+        "min": min(prices),
+        "max": max(prices),
+    }
+
+
+def index_points(product_id: int, groups: Groups) -> List[dict]:
+    """
+    Build the index points of a product from per-province, per-flag price groups.
+
+    Besides one point per ``(day, province, flag)`` group, adds the totals per province
+    (``flag`` None), per flag (``province`` None) and national (both None).
+
+    Args:
+        product_id (int): The product.
+        groups (dict): ``(day, province, flag) -> prices``.
+
+    Returns:
+        list: Index point documents.
+    """
+    # Agrupar por nombre normalizado, conservando el nombre tal como figura en los datos
+    levels: Dict[tuple, Tuple[Optional[str], Optional[str], List[float]]] = {}
+    for (day, province, flag), prices in groups.items():
+        for scope_province, scope_flag in ((province, flag), (province, None), (None, flag)):
+            key = (day, scope_key(scope_province), scope_key(scope_flag))
+            levels.setdefault(key, (scope_province, scope_flag, []))[2].extend(prices)
+        levels.setdefault((day, None, None), (None, None, []))[2].extend(prices)
+
+    return [
+        {
+            "productId": product_id,
+            "day": day,
+            "province": province,
+            "flag": flag,
+            "provinceKey": province_key,
+            "flagKey": flag_key,
+            **summarize(prices),
+        }
+        for (day, province_key, flag_key), (province, flag, prices) in levels.items()
+    ]
+
+
+def carry_forward(
+    changes: Changes,
+    scopes: Dict[int, Tuple[Optional[str], Optional[str]]],
+    days: Iterable[datetime],
+    max_carry_days: int = PRICE_INDEX_MAX_CARRY_DAYS,
+) -> Iterator[Groups]:
+    """
+    Build the price groups of each day, carrying every station's last price forward.
+
+    Args:
+        changes (dict): ``day -> stationId -> price``, the last price each station
+            reported on each day. Days before the first requested day only seed the
+            prices carried into it.
+        scopes (dict): ``stationId -> (province, flag)``.
+        days (iterable): The days to build, in ascending order.
+        max_carry_days (int): Days a price is carried after the day it was reported; a
+            station without a newer report drops out of the groups after that.
+
+    Yields:
+        dict: The groups of one day, ``(day, province, flag) -> prices``.
+    """
+    pending = sorted(changes)
+    position = 0
+    carry = timedelta(days=max_carry_days)
+    # (provincia, bandera) -> estación -> último precio conocido
+    current: Dict[Tuple[Optional[str], Optional[str]], Dict[int, float]] = {}
+    # Día del último informe de cada estación y (último día en que cuenta, estación)
+    reported: Dict[int, datetime] = {}
+    expiries: List[Tuple[datetime, int]] = []
+    for day in days:
+        while position < len(pending) and pending[position] <= day:
+            report_day = pending[position]
+            for station_id, price in changes[report_day].items():
+                current.setdefault(scopes[station_id], {})[station_id] = price
+                reported[station_id] = report_day
+                heapq.heappush(expiries, (report_day + carry, station_id))
+            position += 1
+        while expiries and expiries[0][0] < day:
+            last_day, station_id = heapq.heappop(expiries)
+            # Las entradas de informes ya reemplazados por uno posterior se descartan
+            if reported.get(station_id) == last_day - carry:
+                del current[scopes[station_id]][station_id]
+                del reported[station_id]
+        yield {
+            (day, province, flag): list(prices.values())
+            for (province, flag), prices in current.items()
+            if prices
+        }
+
+
+def groups_from_stations(stations: Iterable[dict]) -> Iterator[Tuple[int, Groups]]:
+    """
+    Build the price groups of every product and day from full station documents.
+
+    In-memory equivalent of the rollup aggregation, for backends without MongoDB. Days run
+    from each product's first report to the last day with any report; groups are yielded
+    one day at a time, since every station is carried into the days after its report.
+
+    Args:
+        stations (iterable): Station documents with their price history.
+
+    Yields:
+        tuple: ``(productId, groups)`` with the groups of one day, in day order per product.
+    """
+    # producto -> día -> estación -> (fecha, precio) de la última observación del día
+    latest: Dict[int, Dict[datetime, Dict[int, Tuple[datetime, float]]]] = {}
+    scopes: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+    for station in stations:
+        station_id = station["stationId"]
+        scopes[station_id] = (station.get("province"), station.get("flag"))
+        for product in station.get("products") or []:
+            for price in product.get("prices") or []:
+                date = price.get("date")
+                if date is None:
+                    continue
+                reports = latest.setdefault(product.get("productId"), {}).setdefault(
+                    day_of(date), {}
+                )
+                if station_id not in reports or date >= reports[station_id][0]:
+                    reports[station_id] = (date, price["price"])
+
+    if not latest:
+        return
+    last_day = max(max(days) for days in latest.values())
+    for product_id, days in latest.items():
+        changes = {
+            day: {station_id: price for station_id, (_, price) in reports.items()}
+            for day, reports in days.items()
+        }
+        for groups in carry_forward(changes, scopes, day_range(min(days), last_day)):
+            yield product_id, groups
+
+
+def ensure_indexes(stations_collection, index_collection) -> None:
+    """
+    Create the indexes used by the rollup and by ``/stats/index``.
+
+    Args:
+        stations_collection: The ``stations2`` collection.
+        index_collection: The ``price_index_daily`` collection.
+    """
+    index_collection.create_index(
+        [
+            ("productId", ASCENDING),
+            ("provinceKey", ASCENDING),
+            ("flagKey", ASCENDING),
+            ("day", ASCENDING),
+        ],
+        unique=True,
+    )
+    # El rollup lee los precios de la ventana y de los PRICE_INDEX_MAX_CARRY_DAYS previos, en
+    # los que informa casi toda estación: el índice no filtraría y encarecía cada escritura
+    # de precios, así que se elimina de las bases que lo tenían
+    if "products.prices.date_1" in stations_collection.index_information():
+        stations_collection.drop_index("products.prices.date_1")
+
+
+def mark_dirty(dirty_collection, observations: Iterable[Tuple[int, datetime]]) -> int:
+    """
+    Record that some ``(product, day)`` pairs received new observations.
+
+    A price is carried into the following ``PRICE_INDEX_MAX_CARRY_DAYS`` days, so each
+    product is marked from the day of its oldest new observation through that many days
+    after its newest one, but not past today.
+
+    Args:
+        dirty_collection: The ``price_index_dirty`` collection.
+        observations (iterable): ``(productId, date)`` pairs of the new prices.
+
+    Returns:
+        int: Number of distinct pairs marked.
+    """
+    # producto -> (primer, último) día con observaciones nuevas
+    spans: Dict[int, Tuple[datetime, datetime]] = {}
+    for product_id, date in observations:
+        day = day_of(date)
+        first, last = spans.get(product_id, (day, day))
+        spans[product_id] = (min(first, day), max(last, day))
+    today = day_of(datetime.utcnow())
+    carry = timedelta(days=PRICE_INDEX_MAX_CARRY_DAYS)
+    return _mark_pairs(
+        dirty_collection,
+        {
+            (product_id, day)
+            for product_id, (first, last) in spans.items()
+            for day in day_range(first, min(last + carry, max(last, today)))
+        },
+    )
+
+
+def _mark_pairs(dirty_collection, pairs: Set[Tuple[int, datetime]]) -> int:
+    if pairs:
+        now = datetime.utcnow()
+        dirty_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": {"productId": product_id, "day": day}},
+                    {"$set": {"markedAt": now}},
+                    upsert=True,
+                )
+                for product_id, day in pairs
+            ],
+            ordered=False,
+        )
+    return len(pairs)
+
+
+def mark_range(
+    stations_collection,
+    dirty_collection,
+    date_from: datetime,
+    date_to: datetime,
+    product_ids: Optional[Iterable[int]] = None,
+) -> int:
+    """
+    Mark every day of a range as dirty, for a full or partial rebuild.
+
+    Unlike :func:`mark_dirty`, days after the range are not marked: a rebuild does not
+    change the prices they carry.
+
+    Args:
+        stations_collection: The ``stations2`` collection.
+        dirty_collection: The ``price_index_dirty`` collection.
+        date_from (datetime): First day.
+        date_to (datetime): Last day (inclusive).
+        product_ids (iterable, optional): Products to rebuild. Defaults to every product.
+
+    Returns:
+        int: Number of pairs marked.
+    """
+    if product_ids is None:
+        product_ids = stations_collection.distinct("products.productId")
+    days = day_range(date_from, date_to)
+    return _mark_pairs(dirty_collection, {(pid, day) for pid in product_ids for day in days})
+
+
+def _groups(stations_collection, product_id: int, days: List[datetime]) -> Groups:
+    start, end = days[0], days[-1] + timedelta(days=1)
+    # Un precio anterior sólo cuenta en la ventana si se informó en los días que se arrastra:
+    # no hace falta leer el resto del historial
+    lookback = start - timedelta(days=PRICE_INDEX_MAX_CARRY_DAYS)
+    # Lo informado antes de la ventana se agrupa en un único día previo: el precio que arrastra
+    carried = start - timedelta(days=1)
+    pipeline = [
+        {
+            "$match": {
+                "products": {
+                    "$elemMatch": {
+                        "productId": product_id,
+                        "prices": {"$elemMatch": {"date": {"$gte": lookback, "$lt": end}}},
+                    }
+                }
+            }
+        },
+        {"$unwind": "$products"},
+        {"$match": {"products.productId": product_id}},
+        # Filtrar antes de desenrollar: sólo se expanden los precios del período
+        {
+            "$project": {
+                "stationId": 1,
+                "province": 1,
+                "flag": 1,
+                "prices": {
+                    "$filter": {
+                        "input": "$products.prices",
+                        "as": "price",
+                        "cond": {
+                            "$and": [
+                                {"$gte": ["$$price.date", lookback]},
+                                {"$lt": ["$$price.date", end]},
+                            ]
+                        },
+                    }
+                },
+            }
+        },
+        {"$unwind": "$prices"},
+        {
+            "$project": {
+                "stationId": 1,
+                "province": 1,
+                "flag": 1,
+                "price": "$prices.price",
+                "date": "$prices.date",
+                "day": {
+                    "$cond": [
+                        {"$lt": ["$prices.date", start]},
+                        carried,
+                        {"$dateTrunc": {"date": "$prices.date", "unit": "day"}},
+                    ]
+                },
+            }
+        },
+        # Una observación por estación y día: la última
+        {
+            "$group": {
+                "_id": {"day": "$day", "stationId": "$stationId"},
+                "province": {"$first": "$province"},
+                "flag": {"$first": "$flag"},
+                "price": {"$top": {"sortBy": {"date": -1}, "output": "$price"}},
+                "date": {"$max": "$date"},
+            }
+        },
+    ]
+    changes: Changes = {}
+    scopes: Dict[int, Tuple[Optional[str], Optional[str]]] = {}
+    for report in stations_collection.aggregate(pipeline, allowDiskUse=True):
+        station_id = report["_id"]["stationId"]
+        scopes[station_id] = (report.get("province"), report.get("flag"))
+        # El precio arrastrado vence según el día en que se informó, no el de la ventana
+        changes.setdefault(day_of(report["date"]), {})[station_id] = report["price"]
+
+    groups: Groups = {}
+    for day_groups in carry_forward(changes, scopes, days):
+        groups.update(day_groups)
+    return groups
+
+
+def rollup(stations_collection, index_collection, dirty_collection) -> Dict[str, int]:
+    """
+    Recompute the index for every dirty ``(product, day)`` pair.
+
+    Days are processed per product in windows of ``ROLLUP_WINDOW_DAYS``. Each window reads
+    only the prices reported in it and in the ``PRICE_INDEX_MAX_CARRY_DAYS`` days before it,
+    so the cost follows the dirty days rather than the length of the history. A marker is
+    only cleared if it was not marked again while its day was being recomputed.
+
+    Args:
+        stations_collection: The ``stations2`` collection.
+        index_collection: The ``price_index_daily`` collection.
+        dirty_collection: The ``price_index_dirty`` collection.
+
+    Returns:
+        dict: Number of ``days`` recomputed, ``points`` written and ``frozen`` days skipped.
+    """
+    frozen_before = archive_watermark()
+    markers = list(dirty_collection.find({}))
+    pending: Dict[int, Set[datetime]] = {}
+    for marker in markers:
+        pending.setdefault(marker["_id"]["productId"], set()).add(marker["_id"]["day"])
+
+    totals = {"days": 0, "points": 0, "frozen": 0}
+    for product_id, product_days in pending.items():
+        days = sorted(product_days)
+        if frozen_before is not None:
+            frozen = [day for day in days if day < day_of(frozen_before)]
+            totals["frozen"] += len(frozen)
+            days = days[len(frozen) :]
+
+        for start in range(0, len(days), ROLLUP_WINDOW_DAYS):
+            window = days[start : start + ROLLUP_WINDOW_DAYS]
+            started = datetime.utcnow()
+            points = index_points(product_id, _groups(stations_collection, product_id, window))
+            operations = [
+                UpdateOne(
+                    {key: point[key] for key in ("productId", "provinceKey", "flagKey", "day")},
+                    {"$set": {**point, "updatedAt": started}},
+                    upsert=True,
+                )
+                for point in points
+            ]
+            # Puntos que ya no tienen observaciones (datos corregidos o borrados)
+            operations.append(
+                DeleteMany(
+                    {
+                        "productId": product_id,
+                        "day": {"$in": window},
+                        "updatedAt": {"$lt": started},
+                    }
+                )
+            )
+            # Ordenado: el borrado de puntos obsoletos va después de las actualizaciones
+            index_collection.bulk_write(operations, ordered=True)
+            totals["days"] += len(window)
+            totals["points"] += len(points)
+
+    for marker in markers:
+        dirty_collection.delete_one({"_id": marker["_id"], "markedAt": marker["markedAt"]})
+    return totals
+
+
+def query_filter(
+    product_id: int,
+    province: Optional[str],
+    flag: Optional[str],
+    date_from: datetime,
+    date_to: datetime,
+) -> dict:
+    """
+    Build the ``price_index_daily`` filter of an index query.
+
+    Args:
+        product_id (int): The product.
+        province (str, optional): Province name; None for the national index.
+        flag (str, optional): Flag name; None for all flags.
+        date_from (datetime): First day.
+        date_to (datetime): Last day (inclusive).
+
+    Returns:
+        dict: The filter, served entirely by the unique index.
+    """
+    return {
+        "productId": product_id,
+        "provinceKey": scope_key(province),
+        "flagKey": scope_key(flag),
+        "day": {"$gte": day_of(date_from), "$lte": day_of(date_to)},
+    }
@@ -0,0 +1,553 @@
+"""
+resilience.py
+
+Stale-while-revalidate serving and a circuit breaker for the station queries.
+
+``ResilientStore`` wraps any storage backend and keeps the last good result of every route
+query, keyed by its normalized parameters. The age of a cached result decides how it is
+served, following the windows of RFC 5861:
+
+    - younger than ``RESILIENCE_FRESH_SECONDS``: served from memory;
+    - within ``RESILIENCE_STALE_WHILE_REVALIDATE_SECONDS`` after that: served immediately,
+      marked stale, while a single background call refreshes it;
+    - within ``RESILIENCE_STALE_IF_ERROR_SECONDS`` after that: the backend is queried, but
+      if it fails, takes longer than ``RESILIENCE_SLOW_CALL_MS`` or the circuit is open,
+      the cached result is served, marked stale.
+
+Backend calls run on a bounded worker pool and concurrent requests for the same key share
+one call. The shared call runs with its own ``comment`` and with the remaining budget of
+the request that started it as ``maxTimeMS``; a request that joined it with a later
+deadline starts a new call if that budget runs out first. Each call counts the requests
+waiting for it: a client disconnect or an expired deadline only ends that request's wait,
+and the call is killed on the server once its last waiter is gone. Database errors and
+calls slower than ``RESILIENCE_SLOW_CALL_MS`` count as failures; after
+``RESILIENCE_FAILURE_THRESHOLD`` consecutive failures the circuit opens and requests without
+a usable cached result fail fast with :class:`CircuitOpenError` for
+``RESILIENCE_OPEN_SECONDS``, after which a single probe call decides whether it closes.
+
+``find_changes`` is never cached: a page of ``/changes`` is only valid for the sync
+position it was computed at, so it is always read from the backend.
+
+Stale responses carry an ``Age`` header and ``X-Cache-Status: stale`` (or ``stale-if-error``),
+added by :class:`StaleResponseMiddleware`.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import Context, ContextVar
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from bson import json_util
+from dotenv import load_dotenv
+from pymongo.errors import ExecutionTimeout, OperationFailure, PyMongoError
+from starlette.datastructures import MutableHeaders
+
+from models.filters import HistoryWindow, StationFilter
+from storage.base import StationStore
+from storage.deadline import (
+    QUERY_MAX_TIME_MS,
+    ROUTE_TIMEOUTS_MS,
+    Deadline,
+    DeadlineExceeded,
+    current_deadline,
+    use_deadline,
+)
+from storage.geo import Corridor
+from storage.slowlog import QUERIES, normalize_params
+
+load_dotenv()
+
+RESILIENCE_ENABLED = os.getenv("RESILIENCE_ENABLED", "true").lower() == "true"
+RESILIENCE_FRESH_SECONDS = float(os.getenv("RESILIENCE_FRESH_SECONDS", "5"))
+RESILIENCE_STALE_WHILE_REVALIDATE_SECONDS = float(
+    os.getenv("RESILIENCE_STALE_WHILE_REVALIDATE_SECONDS", "60")
+)
+RESILIENCE_STALE_IF_ERROR_SECONDS = float(os.getenv("RESILIENCE_STALE_IF_ERROR_SECONDS", "86400"))
+RESILIENCE_CACHE_ENTRIES = int(os.getenv("RESILIENCE_CACHE_ENTRIES", "2000"))
+RESILIENCE_SLOW_CALL_MS = float(os.getenv("RESILIENCE_SLOW_CALL_MS", "2000"))
+RESILIENCE_FAILURE_THRESHOLD = int(os.getenv("RESILIENCE_FAILURE_THRESHOLD", "5"))
+RESILIENCE_OPEN_SECONDS = float(os.getenv("RESILIENCE_OPEN_SECONDS", "30"))
+RESILIENCE_WORKERS = int(os.getenv("RESILIENCE_WORKERS", "16"))
+
+INTERRUPTED = 11601  # Código de MongoDB para una operación cancelada con killOp
+
+# Consultas que nunca se sirven desde la caché (las páginas de /changes dependen del token)
+UNCACHED = {"find_changes"}
+
+STALE = "stale"
+STALE_IF_ERROR = "stale-if-error"
+
+# Estado de la respuesta en curso; la middleware lo crea y el store lo completa
+_freshness: ContextVar[Optional[dict]] = ContextVar("freshness", default=None)
+
+
+def _mark_stale(age: float, status: str) -> None:
+    state = _freshness.get()
+    if state is not None:
+        state["age"] = max(state.get("age", 0.0), age)
+        # Si una respuesta combina varias consultas, gana la más degradada
+        if state.get("status") != STALE_IF_ERROR:
+            state["status"] = status
+
+
+@contextmanager
+def track_freshness() -> Iterator[dict]:
+    """
+    Collect whether any query run inside the block was served stale.
+
+    Yields:
+        dict: Empty if every result was fresh; otherwise the ``age`` (seconds) of the
+        oldest stale result and its ``status`` (``stale`` or ``stale-if-error``).
+    """
+    state: dict = {}
+    token = _freshness.set(state)
+    try:
+        yield state
+    finally:
+        _freshness.reset(token)
+
+
+class StaleResponseMiddleware:
+    """
+    ASGI middleware that marks responses built from stale cached results.
+
+    Adds ``Age`` (seconds since the result was fetched) and ``X-Cache-Status`` to the
+    response if any query of the request was served stale by :class:`ResilientStore`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Un dict mutable: se ve desde el handler aunque corra en un contexto copiado
+        with track_freshness() as state:
+
+            async def send_with_status(message):
+                if message["type"] == "http.response.start" and state:
+                    headers = MutableHeaders(raw=message.setdefault("headers", []))
+                    headers["Age"] = str(int(state["age"]))
+                    headers["X-Cache-Status"] = state["status"]
+                await send(message)
+
+            await self.app(scope, receive, send_with_status)
+
+
+class CircuitOpenError(PyMongoError):
+    """
+    Raised instead of querying the database while the circuit breaker is open.
+
+    Attributes:
+        retry_after (float): Seconds until the breaker lets a probe call through.
+    """
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuito abierto: base de datos no disponible ({retry_after:.0f}s)")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Attributes:
+        failure_threshold (int): Consecutive failures that open the circuit.
+        open_seconds (float): How long the circuit stays open before a probe call.
+        state (str): ``closed``, ``open`` or ``half-open``.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = RESILIENCE_FAILURE_THRESHOLD,
+        open_seconds: float = RESILIENCE_OPEN_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def retry_after(self) -> float:
+        """Seconds until the next probe call is allowed (0 if the circuit is closed)."""
+        if self.state == self.CLOSED:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - time.monotonic())
+
+    def allow(self) -> bool:
+        """
+        Decide whether a backend call may start.
+
+        Returns:
+            bool: True if the circuit is closed, or if this call is the half-open probe.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() >= self._opened_at + self.open_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record(self, success: bool) -> None:
+        """
+        Record the outcome of a backend call.
+
+        Args:
+            success (bool): False for database errors and slow calls.
+        """
+        with self._lock:
+            if success:
+                self._failures = 0
+                self.state = self.CLOSED
+                return
+            self._failures += 1
+            # Las llamadas lentas que terminan con el circuito abierto no lo prolongan
+            if self.state == self.OPEN:
+                return
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                print(f"Circuit breaker opened after {self._failures} failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class _Call:
+    """
+    A backend call in flight, shared by every request for the same key.
+
+    Attributes:
+        key (tuple): Cache key of the call.
+        deadline (Deadline | None): The call's own deadline and tag; None for background
+            refreshes, which run with the default budget and are never cancelled.
+        starter (object): Waiter token of the request that started the call.
+        waiters (set): Tokens (request comments) of the requests waiting for it.
+    """
+
+    def __init__(self, key: tuple, deadline: Optional[Deadline], starter: Optional[object]):
+        self.key = key
+        self.deadline = deadline
+        self.starter = starter
+        self.waiters: Set[object] = set() if starter is None else {starter}
+        self.future: Optional[Future] = None
+        self.recorded = False
+        self.cancelled = False
+        self.detached = False
+
+
+def _copy_station(station: dict) -> dict:
+    if "products" not in station:
+        return dict(station)
+    return {**station, "products": [dict(product) for product in station["products"] or []]}
+
+
+def _copy_result(result: Any) -> Any:
+    # Las rutas completan los resultados en el lugar (archivo histórico, orden por precio):
+    # se copian hasta el nivel de producto para no alterar el resultado cacheado
+    if isinstance(result, list):
+        return [_copy_station(item) for item in result]
+    if isinstance(result, dict):
+        return _copy_station(result)
+    return result
+
+
+def _cache_key(method: str, args: tuple) -> tuple:
+    if method in QUERIES:
+        return method, json_util.dumps(normalize_params(method, args))
+    return (method, *args)
+
+
+class ResilientStore(StationStore):
+    """
+    Storage backend wrapper that serves last-known-good results when the backend is slow,
+    failing, or behind an open circuit breaker.
+
+    Attributes:
+        backend (StationStore): The wrapped backend.
+        breaker (CircuitBreaker): The breaker guarding the backend.
+    """
+
+    def __init__(
+        self,
+        backend: StationStore,
+        breaker: Optional[CircuitBreaker] = None,
+        fresh_seconds: float = RESILIENCE_FRESH_SECONDS,
+        stale_while_revalidate_seconds: float = RESILIENCE_STALE_WHILE_REVALIDATE_SECONDS,
+        stale_if_error_seconds: float = RESILIENCE_STALE_IF_ERROR_SECONDS,
+        max_entries: int = RESILIENCE_CACHE_ENTRIES,
+        slow_call_ms: float = RESILIENCE_SLOW_CALL_MS,
+        workers: int = RESILIENCE_WORKERS,
+    ):
+        self.backend = backend
+        self.breaker = breaker or CircuitBreaker()
+        self.fresh_seconds = fresh_seconds
+        self.stale_while_revalidate_seconds = stale_while_revalidate_seconds
+        self.stale_if_error_seconds = stale_if_error_seconds
+        self.max_entries = max_entries
+        self.slow_call_ms = slow_call_ms
+        self._cache: "OrderedDict[tuple, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[tuple, _Call] = {}
+        # Etiqueta de cada petición -> llamada compartida que está esperando
+        self._waiting: Dict[object, _Call] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="resilience")
+
+    def __getattr__(self, name):
+        # Atributos propios del backend (users, explain, ensure_indexes...)
+        return getattr(self.backend, name)
+
+    def _lookup(self, key: tuple) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def _record(self, call: _Call, success: bool) -> None:
+        # Cada llamada cuenta una sola vez, al vencer la espera o al terminar
+        with self._lock:
+            if call.recorded:
+                return
+            call.recorded = True
+        self.breaker.record(success)
+
+    def _run(self, call: _Call, method: str, args: tuple) -> Any:
+        started = time.perf_counter()
+        key = call.key
+        try:
+            with use_deadline(call.deadline):
+                result = getattr(self.backend, method)(*args)
+        except PyMongoError as e:
+            # Agotar el presupuesto que pidió el cliente o ser cancelada al desconectarse
+            # no indica una falla de la base, salvo que además haya sido una llamada lenta
+            by_client = isinstance(e, ExecutionTimeout) or (
+                isinstance(e, OperationFailure) and e.code == INTERRUPTED
+            )
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._record(call, by_client and elapsed_ms < self.slow_call_ms)
+            raise
+        except Exception:
+            # Errores que no son de la base (parámetros inválidos...): el backend respondió
+            self._record(call, True)
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is call:
+                    del self._inflight[key]
+
+        self._record(call, (time.perf_counter() - started) * 1000 < self.slow_call_ms)
+        if method in UNCACHED:
+            return result
+        with self._lock:
+            self._cache[key] = (time.monotonic(), result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+    def _start(
+        self, key: tuple, method: str, args: tuple, waiter: Optional[object] = None
+    ) -> Optional[_Call]:
+        # La llamada compartida corre en un contexto vacío, con etiqueta propia y el plazo que
+        # le queda a la petición que la inicia. Las actualizaciones en segundo plano (sin
+        # waiter) usan el plazo por defecto
+        deadline = None
+        if waiter is not None:
+            request = current_deadline()
+            deadline = Deadline(
+                min(request.remaining_ms(), QUERY_MAX_TIME_MS)
+                if request is not None
+                else ROUTE_TIMEOUTS_MS.get(method, QUERY_MAX_TIME_MS)
+            )
+        with self._lock:
+            call = self._inflight.get(key)
+            if call is None or call.cancelled:
+                if not self.breaker.allow():
+                    return None
+                call = _Call(key, deadline, waiter)
+                self._inflight[key] = call
+                call.future = self._executor.submit(Context().run, self._run, call, method, args)
+            if waiter is not None:
+                call.waiters.add(waiter)
+                self._waiting[waiter] = call
+            return call
+
+    def _leave(self, call: _Call, waiter: object) -> int:
+        # Una petición deja de esperar; si era la última, la llamada ya no sirve a nadie
+        with self._lock:
+            call.waiters.discard(waiter)
+            if self._waiting.get(waiter) is call:
+                del self._waiting[waiter]
+            abandoned = (
+                not call.waiters
+                and call.deadline is not None
+                and not call.detached
+                and not call.cancelled
+                and not call.future.done()
+            )
+            if abandoned:
+                call.cancelled = True
+                if self._inflight.get(call.key) is call:
+                    del self._inflight[call.key]
+        return self.backend.cancel(call.deadline.comment) if abandoned else 0
+
+    def _detach(self, call: _Call) -> None:
+        # Quien espera se lleva el resultado anterior: la llamada sigue, como actualización en
+        # segundo plano, y nadie la cancela
+        with self._lock:
+            call.detached = True
+
+    @staticmethod
+    def _result(call: _Call, deadline: Optional[Deadline], wait_ms: Optional[float] = None) -> Any:
+        # Cada petición espera la llamada compartida como mucho hasta su propio plazo
+        if deadline is not None and (wait_ms is None or deadline.remaining_ms() < wait_ms):
+            try:
+                return call.future.result(timeout=max(deadline.remaining_ms(), 0) / 1000)
+            except FutureTimeoutError:
+                raise DeadlineExceeded(
+                    f"Tiempo límite de la consulta agotado ({deadline.timeout_ms:.0f} ms)"
+                ) from None
+        return call.future.result(timeout=wait_ms / 1000 if wait_ms is not None else None)
+
+    def _call(self, method: str, *args) -> Any:
+        return _copy_result(self._serve(method, args))
+
+    def _serve(self, method: str, args: tuple) -> Any:
+        key = _cache_key(method, args)
+        entry = self._lookup(key) if method not in UNCACHED else None
+        age = time.monotonic() - entry[0] if entry is not None else None
+
+        if age is not None and age < self.fresh_seconds:
+            return entry[1]
+        if age is not None and age < self.fresh_seconds + self.stale_while_revalidate_seconds:
+            self._start(key, method, args)
+            _mark_stale(age, STALE)
+            return entry[1]
+
+        fallback = age is not None and age < self.fresh_seconds + self.stale_if_error_seconds
+        deadline = current_deadline()
+        waiter = deadline.comment if deadline is not None else object()
+        while True:
+            call = self._start(key, method, args, waiter)
+            if call is None:
+                if fallback:
+                    _mark_stale(age, STALE_IF_ERROR)
+                    return entry[1]
+                raise CircuitOpenError(self.breaker.retry_after)
+
+            try:
+                try:
+                    return self._result(call, deadline, self.slow_call_ms)
+                except FutureTimeoutError:
+                    # La demora cuenta como falla ya, sin esperar a que la llamada termine
+                    self._record(call, False)
+                    if not fallback:
+                        return self._result(call, deadline)
+                    self._detach(call)
+            except ExecutionTimeout:
+                # Venció el plazo de la petición que inició la llamada, no el de ésta: se
+                # consulta de nuevo con el propio
+                if self._outlived(call, waiter, deadline):
+                    continue
+                if not fallback:
+                    raise
+            except PyMongoError:
+                if not fallback:
+                    raise
+            finally:
+                self._leave(call, waiter)
+            _mark_stale(time.monotonic() - entry[0], STALE_IF_ERROR)
+            return entry[1]
+
+    @staticmethod
+    def _outlived(call: _Call, waiter: object, deadline: Optional[Deadline]) -> bool:
+        # Una petición sin plazo (herramientas, jobs) no tiene límite propio
+        if call.deadline is None or call.starter == waiter:
+            return False
+        if deadline is None:
+            return True
+        return call.deadline.expires_at < deadline.expires_at and deadline.remaining_ms() > 0
+
+    def find_stations(
+        self, filters: StationFilter, limit: int = 20, window: Optional[HistoryWindow] = None
+    ) -> List[dict]:
+        """Serve from the backend or, if it is unavailable, from the last good result."""
+        return self._call("find_stations", filters, limit, window)
+
+    def get_station(
+        self, station_id: int, filters: StationFilter, window: Optional[HistoryWindow] = None
+    ) -> Optional[dict]:
+        """Serve from the backend or, if it is unavailable, from the last good result."""
+        return self._call("get_station", station_id, filters, window)
+
+    def find_last_prices(self, filters: StationFilter, limit: int = 20) -> List[dict]:
+        """Serve from the backend or, if it is unavailable, from the last good result."""
+        return self._call("find_last_prices", filters, limit)
+
+    def get_station_last_prices(self, station_id: int, filters: StationFilter) -> Optional[dict]:
+        """Serve from the backend or, if it is unavailable, from the last good result."""
+        return self._call("get_station_last_prices", station_id, filters)
+
+    def find_along_route(self, corridor: Corridor, product_id: int) -> List[dict]:
+        """Serve from the backend or, if it is unavailable, from the last good result."""
+        return self._call("find_along_route", corridor, product_id)
+
+    def find_price_index(
+        self,
+        product_id: int,
+        province: Optional[str],
+        flag: Optional[str],
+        date_from: datetime,
+        date_to: datetime,
+    ) -> List[dict]:
+        """Serve from the backend or, if it is unavailable, from the last good result."""
+        return self._call("find_price_index", product_id, province, flag, date_from, date_to)
+
+    def iter_catalog(self, since: Optional[datetime] = None) -> Iterable[dict]:
+        """Delegate to the backend (background job, not a request)."""
+        return self.backend.iter_catalog(since)
+
+    def find_changes(
+        self,
+        since: Optional[datetime] = None,
+        after_station_id: Optional[int] = None,
+        limit: int = 500,
+    ) -> List[dict]:
+        """Serve from the backend or, if it is unavailable, from the last good result."""
+        return self._call("find_changes", since, after_station_id, limit)
+
+    def docs_examined(self, pipeline: List[dict]) -> Optional[int]:
+        """Delegate to the backend."""
+        return self.backend.docs_examined(pipeline)
+
+    def cancel(self, comment: str) -> int:
+        """
+        Stop a request's query after its client disconnected.
+
+        A request served through a shared call stops waiting for it; the call itself runs
+        under its own tag and is killed only if no other request is still waiting for it.
+
+        Args:
+            comment (str): The request's tag.
+
+        Returns:
+            int: Number of operations stopped.
+        """
+        with self._lock:
+            call = self._waiting.get(comment)
+        if call is None:
+            return self.backend.cancel(comment)
+        return self._leave(call, comment)
@@ -0,0 +1,173 @@
+"""
+search.py
+
+In-process trigram index for fuzzy and autocomplete search over stations.
+
+Text is normalized (lowercase, accents stripped, punctuation removed) and split into
+padded character trigrams, so partial, misspelled and accent-less queries ("cordoba",
+"ypf av colon") still match. Candidates are gathered from the posting lists of the query
+trigrams only, which keeps lookups in the millisecond range for the national dataset.
+"""
+
+import heapq
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+SEARCH_FIELDS = ("stationName", "address", "town", "flag")
+SUMMARY_FIELDS = ("stationId", "stationName", "address", "town", "province", "flag", "flagId")
+MIN_SCORE = 0.3
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercase a string, strip accents and replace punctuation with spaces.
+
+    Args:
+        text (str): The text to normalize.
+
+    Returns:
+        str: The normalized text.
+    """
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return _NON_ALNUM.sub(" ", stripped.lower()).strip()
+
+
+def trigrams(token: str) -> Set[str]:
+    """
+    Return the padded trigrams of a token (two leading blanks, one trailing blank).
+
+    The leading padding makes short prefixes such as "yp" produce trigrams that also
+    appear in "ypf", which is what makes autocomplete work.
+
+    Args:
+        token (str): A normalized token.
+
+    Returns:
+        set: The token's trigrams.
+    """
+    padded = f"  {token} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class StationSearchIndex:
+    """
+    Trigram index over station name, address, town and flag.
+
+    The index is safe to query while it is being refreshed from another thread.
+
+    Attributes:
+        size (int): Number of indexed stations.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Set[int]] = {}
+        self._grams: Dict[int, Set[str]] = {}
+        self._prefixes: Dict[int, Set[str]] = {}
+        self._provinces: Dict[int, str] = {}
+        self._summaries: Dict[int, dict] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self._summaries)
+
+    def upsert(self, station: dict) -> None:
+        """
+        Add a station to the index or replace its previous entry.
+
+        Args:
+            station (dict): A station document (only the searchable fields are used).
+        """
+        station_id = station["stationId"]
+        tokens = normalize(" ".join(str(station.get(field) or "") for field in SEARCH_FIELDS))
+        tokens = tokens.split()
+        grams = set().union(*(trigrams(token) for token in tokens)) if tokens else set()
+
+        with self._lock:
+            self._remove_postings(station_id)
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(station_id)
+            self._grams[station_id] = grams
+            self._prefixes[station_id] = {
+                token[:length] for token in tokens for length in range(1, len(token) + 1)
+            }
+            self._provinces[station_id] = normalize(station.get("province"))
+            self._summaries[station_id] = {field: station.get(field) for field in SUMMARY_FIELDS}
+
+    def remove_station(self, station_id: int) -> None:
+        """
+        Remove a deleted station from the index, if present.
+
+        Args:
+            station_id (int): The unique ID of the station.
+        """
+        with self._lock:
+            self._remove_postings(station_id)
+            self._prefixes.pop(station_id, None)
+            self._provinces.pop(station_id, None)
+            self._summaries.pop(station_id, None)
+
+    def _remove_postings(self, station_id: int) -> None:
+        for gram in self._grams.pop(station_id, ()):
+            posting = self._postings.get(gram)
+            if posting is not None:
+                posting.discard(station_id)
+                if not posting:
+                    del self._postings[gram]
+
+    def search(
+        self, query: str, limit: int = 10, province: Optional[str] = None
+    ) -> List[Tuple[float, dict]]:
+        """
+        Return the best matching stations for a free-text query.
+
+        Stations are ranked by the share of query trigrams they contain; stations whose
+        words start with every query word (autocomplete) rank first among equal scores.
+
+        Args:
+            query (str): Free text typed by the user.
+            limit (int): Maximum number of results.
+            province (str, optional): Only return stations in this province (accent- and
+                case-insensitive).
+
+        Returns:
+            list: ``(score, station summary)`` pairs, best first.
+        """
+        tokens = normalize(query).split()
+        if not tokens:
+            return []
+        grams = set().union(*(trigrams(token) for token in tokens))
+        wanted_province = normalize(province) if province else None
+
+        with self._lock:
+            hits = Counter()
+            for gram in grams:
+                posting = self._postings.get(gram)
+                if posting:
+                    hits.update(posting)
+
+            # Sólo se evalúan los niveles de puntaje que pueden entrar en el resultado
+            needed = MIN_SCORE * len(grams)
+            candidates = sorted(
+                ((count, station_id) for station_id, count in hits.items() if count >= needed),
+                reverse=True,
+            )
+            ranked = []
+            for count, station_id in candidates:
+                if len(ranked) >= limit and count < ranked[limit - 1][0]:
+                    break
+                summary = self._summaries[station_id]
+                if wanted_province and self._provinces[station_id] != wanted_province:
+                    continue
+                prefixes = self._prefixes[station_id]
+                prefixed = sum(token in prefixes for token in tokens)
+                ranked.append((count, prefixed, -station_id, summary))
+
+        best = heapq.nlargest(limit, ranked, key=lambda item: item[:3])
+        return [(round(count / len(grams), 3), dict(summary)) for count, _, _, summary in best]
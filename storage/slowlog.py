@@ -0,0 +1,400 @@
+"""
+slowlog.py
+
+Sampled capture of slow station queries.
+
+``SlowQueryStore`` wraps any storage backend and times every route query. Queries slower
+than ``SLOW_QUERY_MS`` are sampled at ``SLOW_QUERY_SAMPLE_RATE`` and appended as JSON lines
+to a size-rotated local file, with the route, the normalized parameters and the compiled
+pipeline. Entries can be replayed against any backend with ``python -m tools.replay_slowlog``.
+
+Counting the documents a query examined means running it again under ``explain``, which
+adds load exactly when the database is already slow, so at most
+``SLOW_QUERY_EXPLAIN_PER_MINUTE`` entries per minute (6 by default) are explained and the
+rest carry ``docsExamined: null``. Entries are written by a single worker from a bounded
+queue; when the queue is full new entries are dropped and counted.
+"""
+
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Iterable, Iterator, List, Optional
+
+from bson import json_util
+from dotenv import load_dotenv
+
+from models.filters import HistoryWindow, StationFilter
+from storage.base import StationStore
+from storage.geo import Corridor
+from storage.compiler import (
+    compile_along_route,
+    compile_changes,
+    compile_last_prices,
+    compile_station,
+    compile_station_last_prices,
+    compile_stations,
+)
+
+load_dotenv()
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", "0.1"))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "logs/slow_queries.jsonl")
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv("SLOW_QUERY_LOG_BACKUPS", "5"))
+SLOW_QUERY_QUEUE_SIZE = int(os.getenv("SLOW_QUERY_QUEUE_SIZE", "1000"))
+SLOW_QUERY_EXPLAIN_PER_MINUTE = float(os.getenv("SLOW_QUERY_EXPLAIN_PER_MINUTE", "6"))
+
+# Método del backend -> (ruta, compilador con los mismos argumentos)
+QUERIES = {
+    "find_stations": ("/stations", compile_stations),
+    "get_station": ("/stations/{station_id}", compile_station),
+    "find_last_prices": ("/last-prices", compile_last_prices),
+    "get_station_last_prices": ("/last-prices/{station_id}", compile_station_last_prices),
+    "find_changes": ("/changes", compile_changes),
+    "find_along_route": ("/stations/along-route", compile_along_route),
+}
+
+
+def _window_params(window: list) -> dict:
+    # Ventana de historial como parámetros history_* (ausente = historial completo)
+    if not window or window[0] is None:
+        return {}
+    return {
+        f"history_{key}": value for key, value in window[0].model_dump(exclude_none=True).items()
+    }
+
+
+def normalize_params(method: str, args: tuple) -> dict:
+    """
+    Turn the arguments of a backend query into a flat, JSON-friendly parameter dict.
+
+    Unset filters are dropped and keys are sorted, so equal filter combinations produce
+    equal entries.
+
+    Args:
+        method (str): Name of the backend method (a key of ``QUERIES``).
+        args (tuple): Positional arguments of the call.
+
+    Returns:
+        dict: The normalized parameters.
+    """
+    if method in ("find_stations", "find_last_prices"):
+        filters, limit, *window = args
+        params = {**filters.model_dump(exclude_none=True), "limit": limit}
+        params.update(_window_params(window))
+    elif method in ("get_station", "get_station_last_prices"):
+        station_id, filters, *window = args
+        params = {**filters.model_dump(exclude_none=True), "station_id": station_id}
+        params.update(_window_params(window))
+    elif method == "find_along_route":
+        corridor, product_id = args
+        params = {"route": corridor.route, "width_km": corridor.width_km, "product_id": product_id}
+    else:
+        since, after_station_id, limit = args
+        params = {"since": since, "after_station_id": after_station_id, "limit": limit}
+        params = {key: value for key, value in params.items() if value is not None}
+    return dict(sorted(params.items()))
+
+
+def query_args(method: str, params: dict) -> tuple:
+    """
+    Rebuild the positional arguments of a backend query from its normalized parameters.
+
+    Inverse of :func:`normalize_params`.
+
+    Args:
+        method (str): Name of the backend method.
+        params (dict): The normalized parameters.
+
+    Returns:
+        tuple: Arguments for ``getattr(store, method)``.
+    """
+    params = dict(params)
+    window = {
+        key[len("history_") :]: params.pop(key)
+        for key in list(params)
+        if key.startswith("history_")
+    }
+    window_args = (HistoryWindow(**window),) if window else ()
+    if method in ("find_stations", "find_last_prices"):
+        limit = params.pop("limit")
+        return (StationFilter(**params), limit) + window_args
+    if method in ("get_station", "get_station_last_prices"):
+        station_id = params.pop("station_id")
+        return (station_id, StationFilter(**params)) + window_args
+    if method == "find_along_route":
+        return Corridor(params["route"], params["width_km"]), params["product_id"]
+    return params.get("since"), params.get("after_station_id"), params["limit"]
+
+
+def read_entries(path: str) -> Iterator[dict]:
+    """
+    Yield the entries of a slow-query log file.
+
+    Args:
+        path (str): Path of a log file (current or rotated).
+
+    Yields:
+        dict: Entries with dates and regular expressions decoded back to Python objects.
+    """
+    with open(path, encoding="utf-8") as log_file:
+        for line in log_file:
+            if line.strip():
+                yield json_util.loads(line)
+
+
+class SlowQueryLog:
+    """
+    Writes slow-query entries to a rotating JSON-lines file.
+
+    Entries are written by a single background worker, so the request only pays for the
+    timing, the sampling decision and a non-blocking put on a bounded queue. The
+    ``explain`` that counts examined documents also runs there, at most
+    ``explain_per_minute`` times per minute.
+
+    Attributes:
+        threshold_ms (float): Queries at or above this duration are candidates; 0 disables
+            the capture.
+        sample_rate (float): Fraction of candidates that are written.
+        explain_per_minute (float): Maximum rate of ``explain`` calls; entries beyond it, or
+            every entry if 0, carry ``docsExamined: null``.
+        path (str): Path of the current log file.
+        dropped (int): Entries discarded because the queue was full.
+    """
+
+    def __init__(
+        self,
+        path: str = SLOW_QUERY_LOG,
+        threshold_ms: float = SLOW_QUERY_MS,
+        sample_rate: float = SLOW_QUERY_SAMPLE_RATE,
+        max_bytes: int = SLOW_QUERY_LOG_MAX_BYTES,
+        backups: int = SLOW_QUERY_LOG_BACKUPS,
+        queue_size: int = SLOW_QUERY_QUEUE_SIZE,
+        explain_per_minute: float = SLOW_QUERY_EXPLAIN_PER_MINUTE,
+    ):
+        self.path = path
+        self.threshold_ms = threshold_ms
+        self.sample_rate = sample_rate
+        self.explain_per_minute = explain_per_minute
+        self.dropped = 0
+        self._max_bytes = max_bytes
+        self._backups = backups
+        self._logger: Optional[logging.Logger] = None
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._worker: Optional[threading.Thread] = None
+        self._next_explain = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        """True if slow queries are being captured."""
+        return self.threshold_ms > 0 and self.sample_rate > 0
+
+    def _get_logger(self) -> logging.Logger:
+        # El archivo se abre recién con la primera consulta lenta
+        with self._lock:
+            if self._logger is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                handler = RotatingFileHandler(
+                    self.path,
+                    maxBytes=self._max_bytes,
+                    backupCount=self._backups,
+                    encoding="utf-8",
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                logger = logging.getLogger(f"{__name__}.{id(self)}")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+                self._logger = logger
+            return self._logger
+
+    def should_capture(self, duration_ms: float) -> bool:
+        """
+        Decide whether a query of the given duration is logged.
+
+        Args:
+            duration_ms (float): Duration of the query in milliseconds.
+
+        Returns:
+            bool: True if the query is slow and was sampled.
+        """
+        return (
+            self.enabled and duration_ms >= self.threshold_ms and random.random() < self.sample_rate
+        )
+
+    def submit(
+        self, store: StationStore, method: str, args: tuple, duration_ms: float, error=None
+    ) -> None:
+        """
+        Queue a captured query to be written in the background.
+
+        Never blocks: if the worker is behind and the queue is full, the entry is dropped.
+
+        Args:
+            store (StationStore): The backend that ran the query.
+            method (str): Name of the backend method.
+            args (tuple): Positional arguments of the call.
+            duration_ms (float): Duration of the query in milliseconds.
+            error (Exception, optional): The error the query raised, if any.
+        """
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="slowlog", daemon=True)
+                self._worker.start()
+        try:
+            self._queue.put_nowait((store, method, args, duration_ms, error))
+        except queue.Full:
+            self.dropped += 1
+
+    def join(self) -> None:
+        """Wait until every queued entry has been written."""
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    def _may_explain(self) -> bool:
+        # Como mucho explain_per_minute re-ejecuciones por minuto (sólo desde el worker)
+        if self.explain_per_minute <= 0:
+            return False
+        now = time.monotonic()
+        if now < self._next_explain:
+            return False
+        self._next_explain = now + 60 / self.explain_per_minute
+        return True
+
+    def _write(self, store, method, args, duration_ms, error) -> None:
+        route, compile_query = QUERIES[method]
+        pipeline = compile_query(*args)
+        docs_examined = None
+        if self._may_explain():
+            try:
+                docs_examined = store.docs_examined(pipeline)
+            except Exception:
+                pass
+
+        entry = {
+            "at": datetime.now(timezone.utc),
+            "route": route,
+            "method": method,
+            "backend": type(store).__name__,
+            "params": normalize_params(method, args),
+            "durationMs": round(duration_ms, 3),
+            "docsExamined": docs_examined,
+            "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "pipeline": pipeline,
+        }
+        try:
+            self._get_logger().info(
+                json_util.dumps(entry, json_options=json_util.RELAXED_JSON_OPTIONS)
+            )
+        except Exception as e:
+            print(f"Error writing slow query log: {e}")
+
+
+class SlowQueryStore(StationStore):
+    """
+    Storage backend wrapper that captures slow route queries.
+
+    Every route query is delegated to the wrapped backend and timed; the catalog scan is
+    delegated untouched since it is a background job, not a request.
+
+    Attributes:
+        backend (StationStore): The wrapped backend.
+        log (SlowQueryLog): Where slow queries are written.
+    """
+
+    def __init__(self, backend: StationStore, log: Optional[SlowQueryLog] = None):
+        self.backend = backend
+        self.log = log or SlowQueryLog()
+
+    def __getattr__(self, name):
+        # Atributos propios del backend (users, explain, ensure_indexes...)
+        return getattr(self.backend, name)
+
+    def _timed(self, method: str, *args):
+        if not self.log.enabled:
+            return getattr(self.backend, method)(*args)
+
+        started = time.perf_counter()
+        try:
+            result = getattr(self.backend, method)(*args)
+        except Exception as e:
+            duration_ms = (time.perf_counter() - started) * 1000
+            if self.log.should_capture(duration_ms):
+                self.log.submit(self.backend, method, args, duration_ms, error=e)
+            raise
+        duration_ms = (time.perf_counter() - started) * 1000
+        if self.log.should_capture(duration_ms):
+            self.log.submit(self.backend, method, args, duration_ms)
+        return result
+
+    def find_stations(
+        self, filters: StationFilter, limit: int = 20, window: Optional[HistoryWindow] = None
+    ) -> List[dict]:
+        """Delegate to the backend, capturing the query if slow."""
+        return self._timed("find_stations", filters, limit, window)
+
+    def get_station(
+        self, station_id: int, filters: StationFilter, window: Optional[HistoryWindow] = None
+    ) -> Optional[dict]:
+        """Delegate to the backend, capturing the query if slow."""
+        return self._timed("get_station", station_id, filters, window)
+
+    def find_last_prices(self, filters: StationFilter, limit: int = 20) -> List[dict]:
+        """Delegate to the backend, capturing the query if slow."""
+        return self._timed("find_last_prices", filters, limit)
+
+    def get_station_last_prices(self, station_id: int, filters: StationFilter) -> Optional[dict]:
+        """Delegate to the backend, capturing the query if slow."""
+        return self._timed("get_station_last_prices", station_id, filters)
+
+    def find_along_route(self, corridor: Corridor, product_id: int) -> List[dict]:
+        """Delegate to the backend, capturing the query if slow."""
+        return self._timed("find_along_route", corridor, product_id)
+
+    def find_price_index(
+        self,
+        product_id: int,
+        province: Optional[str],
+        flag: Optional[str],
+        date_from: datetime,
+        date_to: datetime,
+    ) -> List[dict]:
+        """Delegate to the backend (reads a materialized collection, never slow)."""
+        return self.backend.find_price_index(product_id, province, flag, date_from, date_to)
+
+    def iter_catalog(self, since: Optional[datetime] = None) -> Iterable[dict]:
+        """Delegate to the backend."""
+        return self.backend.iter_catalog(since)
+
+    def find_changes(
+        self,
+        since: Optional[datetime] = None,
+        after_station_id: Optional[int] = None,
+        limit: int = 500,
+    ) -> List[dict]:
+        """Delegate to the backend, capturing the query if slow."""
+        return self._timed("find_changes", since, after_station_id, limit)
+
+    def docs_examined(self, pipeline: List[dict]) -> Optional[int]:
+        """Delegate to the backend."""
+        return self.backend.docs_examined(pipeline)
+
+    def cancel(self, comment: str) -> int:
+        """Delegate to the backend."""
+        return self.backend.cancel(comment)
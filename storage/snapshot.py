@@ -0,0 +1,433 @@
+"""
+snapshot.py
+
+In-memory storage backend loaded from a versioned snapshot file.
+
+Lets the API run without MongoDB (edge deployments, CI, local benchmarking). A snapshot is a
+gzip-compressed stream of BSON documents: a header followed by one record per document, so
+ObjectIds and dates round-trip exactly and responses match the MongoDB backend.
+"""
+
+import bisect
+import gzip
+import math
+import operator
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import bson
+from bson import ObjectId
+from pymongo.results import DeleteResult, InsertOneResult
+
+from models.filters import HistoryWindow, StationFilter
+from storage.base import StationStore
+from storage.compiler import STATION_FIELDS
+from storage.geo import Corridor
+from storage.price_index import day_of, groups_from_stations, index_points, scope_key
+
+SNAPSHOT_FORMAT = "precio-nafta-snapshot"
+SNAPSHOT_VERSION = 1
+GRID_DEGREES = 0.25  # Celdas del índice espacial (~25 km)
+COMPARISONS = {"$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le}
+
+
+class MemoryCollection:
+    """
+    Minimal in-memory stand-in for a pymongo collection.
+
+    Supports the lookups, inserts and deletes the API performs on small collections
+    (e.g. users, price alerts) when running without MongoDB: equality filters, ``$gt``,
+    ``$gte``, ``$lt`` and ``$lte`` comparisons, ``$or`` and a sort on one or more fields.
+
+    Attributes:
+        documents (list): The stored documents, in insertion order.
+    """
+
+    def __init__(self, documents: Optional[Iterable[dict]] = None):
+        self.documents = list(documents or [])
+
+    @classmethod
+    def _matches(cls, document: dict, filter: Optional[dict]) -> bool:
+        for key, value in (filter or {}).items():
+            if key == "$or":
+                if not any(cls._matches(document, branch) for branch in value):
+                    return False
+            elif isinstance(value, dict):
+                field = document.get(key)
+                for comparison, operand in value.items():
+                    if field is None or not COMPARISONS[comparison](field, operand):
+                        return False
+            elif document.get(key) != value:
+                return False
+        return True
+
+    def find(
+        self,
+        filter: Optional[dict] = None,
+        sort: Optional[List[Tuple[str, int]]] = None,
+        limit: int = 0,
+    ) -> List[dict]:
+        """Return the documents matching the filter, optionally sorted."""
+        documents = [doc for doc in self.documents if self._matches(doc, filter)]
+        # Ordenamientos estables, del último campo al primero
+        for field, direction in reversed(sort or []):
+            documents.sort(key=lambda doc: doc.get(field), reverse=direction < 0)
+        return documents[:limit] if limit else documents
+
+    def find_one(self, filter: Optional[dict] = None) -> Optional[dict]:
+        """Return the first document whose fields equal the given filter values."""
+        return next((doc for doc in self.documents if self._matches(doc, filter)), None)
+
+    def count_documents(self, filter: dict) -> int:
+        """Return the number of documents matching the filter."""
+        return sum(1 for doc in self.documents if self._matches(doc, filter))
+
+    def insert_one(self, document: dict) -> InsertOneResult:
+        """Store a document, assigning an ObjectId if it has none."""
+        document.setdefault("_id", ObjectId())
+        self.documents.append(document)
+        return InsertOneResult(document["_id"], acknowledged=True)
+
+    def insert_many(self, documents: Iterable[dict], ordered: bool = True) -> None:
+        """Store several documents, skipping those whose ``_id`` is already stored."""
+        stored = {doc["_id"] for doc in self.documents}
+        for document in documents:
+            if document.get("_id") not in stored:
+                self.insert_one(document)
+                stored.add(document["_id"])
+
+    def delete_one(self, filter: dict) -> DeleteResult:
+        """Delete the first document matching the filter."""
+        for position, document in enumerate(self.documents):
+            if self._matches(document, filter):
+                del self.documents[position]
+                return DeleteResult({"n": 1}, acknowledged=True)
+        return DeleteResult({"n": 0}, acknowledged=True)
+
+
+def write_snapshot(stations_collection, path: str, users_collection=None) -> Dict[str, int]:
+    """
+    Dump the live collections into a snapshot file.
+
+    The file is written under a temporary name and renamed at the end, so a running server
+    never sees a partial snapshot.
+
+    Args:
+        stations_collection: The pymongo collection holding station documents.
+        path (str): Destination file (conventionally ``*.bson.gz``).
+        users_collection: Optional users collection to include, so authentication also
+            works offline.
+
+    Returns:
+        dict: Number of documents written per collection.
+    """
+    counts = {"stations": 0, "users": 0}
+    sources = [("stations", stations_collection)]
+    if users_collection is not None:
+        sources.append(("users", users_collection))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wb") as fh:
+        header = {
+            "format": SNAPSHOT_FORMAT,
+            "version": SNAPSHOT_VERSION,
+            "createdAt": datetime.utcnow(),
+        }
+        fh.write(bson.encode(header))
+        for name, collection in sources:
+            for document in collection.find({}, batch_size=1000):
+                fh.write(bson.encode({"collection": name, "document": document}))
+                counts[name] += 1
+    os.replace(tmp_path, path)
+    return counts
+
+
+class SnapshotStationStore(StationStore):
+    """
+    Station storage served from memory.
+
+    Stations are kept in their original (natural) order, with a primary index on
+    ``stationId`` and inverted indexes on the filterable fields. Regex filters are evaluated
+    once per distinct value (a few dozen provinces, a few thousand towns) instead of once
+    per station.
+
+    Attributes:
+        header (dict): The snapshot header (format, version, creation date).
+        stations (list): Station documents in natural order.
+        users (MemoryCollection): User accounts included in the snapshot, if any.
+    """
+
+    def __init__(
+        self,
+        stations: List[dict],
+        users: Optional[List[dict]] = None,
+        header: Optional[dict] = None,
+    ):
+        self.header = header or {}
+        self.stations = stations
+        self.users = MemoryCollection(users)
+
+        self._by_station_id: Dict[int, int] = {}
+        self._by_field: Dict[str, Dict[str, List[int]]] = {"province": {}, "town": {}, "flag": {}}
+        self._by_flag_id: Dict[int, List[int]] = {}
+        self._by_cell: Dict[Tuple[int, int], List[int]] = {}
+        for position, station in enumerate(stations):
+            self._by_station_id.setdefault(station["stationId"], position)
+            for field, index in self._by_field.items():
+                value = station.get(field)
+                if isinstance(value, str):
+                    index.setdefault(value, []).append(position)
+            self._by_flag_id.setdefault(station.get("flagId"), []).append(position)
+            coordinates = (station.get("geometry") or {}).get("coordinates") or []
+            if len(coordinates) >= 2 and None not in coordinates[:2]:
+                self._by_cell.setdefault(self._cell(*coordinates[:2]), []).append(position)
+
+        # Índice de precios diario: se calcula con la primera consulta
+        self._price_index: Optional[Dict[tuple, Tuple[List[datetime], List[dict]]]] = None
+        self._price_index_lock = threading.Lock()
+
+        # Índice ordenado por (updatedAt, stationId) para la sincronización incremental
+        self._by_update = sorted(
+            (station["updatedAt"], station["stationId"], position)
+            for position, station in enumerate(stations)
+            if isinstance(station.get("updatedAt"), datetime)
+        )
+
+    @staticmethod
+    def _cell(lon: float, lat: float) -> Tuple[int, int]:
+        return math.floor(lon / GRID_DEGREES), math.floor(lat / GRID_DEGREES)
+
+    @classmethod
+    def load(cls, path: str) -> "SnapshotStationStore":
+        """
+        Load a snapshot file written by :func:`write_snapshot`.
+
+        Args:
+            path (str): Path of the snapshot file.
+
+        Returns:
+            SnapshotStationStore: A store serving the snapshot contents.
+
+        Raises:
+            ValueError: If the file is not a snapshot or has an unsupported version.
+        """
+        stations, users = [], []
+        with gzip.open(path, "rb") as fh:
+            records = bson.decode_file_iter(fh)
+            header = next(records, None)
+            if not header or header.get("format") != SNAPSHOT_FORMAT:
+                raise ValueError(f"{path} no es un snapshot de estaciones")
+            if header.get("version") != SNAPSHOT_VERSION:
+                raise ValueError(
+                    f"Versión de snapshot no soportada: {header.get('version')} "
+                    f"(se esperaba {SNAPSHOT_VERSION})"
+                )
+            for record in records:
+                target = stations if record["collection"] == "stations" else users
+                target.append(record["document"])
+        return cls(stations, users=users, header=header)
+
+    def _candidates(self, filters: StationFilter) -> Iterable[int]:
+        """Return the positions of stations matching the station-level filters, in order."""
+        matches = []
+        for field in ("province", "town", "flag"):
+            pattern = getattr(filters, field)
+            if pattern:
+                regex = re.compile(pattern, re.IGNORECASE)
+                positions = set()
+                for value, posting in self._by_field[field].items():
+                    if regex.search(value):
+                        positions.update(posting)
+                matches.append(positions)
+        if filters.flag_id is not None:
+            matches.append(set(self._by_flag_id.get(filters.flag_id, ())))
+
+        if not matches:
+            return range(len(self.stations))
+        return sorted(set.intersection(*matches))
+
+    @staticmethod
+    def _filter_products(station: dict, filters: StationFilter) -> List[dict]:
+        regex = re.compile(filters.product, re.IGNORECASE) if filters.product else None
+        return [
+            item
+            for item in station.get("products") or []
+            if (regex is None or regex.search(item.get("productName") or ""))
+            and (filters.product_id is None or item.get("productId") == filters.product_id)
+        ]
+
+    @staticmethod
+    def _windowed(products: List[dict], window: Optional[HistoryWindow]) -> List[dict]:
+        """Copy the products, trimming their histories to the window (if any)."""
+        if window is None:
+            return [dict(item) for item in products]
+        return [{**item, "prices": window.trim(item.get("prices") or [])} for item in products]
+
+    @staticmethod
+    def _latest_products(products: List[dict], drop_unpriced: bool = True) -> List[dict]:
+        """Replace each product's history with its latest dated price (ties: last one)."""
+        result = []
+        for item in products:
+            latest = None
+            for price in item.get("prices") or []:
+                if price.get("date") is not None and (
+                    latest is None or price["date"] >= latest["date"]
+                ):
+                    latest = price
+            if latest is None and drop_unpriced:
+                continue
+            result.append(
+                {
+                    "productId": item.get("productId"),
+                    "productName": item.get("productName"),
+                    "prices": [latest] if latest is not None else [],
+                }
+            )
+        return result
+
+    @staticmethod
+    def _document(station: dict, products: List[dict], *extra_fields: str) -> dict:
+        document = {"_id": station["_id"]}
+        document.update({field: station.get(field) for field in STATION_FIELDS + extra_fields})
+        document["products"] = products
+        return document
+
+    def find_stations(
+        self, filters: StationFilter, limit: int = 20, window: Optional[HistoryWindow] = None
+    ) -> List[dict]:
+        """Return stations matching the filters with their price history."""
+        result = []
+        for position in self._candidates(filters):
+            station = self.stations[position]
+            products = self._filter_products(station, filters)
+            if products:
+                result.append(self._document(station, self._windowed(products, window)))
+                if len(result) >= limit:
+                    break
+        return result
+
+    def get_station(
+        self, station_id: int, filters: StationFilter, window: Optional[HistoryWindow] = None
+    ) -> Optional[dict]:
+        """Return a single station, keeping only the products that match the filters."""
+        position = self._by_station_id.get(station_id)
+        if position is None:
+            return None
+
+        station = self.stations[position]
+        products = self._filter_products(station, filters)
+        return self._document(station, self._windowed(products, window))
+
+    def find_last_prices(self, filters: StationFilter, limit: int = 20) -> List[dict]:
+        """Return stations matching the filters with the latest price of each product."""
+        candidates = sorted(
+            self._candidates(filters),
+            key=lambda position: self.stations[position]["stationId"],
+        )
+        result = []
+        for position in candidates:
+            station = self.stations[position]
+            products = self._latest_products(self._filter_products(station, filters))
+            if products:
+                result.append(self._document(station, products))
+                if len(result) >= limit:
+                    break
+        return result
+
+    def get_station_last_prices(self, station_id: int, filters: StationFilter) -> Optional[dict]:
+        """Return a single station with the latest price of each matching product."""
+        position = self._by_station_id.get(station_id)
+        if position is None:
+            return None
+
+        station = self.stations[position]
+        products = self._latest_products(self._filter_products(station, filters))
+        return self._document(station, products) if products else None
+
+    def find_along_route(self, corridor: Corridor, product_id: int) -> List[dict]:
+        """Return stations inside a route corridor with the latest price of a product."""
+        # Posición de cada estación candidata -> tramos de la ruta cuyo entorno la contiene
+        candidates: Dict[int, Set[int]] = {}
+        for segment, (west, south, east, north) in enumerate(corridor.segment_bounds()):
+            min_x, min_y = self._cell(west, south)
+            max_x, max_y = self._cell(east, north)
+            for x in range(min_x, max_x + 1):
+                for y in range(min_y, max_y + 1):
+                    for position in self._by_cell.get((x, y), ()):
+                        candidates.setdefault(position, set()).add(segment)
+
+        filters = StationFilter(product_id=product_id)
+        documents = []
+        segments = {}
+        for position, station_segments in candidates.items():
+            station = self.stations[position]
+            products = self._latest_products(self._filter_products(station, filters))
+            if products:
+                documents.append(self._document(station, products))
+                segments[station["stationId"]] = sorted(station_segments)
+        return corridor.place(documents, segments)
+
+    def _build_price_index(self) -> Dict[tuple, Tuple[List[datetime], List[dict]]]:
+        with self._price_index_lock:
+            if self._price_index is None:
+                series: Dict[tuple, List[dict]] = {}
+                for product_id, groups in groups_from_stations(self.stations):
+                    for point in index_points(product_id, groups):
+                        key = (product_id, point.pop("provinceKey"), point.pop("flagKey"))
+                        series.setdefault(key, []).append(point)
+                self._price_index = {}
+                for key, points in series.items():
+                    points.sort(key=lambda point: point["day"])
+                    self._price_index[key] = ([point["day"] for point in points], points)
+            return self._price_index
+
+    def find_price_index(
+        self,
+        product_id: int,
+        province: Optional[str],
+        flag: Optional[str],
+        date_from: datetime,
+        date_to: datetime,
+    ) -> List[dict]:
+        """Return the daily price index of a product, computed from the snapshot."""
+        days, points = self._build_price_index().get(
+            (product_id, scope_key(province), scope_key(flag)), ([], [])
+        )
+        start = bisect.bisect_left(days, day_of(date_from))
+        end = bisect.bisect_right(days, day_of(date_to))
+        return points[start:end]
+
+    def _catalog_document(self, station: dict) -> dict:
+        products = self._latest_products(station.get("products") or [], drop_unpriced=False)
+        return self._document(station, products, "updatedAt")
+
+    def iter_catalog(self, since: Optional[datetime] = None) -> Iterable[dict]:
+        """Yield every station with the latest price of each product, without the history."""
+        for station in self.stations:
+            updated_at = station.get("updatedAt")
+            if since is not None and (updated_at is None or updated_at < since):
+                continue
+            yield self._catalog_document(station)
+
+    def find_changes(
+        self,
+        since: Optional[datetime] = None,
+        after_station_id: Optional[int] = None,
+        limit: int = 500,
+    ) -> List[dict]:
+        """Return catalog documents changed after a sync position, oldest change first."""
+        if since is None:
+            start = 0
+        elif after_station_id is None:
+            start = bisect.bisect_right(self._by_update, (since, float("inf")))
+        else:
+            start = bisect.bisect_right(self._by_update, (since, after_station_id, float("inf")))
+
+        return [
+            self._catalog_document(self.stations[position])
+            for _, _, position in self._by_update[start : start + limit]
+        ]
@@ -0,0 +1,229 @@
+"""
+tiles.py
+
+Precomputed tile pyramid with server-side clustering for map clients.
+
+Every zoom level up to ``TILE_CLUSTER_MAX_ZOOM`` keeps stations bucketed by tile and, inside
+each tile, by an 8x8 grid of clustering cells. A tile response is either one feature per
+non-empty cell (a cluster with its count and minimum latest prices, or the station itself
+when the cell holds a single one) or, at deep zooms, the individual stations. Responses for
+zoom levels of the pyramid and known products are kept in a bounded LRU cache and reused
+until a station in that tile changes; deeper tiles are cheap to cut from their source tile
+and are not cached, so clients cannot grow the cache with arbitrary requests.
+"""
+
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from storage.geo import tile_for
+
+load_dotenv()
+
+TILE_CLUSTER_MAX_ZOOM = int(os.getenv("TILE_CLUSTER_MAX_ZOOM", "13"))
+TILE_CACHE_ENTRIES = int(os.getenv("TILE_CACHE_ENTRIES", "10000"))
+CELL_BITS = 3  # 2**3 x 2**3 celdas de agrupamiento por tile
+
+TileKey = Tuple[int, int, int]
+
+
+class TilePyramid:
+    """
+    In-process spatial index of stations organized as a tile pyramid.
+
+    Attributes:
+        max_zoom (int): From this zoom level on, tiles list individual stations.
+        epoch (str): Identifies this process' pyramid, so tile versions are not confused
+            across restarts.
+    """
+
+    def __init__(self, max_zoom: int = TILE_CLUSTER_MAX_ZOOM):
+        self.max_zoom = max_zoom
+        self.epoch = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._points: Dict[int, dict] = {}
+        # _levels[z][(x, y)][(celda_x, celda_y)] -> stationIds
+        self._levels: List[Dict[Tuple[int, int], Dict[Tuple[int, int], Set[int]]]] = [
+            {} for _ in range(max_zoom + 1)
+        ]
+        self._versions: Dict[TileKey, int] = {}
+        # Estaciones con precio de cada producto, para no cachear productos inexistentes
+        self._products: Dict[int, int] = {}
+        # (z, x, y, producto) -> (versión del tile de origen, respuesta), del menos usado al más
+        self._responses: "OrderedDict[Tuple[int, int, int, Optional[int]], Tuple[int, dict]]" = (
+            OrderedDict()
+        )
+
+    @staticmethod
+    def _point(station: dict) -> Optional[dict]:
+        coordinates = (station.get("geometry") or {}).get("coordinates") or []
+        if len(coordinates) < 2 or None in coordinates[:2]:
+            return None
+        prices = {}
+        for item in station.get("products") or []:
+            if item.get("prices"):
+                prices[item["productId"]] = item["prices"][-1]["price"]
+        return {
+            "stationId": station["stationId"],
+            "stationName": station.get("stationName"),
+            "flag": station.get("flag"),
+            "coordinates": [coordinates[0], coordinates[1]],
+            "prices": prices,
+        }
+
+    def upsert(self, station: dict) -> None:
+        """
+        Add a station to the pyramid or move/update its previous entry.
+
+        Args:
+            station (dict): A catalog document (with the latest price of each product).
+        """
+        point = self._point(station)
+        with self._lock:
+            if point is not None and self._points.get(point["stationId"]) == point:
+                # El refresco reaplica estaciones sin cambios: no invalidar la caché
+                return
+            previous = self._points.pop(station["stationId"], None)
+            if previous is not None:
+                self._place(previous, add=False)
+            if point is not None:
+                self._points[point["stationId"]] = point
+                self._place(point, add=True)
+
+    def remove_station(self, station_id: int) -> None:
+        """
+        Remove a deleted station from the pyramid, if present.
+
+        Args:
+            station_id (int): The unique ID of the station.
+        """
+        with self._lock:
+            previous = self._points.pop(station_id, None)
+            if previous is not None:
+                self._place(previous, add=False)
+
+    def _place(self, point: dict, add: bool) -> None:
+        for product in point["prices"]:
+            count = self._products.get(product, 0) + (1 if add else -1)
+            if count:
+                self._products[product] = count
+            else:
+                del self._products[product]
+        lon, lat = point["coordinates"]
+        for zoom in range(self.max_zoom + 1):
+            cell = tile_for(lon, lat, zoom + CELL_BITS)
+            tile = (cell[0] >> CELL_BITS, cell[1] >> CELL_BITS)
+            cells = self._levels[zoom].setdefault(tile, {})
+            if add:
+                cells.setdefault(cell, set()).add(point["stationId"])
+            else:
+                members = cells.get(cell, set())
+                members.discard(point["stationId"])
+                if not members:
+                    cells.pop(cell, None)
+                if not cells:
+                    del self._levels[zoom][tile]
+
+            # Las respuestas cacheadas de versiones anteriores dejan de usarse
+            key = (zoom, tile[0], tile[1])
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def tile(self, z: int, x: int, y: int, product_id: Optional[int] = None) -> Tuple[dict, str]:
+        """
+        Return the contents of a tile and a version tag for HTTP caching.
+
+        Args:
+            z (int): Zoom level.
+            x (int): Tile column.
+            y (int): Tile row.
+            product_id (int, optional): Only count stations selling this product, and only
+                report its price.
+
+        Returns:
+            tuple: The tile payload and a version string that changes whenever the tile's
+            contents may have changed.
+        """
+        if z <= self.max_zoom:
+            source = (z, x, y)
+        else:
+            shift = z - self.max_zoom
+            source = (self.max_zoom, x >> shift, y >> shift)
+
+        with self._lock:
+            version = self._versions.get(source, 0)
+            tag = f"{self.epoch}-{version}"
+            key = (z, x, y, product_id)
+            cached = self._responses.get(key)
+            if cached is not None and cached[0] == version:
+                self._responses.move_to_end(key)
+                return cached[1], tag
+
+            payload = self._build(z, x, y, source, product_id)
+            if z <= self.max_zoom and (product_id is None or product_id in self._products):
+                self._responses[key] = (version, payload)
+                self._responses.move_to_end(key)
+                if len(self._responses) > TILE_CACHE_ENTRIES:
+                    self._responses.popitem(last=False)
+            return payload, tag
+
+    def _members(self, source: TileKey, product_id: Optional[int]):
+        zoom, x, y = source
+        for cell, members in sorted(self._levels[zoom].get((x, y), {}).items()):
+            points = [self._points[station_id] for station_id in sorted(members)]
+            if product_id is not None:
+                points = [point for point in points if product_id in point["prices"]]
+            if points:
+                yield cell, points
+
+    @staticmethod
+    def _prices(point: dict, product_id: Optional[int]) -> Dict[int, float]:
+        if product_id is None:
+            return dict(point["prices"])
+        return {product_id: point["prices"][product_id]}
+
+    def _station_feature(self, point: dict, product_id: Optional[int]) -> dict:
+        return {
+            "type": "station",
+            "coordinates": point["coordinates"],
+            "count": 1,
+            "stationId": point["stationId"],
+            "stationName": point["stationName"],
+            "flag": point["flag"],
+            "minPrices": self._prices(point, product_id),
+        }
+
+    def _cluster_feature(self, points: List[dict], product_id: Optional[int]) -> dict:
+        min_prices: Dict[int, float] = {}
+        for point in points:
+            for product, price in self._prices(point, product_id).items():
+                if product not in min_prices or price < min_prices[product]:
+                    min_prices[product] = price
+        return {
+            "type": "cluster",
+            "coordinates": [
+                sum(point["coordinates"][0] for point in points) / len(points),
+                sum(point["coordinates"][1] for point in points) / len(points),
+            ],
+            "count": len(points),
+            "minPrices": min_prices,
+        }
+
+    def _build(self, z: int, x: int, y: int, source: TileKey, product_id: Optional[int]) -> dict:
+        features = []
+        clustered = z < self.max_zoom
+        for _, points in self._members(source, product_id):
+            if not clustered:
+                features.extend(
+                    self._station_feature(point, product_id)
+                    for point in points
+                    if tile_for(*point["coordinates"], z) == (x, y)
+                )
+            elif len(points) == 1:
+                features.append(self._station_feature(points[0], product_id))
+            else:
+                features.append(self._cluster_feature(points, product_id))
+        return {"z": z, "x": x, "y": y, "clustered": clustered, "features": features}
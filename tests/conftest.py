@@ -0,0 +1,92 @@
+"""
+conftest.py
+
+Shared test setup. Route tests import the application, which reads its configuration at
+import time, so the snapshot backend and a small snapshot file are set up here before any
+test module is collected; no database is needed.
+"""
+
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from storage.snapshot import write_snapshot
+
+UPDATED_AT = datetime(2026, 4, 1, 12)
+PROVINCES = ["MENDOZA", "CORDOBA", "SALTA"]
+
+
+def make_station(station_id: int, updated_at: datetime, price: float = 1000.0) -> dict:
+    """A complete station document as stored in ``stations2``."""
+    return {
+        "_id": ObjectId(),
+        "stationId": station_id,
+        "stationName": f"Estación {station_id}",
+        "address": f"Ruta {station_id} km 10",
+        "town": "Godoy Cruz",
+        "province": PROVINCES[station_id % len(PROVINCES)],
+        "flag": "YPF",
+        "flagId": 1,
+        "geometry": {"type": "Point", "coordinates": [-68.84, -32.93]},
+        "products": [
+            {
+                "_id": ObjectId(),
+                "productId": 2,
+                "productName": "Nafta (súper)",
+                "prices": [
+                    {"_id": ObjectId(), "price": price, "date": updated_at - timedelta(hours=1)}
+                ],
+            }
+        ],
+        "updatedAt": updated_at,
+        "__v": 0,
+    }
+
+
+# De a tres estaciones con el mismo updatedAt, para probar los desempates al paginar
+STATIONS = [
+    make_station(station_id, UPDATED_AT + timedelta(seconds=(station_id - 1) // 3))
+    for station_id in range(1, 13)
+]
+
+
+class Documents:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def find(self, filter=None, batch_size=None):
+        return iter(self.documents)
+
+
+SNAPSHOT_PATH = os.path.join(tempfile.mkdtemp(prefix="precio-nafta-tests-"), "stations.bson.gz")
+write_snapshot(Documents(STATIONS), SNAPSHOT_PATH)
+
+os.environ["STORAGE_BACKEND"] = "snapshot"
+os.environ["SNAPSHOT_PATH"] = SNAPSHOT_PATH
+os.environ["ANALYTICS_ENGINE"] = ""
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+
+
+@pytest.fixture
+def client():
+    """
+    A test client for the application, authenticated as user ``ana``.
+
+    Set ``client.user`` to act as another user. The lifespan (catalog refresher, alert
+    reloader) is not started.
+    """
+    from fastapi.testclient import TestClient
+
+    from auth import User, get_current_active_user
+    from main import app
+
+    test_client = TestClient(app)
+    test_client.user = User(username="ana")
+    app.dependency_overrides[get_current_active_user] = lambda: test_client.user
+    yield test_client
+    app.dependency_overrides.clear()
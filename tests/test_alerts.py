@@ -0,0 +1,302 @@
+"""
+test_alerts.py
+
+Tests for the price-alert models, the matching engine and the /alerts routes.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+import routes.alerts
+from auth import User
+from config.database import alerts_collection, notifications_collection
+from models.alerts import AlertCreate
+from routes.alerts import alert_index, decode_cursor, encode_cursor
+from storage.alerts import DUPLICATE_KEY, AlertIndex
+from tools.bench_alerts import latest_only, scan, synthetic_alerts
+from tools.bench_analytics import synthetic_stations
+
+
+def alert(threshold, **region):
+    return {
+        "_id": ObjectId(),
+        "username": "ana",
+        "productId": 2,
+        "threshold": threshold,
+        "province": None,
+        "town": None,
+        "near": None,
+        "radiusKm": 10.0,
+        **region,
+    }
+
+
+def station(price, station_id=1, town="Godoy Cruz", province="Mendoza"):
+    return {
+        "stationId": station_id,
+        "town": town,
+        "province": province,
+        "geometry": {"type": "Point", "coordinates": [-68.84, -32.93]},
+        "products": [{"productId": 2, "prices": [{"price": price}]}],
+    }
+
+
+class Outbox:
+    def __init__(self, error_code=None):
+        self.inserted = []
+        self.error_code = error_code
+
+    def insert_many(self, documents, ordered=True):
+        self.inserted.extend(documents)
+        if self.error_code is not None:
+            raise BulkWriteError({"writeErrors": [{"code": self.error_code}]})
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [
+        {},
+        {"town": "Godoy Cruz", "near": [-68.8, -32.9]},
+        {"near": [-68.8, -95.0]},
+        {"near": [-68.8]},
+        {"province": "Mendoza", "radiusKm": 500},
+    ],
+)
+def test_alert_needs_exactly_one_valid_region(fields):
+    with pytest.raises(ValidationError):
+        AlertCreate(productId=2, threshold=1000, **fields)
+
+
+def test_drops_notify_once_per_crossing():
+    index = AlertIndex()
+    index.load([alert(1000.0, town="godoy cruz"), alert(900.0, province="MENDOZA")])
+    # La primera vez sólo se registra el precio
+    assert index.upsert(station(1100.0)) == []
+    assert [n["threshold"] for n in index.upsert(station(950.0))] == [1000.0]
+    # Sigue debajo del umbral: no se repite
+    assert index.upsert(station(940.0)) == []
+    assert [n["threshold"] for n in index.upsert(station(880.0))] == [900.0]
+    index.upsert(station(1200.0))
+    assert sorted(n["threshold"] for n in index.upsert(station(850.0))) == [900.0, 1000.0]
+
+
+def test_alerts_outside_the_region_do_not_match():
+    index = AlertIndex()
+    index.load(
+        [
+            alert(1000.0, town="Maipú"),
+            alert(1000.0, province="Salta"),
+            alert(1000.0, near=[-58.4, -34.6], radiusKm=50.0),
+            alert(1000.0, near=[-68.9, -32.9], radiusKm=10.0),
+        ]
+    )
+    index.upsert(station(1100.0))
+    notifications = index.upsert(station(900.0))
+    assert len(notifications) == 1
+    assert notifications[0]["alertId"] == index._records[3][0]
+
+
+def test_added_and_removed_alerts_apply_immediately():
+    index = AlertIndex()
+    index.upsert(station(1100.0))
+    subscription = alert(1000.0, town="Godoy Cruz")
+    index.add(subscription)
+    assert len(index.upsert(station(950.0))) == 1
+    index.remove(str(subscription["_id"]))
+    index.upsert(station(1100.0))
+    assert index.upsert(station(950.0)) == []
+    assert len(index) == 0
+
+
+def test_changes_during_load_are_kept():
+    index = AlertIndex()
+    added, removed = alert(1000.0, town="Godoy Cruz"), alert(1000.0, town="Godoy Cruz")
+    index.add(removed)
+
+    def stored():
+        yield removed
+        # Otro worker crea y borra alertas mientras se recarga
+        index.add(added)
+        index.remove(str(removed["_id"]))
+
+    index.load(stored())
+    assert sorted(index._slots) == [str(added["_id"])]
+
+
+def test_duplicate_notifications_are_ignored():
+    index = AlertIndex(Outbox(error_code=DUPLICATE_KEY))
+    index.load([alert(1000.0, town="Godoy Cruz")])
+    index.upsert(station(1100.0))
+    assert len(index.upsert(station(950.0))) == 1
+
+    index = AlertIndex(Outbox(error_code=121))
+    index.load([alert(1000.0, town="Godoy Cruz")])
+    index.upsert(station(1100.0))
+    with pytest.raises(BulkWriteError):
+        index.upsert(station(950.0))
+    # El precio no se registró: el próximo refresco vuelve a intentar la entrega
+    index.outbox.error_code = None
+    assert len(index.upsert(station(950.0))) == 1
+
+
+def test_index_matches_a_full_scan():
+    rng = random.Random(3)
+    stations = [latest_only(s) for s in synthetic_stations(300, 7, seed=3)]
+    alerts = synthetic_alerts(stations, 5000, seed=3)
+    index = AlertIndex()
+    index.load(alerts)
+    for s in stations:
+        index.upsert(s)
+    for _ in range(500):
+        s = rng.choice(stations)
+        product = rng.choice(s["products"])
+        previous = product["prices"][-1]["price"]
+        price = product["prices"][-1]["price"] = round(previous * rng.uniform(0.95, 1.02), 2)
+        triggered = {n["alertId"] for n in index.upsert(s)}
+        assert triggered == scan(alerts, s, product["productId"], price, previous)
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """Empty alert and notification collections (snapshot backend) and matching engine."""
+    alerts_collection.documents.clear()
+    notifications_collection.documents.clear()
+    alert_index.load([])
+    monkeypatch.setattr(routes.alerts, "ALERT_NOTIFICATIONS_SETTLE_SECONDS", 0)
+    yield
+    alerts_collection.documents.clear()
+    notifications_collection.documents.clear()
+    alert_index.load([])
+
+
+BODY = {"productId": 2, "threshold": 1000, "town": "Godoy Cruz"}
+
+
+def test_alerts_are_created_listed_and_limited(client, stored, monkeypatch):
+    monkeypatch.setattr(routes.alerts, "ALERTS_PER_USER", 2)
+    created = client.post("/api/v1/alerts", json=BODY)
+    assert created.status_code == 201
+    assert created.json()["town"] == "Godoy Cruz"
+    assert client.post("/api/v1/alerts", json={**BODY, "threshold": 900}).status_code == 201
+    assert len(alert_index) == 2
+
+    response = client.post("/api/v1/alerts", json=BODY)
+    assert response.status_code == 400
+    assert [a["threshold"] for a in client.get("/api/v1/alerts").json()] == [1000, 900]
+
+    # El límite y el listado son por usuario
+    client.user = User(username="beto")
+    assert client.get("/api/v1/alerts").json() == []
+    assert client.post("/api/v1/alerts", json=BODY).status_code == 201
+
+
+def test_invalid_alerts_are_rejected(client, stored):
+    response = client.post("/api/v1/alerts", json={**BODY, "near": [-68.8, -32.9]})
+    assert response.status_code == 422
+    assert alerts_collection.documents == []
+
+
+def test_only_the_owner_deletes_an_alert(client, stored):
+    alert_id = client.post("/api/v1/alerts", json=BODY).json()["id"]
+    client.user = User(username="beto")
+    assert client.delete(f"/api/v1/alerts/{alert_id}").status_code == 404
+    assert client.delete("/api/v1/alerts/no-es-un-id").status_code == 404
+    assert len(alert_index) == 1
+
+    client.user = User(username="ana")
+    assert client.delete(f"/api/v1/alerts/{alert_id}").status_code == 204
+    assert client.delete(f"/api/v1/alerts/{alert_id}").status_code == 404
+    assert len(alert_index) == 0
+    assert client.get("/api/v1/alerts").json() == []
+
+
+def test_price_drops_reach_the_owner(client, stored):
+    client.post("/api/v1/alerts", json=BODY)
+    alert_index.upsert(station(1100.0))
+    alert_index.upsert(station(950.0))
+
+    page = client.get("/api/v1/alerts/notifications").json()
+    assert [(n["price"], n["previousPrice"]) for n in page["notifications"]] == [(950.0, 1100.0)]
+    assert not page["hasMore"]
+    client.user = User(username="beto")
+    assert client.get("/api/v1/alerts/notifications").json()["notifications"] == []
+
+
+def notification(number, created_at, username="ana"):
+    return {
+        "_id": f"{ObjectId()}:1:{number:03d}",
+        "alertId": str(ObjectId()),
+        "username": username,
+        "stationId": 1,
+        "productId": 2,
+        "price": 900.0 + number,
+        "threshold": 1000.0,
+        "createdAt": created_at,
+    }
+
+
+def read_all(client, limit, since=None):
+    """Page through the notifications until no more are available."""
+    prices = []
+    while True:
+        params = {"limit": limit, **({"since": since} if since else {})}
+        page = client.get("/api/v1/alerts/notifications", params=params).json()
+        prices.extend(n["price"] for n in page["notifications"])
+        since = page["nextToken"]
+        if not page["hasMore"]:
+            return prices, since
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 7])
+def test_notifications_sharing_an_instant_are_not_skipped(client, stored, limit):
+    # Una tanda de cinco notificaciones con el mismo createdAt y dos posteriores
+    batch = datetime(2026, 4, 1, 12)
+    notifications_collection.insert_many(
+        [notification(n, batch) for n in range(5)]
+        + [notification(n, batch + timedelta(milliseconds=1)) for n in range(5, 7)]
+        + [notification(9, batch, username="beto")]
+    )
+    ordered = sorted(
+        (d for d in notifications_collection.documents if d["username"] == "ana"),
+        key=lambda d: (d["createdAt"], d["_id"]),
+    )
+    prices, token = read_all(client, limit)
+    assert prices == [d["price"] for d in ordered]
+
+    # Lo que llega después aparece desde la misma posición
+    notifications_collection.insert_many([notification(7, batch + timedelta(seconds=1))])
+    assert read_all(client, limit, token)[0] == [907.0]
+
+
+def test_recent_notifications_wait_for_the_settle_window(client, stored, monkeypatch):
+    monkeypatch.setattr(routes.alerts, "ALERT_NOTIFICATIONS_SETTLE_SECONDS", 60)
+    notifications_collection.insert_many(
+        [notification(0, datetime.utcnow() - timedelta(minutes=5))]
+        + [notification(1, datetime.utcnow())]
+    )
+    page = client.get("/api/v1/alerts/notifications").json()
+    assert [n["price"] for n in page["notifications"]] == [900.0]
+
+
+def test_since_accepts_timestamps_and_rejects_garbage(client, stored):
+    notifications_collection.insert_many(
+        [notification(n, datetime(2026, 4, 1, 12 + n)) for n in range(3)]
+    )
+    page = client.get(
+        "/api/v1/alerts/notifications", params={"since": "2026-04-01T10:00:00-03:00"}
+    ).json()
+    assert [n["price"] for n in page["notifications"]] == [902.0]
+    response = client.get("/api/v1/alerts/notifications", params={"since": "ayer"})
+    assert response.status_code == 400
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 4, 1, 12, 0, 0, 123000)
+    assert decode_cursor(encode_cursor(created_at, "abc:1:x")) == (created_at, "abc:1:x")
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(created_at, "abc")[:-3])
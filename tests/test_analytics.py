@@ -0,0 +1,81 @@
+"""
+test_analytics.py
+
+Tests for the DuckDB analytics copy: incremental refresh from the ``updatedAt`` watermark
+and the lifetime of replaced connections.
+"""
+
+from datetime import datetime, timedelta
+
+import duckdb
+import pytest
+
+from models.filters import StationFilter
+from storage.analytics import DuckDBStationStore
+from storage.snapshot import SnapshotStationStore
+from tools.bench_analytics import synthetic_stations
+
+UPDATED_AT = datetime(2026, 1, 1)
+
+
+def station_source(stations):
+    def source(since):
+        return [station for station in stations if since is None or station["updatedAt"] >= since]
+
+    return source
+
+
+@pytest.fixture
+def stations():
+    stations = synthetic_stations(200, 30, seed=11)
+    for position, station in enumerate(stations):
+        station["updatedAt"] = UPDATED_AT + timedelta(seconds=position)
+    return stations
+
+
+def assert_matches_snapshot(engine, stations):
+    snapshot = SnapshotStationStore(stations)
+    for filters in (StationFilter(), StationFilter(province="mendoza", product_id=2)):
+        assert engine.find_last_prices(filters, 100) == snapshot.find_last_prices(filters, 100)
+    end = datetime.utcnow()
+    for province in (None, "Mendoza", "Salta"):
+        assert engine.find_price_index(
+            2, province, None, end - timedelta(days=40), end
+        ) == snapshot.find_price_index(2, province, None, end - timedelta(days=40), end)
+
+
+def test_refresh_only_loads_changed_stations(stations):
+    engine = DuckDBStationStore(SnapshotStationStore(stations), station_source(stations))
+    assert engine.refresh()["stations"] == 200
+    assert engine.watermark == stations[-1]["updatedAt"]
+
+    # Un precio nuevo, un cambio de provincia y una estación nueva
+    changed_at = UPDATED_AT + timedelta(hours=1)
+    product = stations[3]["products"][0]
+    product["prices"].append(
+        {"price": 1.0, "date": product["prices"][-1]["date"] + timedelta(hours=1)}
+    )
+    stations[3]["updatedAt"] = changed_at
+    stations[7]["province"] = "Salta"
+    stations[7]["updatedAt"] = changed_at
+    added = synthetic_stations(1, 30, seed=12)[0]
+    added.update(stationId=1000, updatedAt=changed_at)
+    stations.append(added)
+
+    # La consulta es inclusiva: también vuelve a cargar la que estaba en la marca de agua
+    assert engine.refresh()["stations"] == 4
+    assert engine.watermark == changed_at
+    assert_matches_snapshot(engine, stations)
+    assert engine.refresh()["stations"] == 3
+    assert_matches_snapshot(engine, stations)
+
+
+def test_full_reload_closes_the_replaced_connection(stations):
+    engine = DuckDBStationStore(SnapshotStationStore(stations), station_source(stations))
+    engine.refresh()
+    previous = engine._connection
+    engine.refresh(full=True)
+    assert engine._connection is not previous
+    with pytest.raises(duckdb.ConnectionException):
+        previous.execute("SELECT 1")
+    assert_matches_snapshot(engine, stations)
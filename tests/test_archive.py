@@ -0,0 +1,106 @@
+"""
+test_archive.py
+
+Tests for merging the Parquet price archive back into station histories.
+"""
+
+import copy
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from models.filters import HistoryWindow
+from storage.archive import _write_batch, _write_manifest, merge_archived_prices
+
+CUTOFF = datetime.utcnow().replace(microsecond=0) - timedelta(days=60)
+
+
+def synthetic_stations(count, days, seed):
+    """Stations with one or two products and a price every one to four days."""
+    rng = random.Random(seed)
+    start = CUTOFF + timedelta(days=60) - timedelta(days=days)
+    stations = []
+    for station_id in range(1, count + 1):
+        products = []
+        for product_id in rng.sample([2, 3, 19], rng.randint(1, 2)):
+            prices = []
+            date = start + timedelta(hours=rng.randint(0, 48))
+            while date < start + timedelta(days=days):
+                prices.append({"_id": ObjectId(), "price": rng.uniform(800, 1400), "date": date})
+                date += timedelta(hours=rng.choice([2, 30, 50, 80]))
+            products.append({"productId": product_id, "prices": prices})
+        stations.append(
+            {
+                "stationId": station_id,
+                "province": rng.choice(["MENDOZA", "SALTA"]),
+                "products": products,
+            }
+        )
+    return stations
+
+
+def history(stations):
+    return [
+        [(p["productId"], [(x["price"], x["date"]) for x in p["prices"]]) for p in s["products"]]
+        for s in stations
+    ]
+
+
+@pytest.fixture
+def archived(tmp_path):
+    """Full histories, plus an archive holding every price older than the cutoff."""
+    stations = synthetic_stations(30, 120, seed=3)
+    rows = [
+        {
+            "stationId": station["stationId"],
+            "productId": product["productId"],
+            "priceId": str(price["_id"]),
+            "price": price["price"],
+            "date": price["date"],
+            "province": station["province"],
+            "month": price["date"].strftime("%Y-%m"),
+        }
+        for station in stations
+        for product in station["products"]
+        for price in product["prices"]
+        if price["date"] < CUTOFF
+    ]
+    _write_batch(rows, str(tmp_path), "part-test-0")
+    _write_manifest(str(tmp_path), CUTOFF, len(rows))
+    return stations, str(tmp_path)
+
+
+def test_merge_restores_pulled_history(archived):
+    stations, archive_dir = archived
+    hot = copy.deepcopy(stations)
+    for station in hot:
+        for product in station["products"]:
+            product["prices"] = [p for p in product["prices"] if p["date"] >= CUTOFF]
+
+    merged = merge_archived_prices(hot, archive_dir)
+    assert history(merged) == history(stations)
+
+
+def test_merge_skips_prices_not_yet_pulled(archived):
+    # El job escribió el archivo pero se detuvo antes del $pull
+    stations, archive_dir = archived
+    merged = merge_archived_prices(copy.deepcopy(stations), archive_dir)
+    assert history(merged) == history(stations)
+
+
+def test_merge_applies_window(archived):
+    stations, archive_dir = archived
+    window = HistoryWindow(date_from=CUTOFF - timedelta(days=30), last_n=5)
+    hot = copy.deepcopy(stations)
+    for station in hot:
+        for product in station["products"]:
+            product["prices"] = window.trim([p for p in product["prices"] if p["date"] >= CUTOFF])
+
+    merged = merge_archived_prices(hot, archive_dir, window=window)
+    expected = copy.deepcopy(stations)
+    for station in expected:
+        for product in station["products"]:
+            product["prices"] = window.trim(product["prices"])
+    assert history(merged) == history(expected)
@@ -0,0 +1,99 @@
+"""
+test_changes.py
+
+Tests for the /changes continuation tokens and for paging through the catalog.
+"""
+
+import base64
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from routes.changes import decode_since, encode_token
+from storage.snapshot import SnapshotStationStore
+from tests.conftest import STATIONS, UPDATED_AT
+
+
+def raw_token(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_token_round_trip():
+    updated_at = datetime(2026, 4, 1, 12, 30, 15, 250000)
+    token = encode_token(updated_at, 1234)
+    assert "=" not in token
+    assert decode_since(token) == (updated_at, 1234)
+
+
+@pytest.mark.parametrize(
+    "since, expected",
+    [
+        ("2026-04-01T12:00:00", datetime(2026, 4, 1, 12)),
+        ("2026-04-01T12:00:00Z", datetime(2026, 4, 1, 12)),
+        ("2026-04-01T09:00:00-03:00", datetime(2026, 4, 1, 12)),
+    ],
+)
+def test_timestamps_are_read_as_naive_utc(since, expected):
+    assert decode_since(since) == (expected, None)
+
+
+def test_token_dates_are_read_as_naive_utc():
+    assert decode_since(raw_token({"t": "2026-04-01T09:00:00-03:00", "id": 7})) == (
+        datetime(2026, 4, 1, 12),
+        7,
+    )
+
+
+@pytest.mark.parametrize(
+    "since",
+    [
+        "garbage",
+        "!!!!",
+        raw_token({"t": "ayer", "id": 7}),
+        raw_token({"t": "2026-04-01T12:00:00"}),
+        raw_token({"t": "2026-04-01T12:00:00", "id": 2**70}),
+        raw_token(["2026-04-01T12:00:00", 7]),
+        encode_token(datetime(2026, 4, 1), 7)[:-4],
+    ],
+)
+def test_invalid_tokens_are_rejected(since):
+    with pytest.raises(ValueError):
+        decode_since(since)
+
+
+@pytest.mark.parametrize("since", ["garbage", raw_token({"t": "2026-04-01", "id": 2**70})])
+def test_route_answers_400_to_invalid_tokens(client, since):
+    response = client.get("/api/v1/changes", params={"since": since})
+    assert response.status_code == 400
+
+
+def sync(client, limit, since=None):
+    """Page through /changes until it reports no more changes."""
+    seen, pages = [], 0
+    while True:
+        params = {"limit": limit, **({"since": since} if since else {})}
+        body = client.get("/api/v1/changes", params=params).json()
+        seen.extend(station["stationId"] for station in body["stations"])
+        since, pages = body["nextToken"], pages + 1
+        if not body["hasMore"]:
+            return seen, since, pages
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 5, 12])
+def test_paging_delivers_every_station_once(client, limit):
+    # Las páginas cortan dentro de grupos de estaciones con el mismo updatedAt
+    seen, token, _ = sync(client, limit)
+    assert seen == [station["stationId"] for station in STATIONS]
+
+    # Al día: la siguiente consulta no trae nada y conserva el token
+    body = client.get("/api/v1/changes", params={"since": token}).json()
+    assert body == {"stations": [], "nextToken": token, "hasMore": False}
+
+
+def test_timestamp_since_skips_stations_at_that_instant():
+    store = SnapshotStationStore(STATIONS)
+    changed = store.find_changes(UPDATED_AT + timedelta(seconds=1), None, 100)
+    assert [station["stationId"] for station in changed] == list(range(7, 13))
+    changed = store.find_changes(UPDATED_AT + timedelta(seconds=1), 5, 100)
+    assert [station["stationId"] for station in changed] == list(range(6, 13))
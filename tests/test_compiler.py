@@ -0,0 +1,100 @@
+"""
+test_compiler.py
+
+Golden tests for the aggregation pipelines compiled by ``storage.compiler``.
+
+Each case is compared with its JSON file in ``tests/golden``. After an intended change to a
+pipeline, regenerate the files with ``UPDATE_GOLDEN=1 pytest tests/test_compiler.py`` and
+review the diff.
+"""
+
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from bson import json_util
+
+from models.filters import HistoryWindow, StationFilter
+from storage.compiler import (
+    compile_along_route,
+    compile_catalog,
+    compile_changes,
+    compile_last_prices,
+    compile_station,
+    compile_station_last_prices,
+    compile_stations,
+)
+from storage.geo import Corridor
+from storage.mongo import plan_stages
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+SINCE = datetime(2025, 3, 1, 12, 30)
+
+CASES = {
+    "stations": lambda: compile_stations(StationFilter(), 20),
+    "stations_filters": lambda: compile_stations(
+        StationFilter(province="córdoba", town="rio", flag="ypf", flag_id=1, product="nafta"), 50
+    ),
+    "stations_product_id": lambda: compile_stations(StationFilter(product_id=2), 20),
+    "stations_window": lambda: compile_stations(
+        StationFilter(product_id=2),
+        20,
+        HistoryWindow(date_from=datetime(2025, 1, 1), date_to=datetime(2025, 2, 1), last_n=10),
+    ),
+    "station": lambda: compile_station(1234, StationFilter(product="gnc")),
+    "station_last_n": lambda: compile_station(1234, StationFilter(), HistoryWindow(last_n=5)),
+    "last_prices": lambda: compile_last_prices(StationFilter(), 20),
+    "last_prices_filters": lambda: compile_last_prices(
+        StationFilter(province="santa fe", product_id=19), 100
+    ),
+    "station_last_prices": lambda: compile_station_last_prices(1234, StationFilter(product_id=2)),
+    "along_route": lambda: compile_along_route(
+        Corridor([[-58.38, -34.60], [-58.70, -34.65], [-59.10, -34.55]], 5.0), 2
+    ),
+    "catalog": lambda: compile_catalog(),
+    "catalog_since": lambda: compile_catalog(SINCE),
+    "changes_first_page": lambda: compile_changes(None, None, 500),
+    "changes_timestamp": lambda: compile_changes(SINCE, None, 500),
+    "changes_token": lambda: compile_changes(SINCE, 4321, 500),
+}
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_compiled_pipeline_matches_golden(name):
+    compiled = json_util.dumps(CASES[name](), indent=2, ensure_ascii=False) + "\n"
+    path = GOLDEN_DIR / f"{name}.json"
+    if os.getenv("UPDATE_GOLDEN"):
+        path.write_text(compiled, encoding="utf-8")
+    assert compiled == path.read_text(encoding="utf-8")
+
+
+def test_pipelines_match_before_reshaping():
+    # El $match (y el $limit, si hay) van antes de cualquier etapa que toque productos
+    for name, build in CASES.items():
+        stages = [next(iter(stage)) for stage in build()]
+        assert stages[-1] == "$project", name
+        if "$match" in stages:
+            assert stages[0] == "$match", name
+
+
+def test_plan_stages_reads_winning_plans():
+    explain = {
+        "stages": [
+            {
+                "$cursor": {
+                    "queryPlanner": {
+                        "winningPlan": {
+                            "stage": "LIMIT",
+                            "inputStage": {
+                                "stage": "FETCH",
+                                "inputStage": {"stage": "IXSCAN", "keyPattern": {"stationId": 1}},
+                            },
+                        },
+                        "rejectedPlans": [{"stage": "COLLSCAN"}],
+                    }
+                }
+            }
+        ]
+    }
+    assert plan_stages(explain) == ["LIMIT", "FETCH", "IXSCAN"]
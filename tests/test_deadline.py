@@ -0,0 +1,120 @@
+"""
+test_deadline.py
+
+Tests for per-request query deadlines and cancellation on client disconnect.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from models.filters import StationFilter
+from storage.deadline import (
+    QUERY_MAX_TIME_MS,
+    ROUTE_TIMEOUTS_MS,
+    ClientDisconnected,
+    Deadline,
+    DeadlineExceeded,
+    max_time_ms,
+    query_comment,
+    request_timeout_ms,
+    run_query,
+    use_deadline,
+)
+from storage.mongo import MongoStationStore
+
+
+class FakeRequest:
+    def __init__(self, headers=None, disconnect_after=None):
+        self.headers = headers or {}
+        self._disconnect_at = (
+            time.monotonic() + disconnect_after if disconnect_after is not None else None
+        )
+
+    async def is_disconnected(self):
+        return self._disconnect_at is not None and time.monotonic() >= self._disconnect_at
+
+
+class FakeStore:
+    def __init__(self):
+        self.seen = None
+        self.cancelled = []
+        self.released = threading.Event()
+
+    def find_stations(self, filters, limit=20, window=None):
+        self.seen = (query_comment(), max_time_ms())
+        return []
+
+    def find_changes(self, since=None, after_station_id=None, limit=500):
+        self.seen = (query_comment(), max_time_ms())
+        self.released.wait(5)
+        return []
+
+    def cancel(self, comment):
+        self.cancelled.append(comment)
+        self.released.set()
+        return 1
+
+
+class FakeCollection:
+    name = "stations2"
+
+    def __init__(self):
+        self.options = None
+
+    def aggregate(self, pipeline, **options):
+        self.options = options
+        return iter([])
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, ROUTE_TIMEOUTS_MS["find_stations"]),
+        ("1500", 1500),
+        ("abc", ROUTE_TIMEOUTS_MS["find_stations"]),
+        ("-5", ROUTE_TIMEOUTS_MS["find_stations"]),
+        ("999999", QUERY_MAX_TIME_MS),
+    ],
+)
+def test_request_timeout_comes_from_header_or_route(header, expected):
+    headers = {"x-request-timeout-ms": header} if header is not None else {}
+    assert request_timeout_ms(FakeRequest(headers), "find_stations") == expected
+
+
+def test_max_time_ms_is_the_remaining_budget():
+    assert max_time_ms() == QUERY_MAX_TIME_MS
+    with use_deadline(Deadline(1000)):
+        assert 900 < max_time_ms() <= 1000
+    with use_deadline(Deadline(1)):
+        time.sleep(0.01)
+        with pytest.raises(DeadlineExceeded):
+            max_time_ms()
+
+
+def test_mongo_queries_carry_the_deadline():
+    collection = FakeCollection()
+    store = MongoStationStore(collection)
+    with use_deadline(Deadline(2000)) as deadline:
+        store.find_last_prices(StationFilter(), 20)
+    assert collection.options["comment"] == deadline.comment
+    assert 1900 < collection.options["maxTimeMS"] <= 2000
+
+
+def test_run_query_runs_under_the_request_deadline():
+    store = FakeStore()
+    request = FakeRequest({"x-request-timeout-ms": "3000"})
+    assert asyncio.run(run_query(request, store, "find_stations", StationFilter(), 20)) == []
+    comment, budget = store.seen
+    assert comment.startswith("req-")
+    assert 2900 < budget <= 3000
+
+
+def test_disconnect_cancels_the_query_on_the_server():
+    store = FakeStore()
+    request = FakeRequest(disconnect_after=0.05)
+    with pytest.raises(ClientDisconnected):
+        asyncio.run(run_query(request, store, "find_changes", None, None, 500))
+    assert store.cancelled == [store.seen[0]]
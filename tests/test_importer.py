@@ -0,0 +1,178 @@
+"""
+test_importer.py
+
+Tests for the streaming dataset importer: re-importing a feed is idempotent and a run that
+fails halfway can simply be run again.
+"""
+
+import copy
+import csv
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from storage.importer import CSV_COLUMNS, import_prices
+
+
+class FakeStations:
+    """
+    Applies the updates the importer writes (upserts of station fields and ``$push`` of
+    products or prices) to a list of documents.
+    """
+
+    def __init__(self):
+        self.documents = []
+
+    def aggregate(self, pipeline, **options):
+        # El estado que calcula load_state: hash y última fecha de cada producto
+        for station in self.documents:
+            yield {
+                "stationId": station["stationId"],
+                "contentHash": station.get("contentHash"),
+                "products": [
+                    {
+                        "productId": product["productId"],
+                        "last": max((price["date"] for price in product["prices"]), default=None),
+                    }
+                    for product in station["products"]
+                ],
+            }
+
+    def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            self._apply(operation._filter, operation._doc, operation._upsert)
+
+    def _apply(self, filter, update, upsert):
+        station = next((s for s in self.documents if s["stationId"] == filter["stationId"]), None)
+        if station is None:
+            if not upsert:
+                return
+            station = {"stationId": filter["stationId"], **update.get("$setOnInsert", {})}
+            self.documents.append(station)
+        station.update(update.get("$set", {}))
+        push = update.get("$push", {})
+        if "products" in push:
+            station["products"].append(copy.deepcopy(push["products"]))
+        if "products.$.prices" in push:
+            product = next(
+                p for p in station["products"] if p["productId"] == filter["products.productId"]
+            )
+            product["prices"].extend(copy.deepcopy(push["products.$.prices"]["$each"]))
+
+
+class FlakyStations(FakeStations):
+    """Fails one ``bulk_write`` call after applying only half of its operations."""
+
+    def __init__(self, fail_on_call):
+        super().__init__()
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+
+    def bulk_write(self, operations, ordered=True):
+        self.calls += 1
+        if self.calls == self.fail_on_call:
+            super().bulk_write(operations[: len(operations) // 2])
+            raise BulkWriteError({"writeErrors": [{"code": 6}]})
+        super().bulk_write(operations)
+
+
+def row(station_id, product_id, price, date, schedule="Diurno", town="Godoy Cruz"):
+    return {
+        "idempresa": station_id,
+        "empresa": f"Estación {station_id}",
+        "direccion": f"Ruta {station_id} km 10",
+        "localidad": town,
+        "provincia": "MENDOZA",
+        "idempresabandera": 1,
+        "empresabandera": "YPF",
+        "idproducto": product_id,
+        "producto": {2: "Nafta (súper)", 3: "Nafta (premium)"}[product_id],
+        "tipohorario": schedule,
+        "precio": price,
+        "fecha_vigencia": date,
+        "latitud": -32.93,
+        "longitud": -68.84,
+    }
+
+
+ROWS = [
+    row(1, 2, 1000.0, "2026-04-01 08:00:00"),
+    row(1, 2, 1010.0, "2026-04-02 08:00:00"),
+    row(1, 3, 1200.0, "2026-04-01 08:00:00"),
+    row(1, 3, 1190.0, "2026-04-01 08:00:00", schedule="Nocturno"),
+    row(2, 2, 990.0, "2026-04-01 09:15:30.123456"),
+    row(2, 2, 995.0, "2026-04-03 09:00:00"),
+    row(3, 3, 1250.0, "2026-04-02 10:00:00"),
+    row(3, 2, 1020.0, "2026-04-02 10:00:00"),
+    row(4, 2, 1005.0, "2026-04-04 07:00:00"),
+]
+
+
+def write_feed(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as feed:
+        writer = csv.DictWriter(feed, fieldnames=list(CSV_COLUMNS))
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def histories(collection):
+    """Station fields and price series, without the generated IDs and timestamps."""
+    return {
+        station["stationId"]: (
+            station["town"],
+            {
+                product["productId"]: [(p["date"], p["price"]) for p in product["prices"]]
+                for product in station["products"]
+            },
+        )
+        for station in collection.documents
+    }
+
+
+def run(collection, source):
+    return import_prices(collection, source, chunk_rows=3, batch_size=2)
+
+
+def test_importing_the_same_feed_twice_is_idempotent(tmp_path):
+    source = write_feed(tmp_path / "precios.csv", ROWS)
+    stations = FakeStations()
+    first = run(stations, source)
+    assert (first.rows, first.skipped_rows) == (9, 1)
+    assert (first.stations_upserted, first.prices_added) == (4, 8)
+    imported = histories(stations)
+    assert [price for _, price in imported[1][1][2]] == [1000.0, 1010.0]
+
+    second = run(stations, source)
+    assert (second.stations_upserted, second.products_added, second.prices_added) == (0, 0, 0)
+    assert not second.changed_stations
+    assert histories(stations) == imported
+
+
+def test_new_prices_and_changed_fields_are_applied(tmp_path):
+    stations = FakeStations()
+    run(stations, write_feed(tmp_path / "dia1.csv", ROWS))
+    later = ROWS + [
+        row(1, 2, 1030.0, "2026-04-05 08:00:00"),
+        row(2, 2, 995.0, "2026-04-03 09:00:00", town="Mendoza"),
+    ]
+    stats = run(stations, write_feed(tmp_path / "dia2.csv", later))
+    assert (stats.stations_upserted, stats.prices_added) == (1, 1)
+    assert stats.changed_stations == {1, 2}
+    imported = histories(stations)
+    assert imported[1][1][2][-1][1] == 1030.0
+    assert imported[2][0] == "Mendoza"
+
+
+@pytest.mark.parametrize("fail_on_call", range(1, 8))
+def test_failed_import_resumes_without_duplicates(tmp_path, fail_on_call):
+    source = write_feed(tmp_path / "precios.csv", ROWS)
+    expected = FakeStations()
+    run(expected, source)
+
+    stations = FlakyStations(fail_on_call)
+    with pytest.raises(BulkWriteError):
+        run(stations, source)
+    # Se vuelve a correr la importación completa, sin limpiar lo que alcanzó a escribir
+    run(stations, source)
+    assert histories(stations) == histories(expected)
@@ -0,0 +1,123 @@
+"""
+test_parity.py
+
+Parity tests: the compiled MongoDB pipelines and the in-memory snapshot backend must return
+the same documents for the same query.
+
+The pipelines run on a scratch database of the server in ``MONGO_TEST_URI`` when it is set
+(the ``precio_nafta_test`` database is dropped and recreated). Otherwise they run on
+mongomock, and the cases using operators it does not implement are skipped.
+"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import MongoClient
+
+from models.filters import HistoryWindow, StationFilter
+from storage.geo import Corridor
+from storage.mongo import MongoStationStore, plan_stages
+from storage.price_index import (
+    DIRTY_COLLECTION,
+    PRICE_INDEX_COLLECTION,
+    PRICE_INDEX_MAX_CARRY_DAYS,
+    mark_range,
+    rollup,
+)
+from storage.snapshot import SnapshotStationStore
+from tools.bench_analytics import synthetic_stations
+from tools.explain_queries import representative_queries, uses_index
+
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI")
+UPDATED_AT = datetime(2026, 1, 1)
+NOW = datetime.utcnow()
+
+
+@pytest.fixture(scope="module")
+def stations():
+    stations = synthetic_stations(300, 90, seed=7)
+    for position, station in enumerate(stations):
+        station["updatedAt"] = UPDATED_AT + timedelta(minutes=position % 40)
+    # Una de cada cuatro deja de informar: su precio vence dentro del período del rollup
+    cutoff = NOW - timedelta(days=PRICE_INDEX_MAX_CARRY_DAYS + 20)
+    for station in stations[::4]:
+        for product in station["products"]:
+            product["prices"] = [price for price in product["prices"] if price["date"] < cutoff]
+    return stations
+
+
+@pytest.fixture(scope="module")
+def stores(stations):
+    if MONGO_TEST_URI:
+        client = MongoClient(MONGO_TEST_URI)
+        client.drop_database("precio_nafta_test")
+        collection = client["precio_nafta_test"]["stations2"]
+    else:
+        mongomock = pytest.importorskip("mongomock")
+        collection = mongomock.MongoClient()["precio_nafta_test"]["stations2"]
+    collection.insert_many([dict(station) for station in stations])
+    yield MongoStationStore(collection), SnapshotStationStore(stations)
+    if MONGO_TEST_URI:
+        client.drop_database("precio_nafta_test")
+
+
+CASES = [
+    ("find_stations", (StationFilter(), 20)),
+    ("find_stations", (StationFilter(province="santa", flag="ypf"), 100)),
+    ("find_stations", (StationFilter(product_id=21, town="localidad 1"), 100)),
+    ("find_stations", (StationFilter(product="nafta"), 50)),
+    ("find_stations", (StationFilter(), 20, HistoryWindow(last_n=3))),
+    ("find_stations", (StationFilter(), 20, HistoryWindow(date_from=NOW - timedelta(days=30)))),
+    ("get_station", (7, StationFilter())),
+    ("get_station", (7, StationFilter(product="premium"))),
+    ("get_station", (7, StationFilter(), HistoryWindow(last_n=2))),
+    ("get_station", (100000, StationFilter())),
+    ("find_last_prices", (StationFilter(), 20)),
+    ("find_last_prices", (StationFilter(province="mendoza", product_id=2), 100)),
+    ("get_station_last_prices", (7, StationFilter())),
+    ("get_station_last_prices", (7, StationFilter(product_id=999))),
+    ("find_changes", (None, None, 50)),
+    ("find_changes", (UPDATED_AT + timedelta(minutes=10), None, 50)),
+    ("find_changes", (UPDATED_AT + timedelta(minutes=10), 150, 50)),
+    ("iter_catalog", (UPDATED_AT + timedelta(minutes=35),)),
+    ("find_along_route", (Corridor([[-70.0, -50.0], [-55.0, -22.0]], 50.0), 2)),
+]
+
+
+@pytest.mark.parametrize(
+    "method, args", CASES, ids=[f"{method}-{n}" for n, (method, _) in enumerate(CASES)]
+)
+def test_pipeline_matches_snapshot(stores, method, args):
+    mongo, snapshot = stores
+    try:
+        result = getattr(mongo, method)(*args)
+    except NotImplementedError as e:
+        pytest.skip(f"mongomock: {e}")
+    expected = getattr(snapshot, method)(*args)
+    if method == "iter_catalog":
+        result, expected = sorted(result, key=lambda s: s["stationId"]), list(expected)
+    assert result == expected
+
+
+@pytest.mark.skipif(not MONGO_TEST_URI, reason="explain() necesita un mongod (MONGO_TEST_URI)")
+def test_route_queries_use_indexes(stores):
+    mongo, _ = stores
+    mongo.ensure_indexes()
+    for name, pipeline in representative_queries(7, 2, 1):
+        stages = plan_stages(mongo.explain(pipeline))
+        assert uses_index(stages), f"{name}: {' > '.join(stages)}"
+
+
+@pytest.mark.skipif(not MONGO_TEST_URI, reason="el rollup necesita un mongod (MONGO_TEST_URI)")
+def test_rollup_matches_snapshot(stores, stations):
+    mongo, snapshot = stores
+    database = mongo.collection.database
+    store = MongoStationStore(mongo.collection, database[PRICE_INDEX_COLLECTION])
+    store.ensure_indexes()
+    dates = [price["date"] for s in stations for p in s["products"] for price in p["prices"]]
+    mark_range(mongo.collection, database[DIRTY_COLLECTION], min(dates), max(dates))
+    rollup(mongo.collection, database[PRICE_INDEX_COLLECTION], database[DIRTY_COLLECTION])
+    for province, flag in ((None, None), ("Mendoza", None), (None, "YPF"), ("Mendoza", "YPF")):
+        expected = snapshot.find_price_index(2, province, flag, min(dates), max(dates))
+        assert store.find_price_index(2, province, flag, min(dates), max(dates)) == expected
@@ -0,0 +1,145 @@
+"""
+test_price_index.py
+
+Tests for the daily price index: carrying prices forward, dirty-day marking and the
+agreement between the snapshot and DuckDB engines.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from storage.analytics import DuckDBStationStore
+from storage.price_index import (
+    PRICE_INDEX_MAX_CARRY_DAYS,
+    carry_forward,
+    day_of,
+    ensure_indexes,
+    groups_from_stations,
+    mark_dirty,
+)
+from storage.snapshot import SnapshotStationStore
+from tools.bench_analytics import synthetic_stations
+
+DAY = datetime(2026, 3, 1)
+
+
+def station(station_id, province, prices):
+    return {
+        "stationId": station_id,
+        "province": province,
+        "flag": "YPF",
+        "products": [
+            {"productId": 2, "prices": [{"date": date, "price": price} for date, price in prices]}
+        ],
+    }
+
+
+STATIONS = [
+    # Informa todos los días
+    station(1, "Mendoza", [(DAY + timedelta(days=n, hours=9), 1000.0 + n) for n in range(4)]),
+    # Sólo el primer día, dos veces: vale el último informe de ese día
+    station(2, "Mendoza", [(DAY + timedelta(hours=8), 900.0), (DAY + timedelta(hours=20), 950.0)]),
+    # Empieza a informar el tercer día
+    station(3, "Salta", [(DAY + timedelta(days=2, hours=7), 1100.0)]),
+]
+
+
+def test_prices_are_carried_into_later_days():
+    groups = {}
+    for product_id, day_groups in groups_from_stations(STATIONS):
+        assert product_id == 2
+        groups.update(day_groups)
+
+    assert groups[(DAY, "Mendoza", "YPF")] == [1000.0, 950.0]
+    assert groups[(DAY + timedelta(days=1), "Mendoza", "YPF")] == [1001.0, 950.0]
+    assert groups[(DAY + timedelta(days=3), "Mendoza", "YPF")] == [1003.0, 950.0]
+    # Una estación no cuenta antes de su primer informe
+    assert (DAY + timedelta(days=1), "Salta", "YPF") not in groups
+    assert groups[(DAY + timedelta(days=3), "Salta", "YPF")] == [1100.0]
+
+
+def test_stations_drop_out_after_the_carry_age():
+    changes = {DAY: {1: 1000.0, 2: 900.0}, DAY + timedelta(days=2): {1: 1010.0}}
+    scopes = {1: ("Mendoza", "YPF"), 2: ("Mendoza", "YPF")}
+    # Días salteados, como las ventanas del rollup
+    days = [DAY + timedelta(days=n) for n in (0, 1, 2, 4, 5)]
+    groups = list(carry_forward(changes, scopes, days, max_carry_days=2))
+    assert [list(day.values()) for day in groups] == [
+        [[1000.0, 900.0]],
+        [[1000.0, 900.0]],
+        [[1010.0, 900.0]],
+        [[1010.0]],
+        [],
+    ]
+
+
+def stop_reporting(stations, cutoff):
+    """Drop every price after ``cutoff`` from one station in four."""
+    for station in stations[::4]:
+        for product in station["products"]:
+            product["prices"] = [price for price in product["prices"] if price["date"] < cutoff]
+    return stations
+
+
+def test_snapshot_index_counts_every_known_station():
+    store = SnapshotStationStore(STATIONS)
+    points = store.find_price_index(2, None, None, DAY, DAY + timedelta(days=10))
+    assert [point["day"] for point in points] == [DAY + timedelta(days=n) for n in range(4)]
+    assert [point["count"] for point in points] == [2, 2, 3, 3]
+    assert points[-1]["median"] == 1003.0
+
+
+def test_duckdb_index_matches_snapshot():
+    stations = synthetic_stations(300, 90, seed=5)
+    end = max(price["date"] for s in stations for p in s["products"] for price in p["prices"])
+    # Estaciones que dejan de informar: salen del índice al vencer su último precio
+    stop_reporting(stations, end - timedelta(days=PRICE_INDEX_MAX_CARRY_DAYS + 20))
+    snapshot = SnapshotStationStore(stations)
+    duckdb = DuckDBStationStore(snapshot, lambda since: stations)
+    duckdb.refresh()
+    counts = [
+        point["count"]
+        for point in snapshot.find_price_index(2, None, None, end - timedelta(days=90), end)
+    ]
+    assert counts[-1] < max(counts)
+    for province, flag in ((None, None), ("Mendoza", None), (None, "YPF"), ("Mendoza", "YPF")):
+        for days in (1, 20, 60, 90):
+            start = end - timedelta(days=days)
+            expected = snapshot.find_price_index(2, province, flag, start, end)
+            assert duckdb.find_price_index(2, province, flag, start, end) == expected
+
+
+class DirtyCollection:
+    def __init__(self):
+        self.marked = set()
+
+    def bulk_write(self, operations, ordered=True):
+        for operation in operations:
+            marker = operation._filter["_id"]
+            self.marked.add((marker["productId"], marker["day"]))
+
+
+def test_mark_dirty_marks_every_later_day():
+    dirty = DirtyCollection()
+    today = day_of(datetime.utcnow())
+    mark_dirty(dirty, [(2, today - timedelta(days=3, hours=-5)), (2, today - timedelta(days=1))])
+    assert sorted(dirty.marked) == [(2, today - timedelta(days=n)) for n in (3, 2, 1, 0)]
+
+
+def test_mark_dirty_stops_when_the_price_expires():
+    dirty = DirtyCollection()
+    reported = day_of(datetime.utcnow()) - timedelta(days=PRICE_INDEX_MAX_CARRY_DAYS + 10)
+    mark_dirty(dirty, [(3, reported + timedelta(hours=9))])
+    days = sorted(day for _, day in dirty.marked)
+    assert days[0] == reported
+    assert days[-1] == reported + timedelta(days=PRICE_INDEX_MAX_CARRY_DAYS)
+    assert len(days) == PRICE_INDEX_MAX_CARRY_DAYS + 1
+
+
+def test_ensure_indexes_drops_the_price_date_index():
+    mongomock = pytest.importorskip("mongomock")
+    db = mongomock.MongoClient()["precio_nafta_test"]
+    db["stations2"].create_index([("products.prices.date", 1)])
+    ensure_indexes(db["stations2"], db["price_index_daily"])
+    assert "products.prices.date_1" not in db["stations2"].index_information()
@@ -0,0 +1,184 @@
+"""
+test_resilience.py
+
+Tests for the resilient store: sharing in-flight calls between requests with different
+deadlines, cancelling them when their clients go away, and which queries may be served
+stale.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from pymongo.errors import AutoReconnect, ExecutionTimeout, OperationFailure, PyMongoError
+
+from models.filters import StationFilter
+from storage.deadline import (
+    ClientDisconnected,
+    Deadline,
+    DeadlineExceeded,
+    max_time_ms,
+    query_comment,
+    run_query,
+    use_deadline,
+)
+from storage.resilience import INTERRUPTED, ResilientStore, track_freshness
+from tests.test_deadline import FakeRequest
+
+
+class FakeStore:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.fail = False
+
+    def find_stations(self, filters, limit=20, window=None):
+        self.calls.append((query_comment(), max_time_ms()))
+        time.sleep(self.delay)
+        if self.fail:
+            raise AutoReconnect("sin conexión")
+        return [{"stationId": 1, "products": []}]
+
+    def find_changes(self, since=None, after_station_id=None, limit=500):
+        if self.fail:
+            raise AutoReconnect("sin conexión")
+        return [{"stationId": len(self.calls), "products": []}]
+
+
+class TimedStore(FakeStore):
+    """Enforces ``maxTimeMS`` like the server does."""
+
+    def find_stations(self, filters, limit=20, window=None):
+        budget = max_time_ms()
+        self.calls.append((query_comment(), budget))
+        if self.delay * 1000 > budget:
+            time.sleep(budget / 1000)
+            raise ExecutionTimeout("operation exceeded time limit")
+        time.sleep(self.delay)
+        return [{"stationId": 1, "products": []}]
+
+
+class BlockingStore:
+    """Runs each query until it is killed by its tag, like ``killOp``."""
+
+    def __init__(self):
+        self.running = {}
+        self.cancelled = []
+        self.started = time.monotonic()
+
+    def find_stations(self, filters, limit=20, window=None):
+        killed = self.running[query_comment()] = threading.Event()
+        if not killed.wait(5):
+            return []
+        raise OperationFailure("operation was interrupted", code=INTERRUPTED)
+
+    def cancel(self, comment):
+        self.cancelled.append((comment, time.monotonic() - self.started))
+        killed = self.running.get(comment)
+        if killed is None:
+            return 0
+        killed.set()
+        return 1
+
+
+def concurrently(store, deadlines):
+    """Send the same query under each deadline, a little apart; return results or errors."""
+    results = {}
+
+    def request(name, deadline):
+        with use_deadline(deadline):
+            try:
+                results[name] = store.find_stations(StationFilter(), 20)
+            except PyMongoError as e:
+                results[name] = e
+
+    threads = []
+    for name, deadline in deadlines.items():
+        threads.append(threading.Thread(target=request, args=(name, deadline)))
+        threads[-1].start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_short_deadline_does_not_fail_other_waiters():
+    backend = FakeStore(delay=0.3)
+    store = ResilientStore(backend, fresh_seconds=0, stale_while_revalidate_seconds=0)
+    short, long = Deadline(50), Deadline(5000)
+    results = concurrently(store, {"short": short, "long": long})
+
+    assert isinstance(results["short"], DeadlineExceeded)
+    assert results["long"] == [{"stationId": 1, "products": []}]
+    # Una sola llamada, con etiqueta propia y el plazo de la petición que la inició
+    assert len(backend.calls) == 1
+    comment, budget = backend.calls[0]
+    assert comment not in (short.comment, long.comment)
+    assert budget <= 50
+
+
+def test_later_deadline_retries_when_the_shared_call_times_out():
+    backend = TimedStore(delay=0.2)
+    store = ResilientStore(backend, fresh_seconds=0, stale_while_revalidate_seconds=0)
+    results = concurrently(store, {"short": Deadline(50), "long": Deadline(2000)})
+
+    assert isinstance(results["short"], ExecutionTimeout)
+    assert results["long"] == [{"stationId": 1, "products": []}]
+    # La segunda llamada usa el presupuesto que le queda a la petición larga
+    assert [budget for _, budget in backend.calls][0] <= 50
+    assert 1800 < backend.calls[1][1] <= 2000
+
+
+def test_call_is_killed_when_its_last_waiter_times_out():
+    backend = BlockingStore()
+    store = ResilientStore(backend, fresh_seconds=0, stale_while_revalidate_seconds=0)
+    results = concurrently(store, {"first": Deadline(50), "second": Deadline(150)})
+
+    assert all(isinstance(error, DeadlineExceeded) for error in results.values())
+    [(comment, at)] = backend.cancelled
+    assert list(backend.running) == [comment]
+    assert at >= 0.15
+
+
+def test_disconnect_kills_the_shared_call_once_nobody_waits():
+    backend = BlockingStore()
+    store = ResilientStore(backend, fresh_seconds=0, stale_while_revalidate_seconds=0)
+
+    async def requests():
+        return await asyncio.gather(
+            run_query(
+                FakeRequest(disconnect_after=0.05), store, "find_stations", StationFilter(), 20
+            ),
+            run_query(
+                FakeRequest(disconnect_after=0.2), store, "find_stations", StationFilter(), 20
+            ),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(requests())
+    assert all(isinstance(error, ClientDisconnected) for error in results)
+    # La primera desconexión no corta la consulta que la otra petición sigue esperando; la
+    # segunda la mata con la etiqueta de la llamada compartida
+    [(comment, at)] = backend.cancelled
+    assert list(backend.running) == [comment]
+    assert at >= 0.2
+
+
+def test_changes_are_never_served_stale():
+    backend = FakeStore()
+    store = ResilientStore(backend, fresh_seconds=0)
+    store.find_changes(None, None, 50)
+    backend.fail = True
+    with pytest.raises(AutoReconnect):
+        store.find_changes(None, None, 50)
+
+
+def test_other_queries_fall_back_to_stale_results():
+    backend = FakeStore()
+    store = ResilientStore(backend, fresh_seconds=0, stale_while_revalidate_seconds=0)
+    expected = store.find_stations(StationFilter(), 20)
+    backend.fail = True
+    with track_freshness() as state:
+        assert store.find_stations(StationFilter(), 20) == expected
+    assert state["status"] == "stale-if-error"
@@ -0,0 +1,119 @@
+"""
+test_search.py
+
+Tests for the trigram search index and for keeping it in sync with the station catalog.
+"""
+
+from datetime import datetime, timedelta
+
+from models.filters import StationFilter
+from storage.catalog import CatalogRefresher
+from storage.facets import FacetIndex
+from storage.search import StationSearchIndex, normalize, trigrams
+from storage.tiles import TilePyramid
+
+UPDATED_AT = datetime(2026, 5, 1)
+
+
+def station(station_id, name, address, town, province, flag, lon=-64.18, lat=-31.42):
+    return {
+        "stationId": station_id,
+        "stationName": name,
+        "address": address,
+        "town": town,
+        "province": province,
+        "flag": flag,
+        "flagId": None,
+        "geometry": {"type": "Point", "coordinates": [lon, lat]},
+        "products": [{"productId": 2, "productName": "Nafta (súper)", "prices": [{"price": 1.0}]}],
+        "updatedAt": UPDATED_AT + timedelta(seconds=station_id),
+    }
+
+
+STATIONS = [
+    station(1, "YPF Av. Colón", "Av. Colón 1200", "Córdoba", "CORDOBA", "YPF"),
+    station(2, "Shell Centro", "San Martín 55", "Mendoza", "MENDOZA", "SHELL C.A.P.S.A."),
+    station(3, "Axion Colonia", "Ruta 9 km 12", "Colonia Caroya", "CORDOBA", "AXION"),
+    station(4, "YPF Ruta 40", "Ruta 40 km 3", "Mendoza", "MENDOZA", "YPF"),
+]
+
+
+def search_ids(index, query, **options):
+    return [summary["stationId"] for _, summary in index.search(query, **options)]
+
+
+def build():
+    index = StationSearchIndex()
+    for document in STATIONS:
+        index.upsert(document)
+    return index
+
+
+def test_normalize_strips_accents_case_and_punctuation():
+    assert normalize("  Av. Colón/Ñandú-1200 ") == "av colon nandu 1200"
+    assert normalize(None) == ""
+    # El relleno inicial hace que un prefijo comparta trigramas con la palabra
+    assert trigrams("yp") & trigrams("ypf") == {"  y", " yp"}
+
+
+def test_accent_less_and_misspelled_queries_match():
+    index = build()
+    assert search_ids(index, "cordoba") == [1]
+    assert search_ids(index, "mendosa") == [2, 4]
+    assert search_ids(index, "shel") == [2]
+    assert search_ids(index, "xyz") == []
+
+
+def test_best_match_ranks_first():
+    index = build()
+    results = index.search("ypf av colon")
+    assert [summary["stationId"] for _, summary in results] == [1, 3, 4]
+    assert results[0][0] == 1.0
+    assert [score for score, _ in results] == sorted((score for score, _ in results), reverse=True)
+
+
+def test_prefixes_autocomplete():
+    index = build()
+    assert search_ids(index, "yp") == [1, 4]
+    assert search_ids(index, "yp", limit=1) == [1]
+
+
+def test_province_filter_ignores_accents_and_case():
+    index = build()
+    assert search_ids(index, "ypf", province="Córdoba") == [1]
+    assert search_ids(index, "ypf", province="mendoza") == [4]
+
+
+def test_renamed_station_drops_its_old_text():
+    index = build()
+    index.upsert(station(2, "Puma Centro", "San Martín 55", "Mendoza", "MENDOZA", "PUMA"))
+    assert search_ids(index, "shell") == []
+    assert search_ids(index, "puma") == [2]
+
+
+class FakeStore:
+    def __init__(self, stations):
+        self.stations = list(stations)
+
+    def iter_catalog(self, since=None):
+        return [s for s in self.stations if since is None or s["updatedAt"] >= since]
+
+
+def test_deleted_stations_leave_every_index():
+    store = FakeStore(STATIONS)
+    search, tiles, facets = StationSearchIndex(), TilePyramid(max_zoom=4), FacetIndex()
+    refresher = CatalogRefresher(store, [search, tiles, facets], full_every=0)
+    assert refresher.refresh() == 4
+
+    store.stations = [s for s in store.stations if s["stationId"] != 2]
+    # El refresco incremental no ve las bajas
+    refresher.refresh()
+    assert search_ids(search, "shell") == [2]
+
+    assert refresher.refresh(full=True) == 3
+    assert search_ids(search, "shell") == []
+    assert search.size == 3
+    assert 2 not in tiles._points
+    counts, _ = facets.facets(StationFilter())
+    assert counts["total"] == 3
+    assert {item["value"] for item in counts["province"]} == {"CORDOBA", "MENDOZA"}
@@ -0,0 +1,98 @@
+"""
+test_slowlog.py
+
+Tests for the slow-query log: sampling, the bounded write queue and the explain budget.
+"""
+
+import threading
+
+from bson import json_util
+
+from models.filters import StationFilter
+from storage.slowlog import SlowQueryLog, SlowQueryStore
+
+
+class FakeStore:
+    def __init__(self):
+        self.explained = 0
+
+    def find_stations(self, filters, limit=20, window=None):
+        return []
+
+    def docs_examined(self, pipeline):
+        self.explained += 1
+        return 42
+
+
+def entries(path):
+    with open(path, encoding="utf-8") as log_file:
+        return [json_util.loads(line) for line in log_file]
+
+
+def test_first_slow_query_is_explained_by_default(tmp_path):
+    backend = FakeStore()
+    log = SlowQueryLog(path=str(tmp_path / "slow.jsonl"), threshold_ms=0.0001, sample_rate=1)
+    SlowQueryStore(backend, log).find_stations(StationFilter(), 20)
+    log.join()
+    assert backend.explained == 1
+    assert entries(log.path)[0]["docsExamined"] == 42
+
+
+def test_explain_can_be_disabled(tmp_path):
+    backend = FakeStore()
+    log = SlowQueryLog(
+        path=str(tmp_path / "slow.jsonl"),
+        threshold_ms=0.0001,
+        sample_rate=1,
+        explain_per_minute=0,
+    )
+    store = SlowQueryStore(backend, log)
+    for _ in range(5):
+        store.find_stations(StationFilter(), 20)
+    log.join()
+    assert backend.explained == 0
+    assert [entry["docsExamined"] for entry in entries(log.path)] == [None] * 5
+
+
+def test_explain_is_rate_limited(tmp_path):
+    backend = FakeStore()
+    log = SlowQueryLog(
+        path=str(tmp_path / "slow.jsonl"),
+        threshold_ms=0.0001,
+        sample_rate=1,
+        explain_per_minute=1,
+    )
+    store = SlowQueryStore(backend, log)
+    for _ in range(5):
+        store.find_stations(StationFilter(), 20)
+    log.join()
+    assert backend.explained == 1
+    assert [entry["docsExamined"] for entry in entries(log.path)] == [42, None, None, None, None]
+
+
+def test_full_queue_drops_entries(tmp_path, monkeypatch):
+    log = SlowQueryLog(
+        path=str(tmp_path / "slow.jsonl"), threshold_ms=0.0001, sample_rate=1, queue_size=3
+    )
+    release = threading.Event()
+    written = []
+
+    def slow_write(*item):
+        release.wait()
+        written.append(item)
+
+    monkeypatch.setattr(log, "_write", slow_write)
+    for _ in range(10):
+        log.submit(FakeStore(), "find_stations", (StationFilter(), 20), 1000.0)
+    release.set()
+    log.join()
+    # Uno en curso en el worker, tres en la cola; el resto se descarta sin bloquear
+    assert len(written) + log.dropped == 10
+    assert 3 <= len(written) <= 4
+
+
+def test_fast_queries_are_not_logged(tmp_path):
+    log = SlowQueryLog(path=str(tmp_path / "slow.jsonl"), threshold_ms=10000, sample_rate=1)
+    SlowQueryStore(FakeStore(), log).find_stations(StationFilter(), 20)
+    log.join()
+    assert not (tmp_path / "slow.jsonl").exists()
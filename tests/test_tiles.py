@@ -0,0 +1,48 @@
+"""
+test_tiles.py
+
+Tests for the tile pyramid's response cache.
+"""
+
+import storage.tiles
+from storage.tiles import TilePyramid
+
+
+def station(station_id, lon, lat, price):
+    return {
+        "stationId": station_id,
+        "stationName": f"Estación {station_id}",
+        "flag": "YPF",
+        "geometry": {"type": "Point", "coordinates": [lon, lat]},
+        "products": [{"productId": 2, "prices": [{"price": price}]}],
+    }
+
+
+def test_cache_ignores_unknown_products_and_deep_zooms():
+    pyramid = TilePyramid(max_zoom=6)
+    pyramid.upsert(station(1, -58.4, -34.6, 1000.0))
+    for product_id in range(1000):
+        pyramid.tile(3, 2, 4, product_id)
+    for x in range(1000):
+        pyramid.tile(12, x, 0)
+    # Sólo el producto 2 existe; los zooms profundos no se cachean
+    assert len(pyramid._responses) == 1
+
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(storage.tiles, "TILE_CACHE_ENTRIES", 10)
+    pyramid = TilePyramid(max_zoom=6)
+    for x in range(64):
+        pyramid.tile(6, x, 0)
+    assert len(pyramid._responses) == 10
+
+
+def test_station_change_invalidates_cached_tile():
+    pyramid = TilePyramid(max_zoom=6)
+    pyramid.upsert(station(1, -58.4, -34.6, 1000.0))
+    first, first_version = pyramid.tile(0, 0, 0, 2)
+    pyramid.upsert(station(1, -58.4, -34.6, 900.0))
+    second, second_version = pyramid.tile(0, 0, 0, 2)
+    assert first_version != second_version
+    assert first["features"][0]["minPrices"] == {2: 1000.0}
+    assert second["features"][0]["minPrices"] == {2: 900.0}
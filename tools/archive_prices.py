@@ -0,0 +1,44 @@
+"""
+archive_prices.py
+
+Command-line job that moves aged price observations from the hot ``stations2`` collection
+into the Parquet cold-storage archive.
+
+Usage:
+    python -m tools.archive_prices [--days 365] [--archive-dir archive] [--dry-run]
+"""
+
+import argparse
+
+from config.database import collection_name
+from storage.archive import ARCHIVE_AFTER_DAYS, ARCHIVE_DIR, archive_cutoff, archive_old_prices
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments and run the archival job.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Archivar precios históricos en Parquet.")
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=ARCHIVE_AFTER_DAYS,
+        help="Antigüedad (en días) a partir de la cual se archivan los precios",
+    )
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR, help="Directorio del archivo")
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Sólo contar los precios archivables"
+    )
+    args = parser.parse_args(argv)
+
+    cutoff = archive_cutoff(args.days)
+    total = archive_old_prices(collection_name, cutoff, args.archive_dir, dry_run=args.dry_run)
+    action = "archivables" if args.dry_run else "archivados"
+    print(f"{total} precios anteriores a {cutoff:%Y-%m-%d} {action}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+bench_alerts.py
+
+Benchmark of the price-alert matching engine with a large number of subscriptions.
+
+The tool generates ``--stations`` synthetic stations (see ``tools.bench_analytics``) and
+``--alerts`` subscriptions spread over their towns, provinces and surroundings, loads them
+into an :class:`AlertIndex`, primes it with the current prices and then applies a burst of
+``--updates`` price changes, reporting the time per change and per notification. A sample
+of the changes is checked against a full scan of every subscription, which is also timed
+to show what matching without the index would cost.
+
+Usage:
+    python -m tools.bench_alerts [--stations 20000] [--alerts 1000000] [--updates 100000]
+        [--verify 20]
+"""
+
+import argparse
+import random
+import resource
+import statistics
+import time
+from datetime import timedelta
+
+from bson import ObjectId
+
+from storage.alerts import AlertIndex
+from storage.geo import distance_km
+from storage.search import normalize
+from tools.bench_analytics import synthetic_stations
+
+
+def synthetic_alerts(stations: list, count: int, seed: int = 1) -> list:
+    """
+    Generate alert documents around the given stations.
+
+    Half of the alerts name a town, some of them with its province, a tenth a whole
+    province and the rest a circle around a point near a station. Thresholds are drawn
+    around the station's current price, so a realistic share of them triggers.
+
+    Args:
+        stations (list): Catalog documents.
+        count (int): Number of alerts.
+        seed (int): Random seed.
+
+    Returns:
+        list: Alert documents shaped like the ``alerts`` collection.
+    """
+    rng = random.Random(seed)
+    alerts = []
+    for number in range(count):
+        station = rng.choice(stations)
+        product = rng.choice(station["products"])
+        alert = {
+            "_id": ObjectId(),
+            "username": f"usuario{number % (count // 3 + 1)}",
+            "productId": product["productId"],
+            "threshold": round(product["prices"][-1]["price"] * rng.uniform(0.85, 1.0), 2),
+            "province": None,
+            "town": None,
+            "near": None,
+            "radiusKm": 10.0,
+        }
+        kind = rng.random()
+        if kind < 0.5:
+            alert["town"] = station["town"]
+            if kind < 0.25:
+                alert["province"] = station["province"]
+        elif kind < 0.6:
+            alert["province"] = station["province"]
+        else:
+            lon, lat = station["geometry"]["coordinates"]
+            alert["near"] = [lon + rng.uniform(-0.1, 0.1), lat + rng.uniform(-0.1, 0.1)]
+            alert["radiusKm"] = rng.choice([5.0, 10.0, 25.0, 50.0])
+        alerts.append(alert)
+    return alerts
+
+
+def latest_only(station: dict) -> dict:
+    """Return a catalog document: the station with only the latest price of each product."""
+    document = {key: value for key, value in station.items() if key != "products"}
+    document["products"] = [
+        {**product, "prices": product["prices"][-1:]} for product in station["products"]
+    ]
+    return document
+
+
+def scan(alerts: list, station: dict, product_id: int, price: float, previous: float) -> set:
+    """Return the IDs of the alerts a price drop triggers, checking every subscription."""
+    province = normalize(station["province"])
+    town = normalize(station["town"])
+    coordinates = station["geometry"]["coordinates"]
+    triggered = set()
+    for alert in alerts:
+        if alert["productId"] != product_id or not price <= alert["threshold"] < previous:
+            continue
+        if alert["near"]:
+            if distance_km(alert["near"], coordinates) > alert["radiusKm"]:
+                continue
+        elif (alert["province"] and normalize(alert["province"]) != province) or (
+            alert["town"] and normalize(alert["town"]) != town
+        ):
+            continue
+        triggered.add(str(alert["_id"]))
+    return triggered
+
+
+def max_rss_mb() -> float:
+    """Return the peak resident memory of the process, in MB."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments, build the index and run the burst.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Medir el motor de alertas de precio.")
+    parser.add_argument("--stations", type=int, default=20000, help="Estaciones a generar")
+    parser.add_argument("--alerts", type=int, default=1000000, help="Alertas a generar")
+    parser.add_argument("--updates", type=int, default=100000, help="Cambios de precio")
+    parser.add_argument("--verify", type=int, default=20, help="Cambios a comparar con un scan")
+    parser.add_argument("--seed", type=int, default=1, help="Semilla de los datos")
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    stations = [latest_only(s) for s in synthetic_stations(args.stations, 7, args.seed)]
+    alerts = synthetic_alerts(stations, args.alerts, args.seed)
+    print(f"{len(stations)} estaciones, {len(alerts)} alertas generadas")
+
+    index = AlertIndex()
+    before = max_rss_mb()
+    started = time.perf_counter()
+    index.load(alerts)
+    print(
+        f"carga: {time.perf_counter() - started:.1f}s, "
+        f"memoria pico +{max_rss_mb() - before:.0f} MB"
+    )
+    for station in stations:
+        index.upsert(station)
+
+    # Ráfaga de cambios: en su mayoría bajas pequeñas, algunas subas
+    samples = set(rng.sample(range(args.updates), min(args.verify, args.updates)))
+    durations, notified, mismatches, scans = [], 0, 0, []
+    for position in range(args.updates):
+        station = rng.choice(stations)
+        product = rng.choice(station["products"])
+        report = product["prices"][-1]
+        previous = report["price"]
+        report["price"] = price = round(previous * rng.uniform(0.97, 1.02), 2)
+        report["date"] += timedelta(minutes=1)
+
+        started = time.perf_counter()
+        notifications = index.upsert(station)
+        durations.append(time.perf_counter() - started)
+        notified += len(notifications)
+        if position in samples:
+            started = time.perf_counter()
+            expected = scan(alerts, station, product["productId"], price, previous)
+            scans.append(time.perf_counter() - started)
+            if expected != {n["alertId"] for n in notifications}:
+                mismatches += 1
+
+    total = sum(durations)
+    print(
+        f"ráfaga: {args.updates} cambios en {total:.2f}s "
+        f"({args.updates / total:.0f} cambios/s), {notified} notificaciones"
+    )
+    print(
+        f"por cambio: mediana {statistics.median(durations) * 1e6:.0f} µs, "
+        f"p99 {sorted(durations)[int(len(durations) * 0.99)] * 1e6:.0f} µs; "
+        f"por notificación: {total / max(notified, 1) * 1e6:.1f} µs"
+    )
+    if scans:
+        print(
+            f"scan de todas las alertas: mediana {statistics.median(scans) * 1000:.0f} ms "
+            f"por cambio; {mismatches} de {len(scans)} cambios con resultados distintos"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+bench_along_route.py
+
+Benchmark of the route-corridor search on long, multi-province routes.
+
+Each route joins real cities about 1,000 km apart and is densified to a vertex every
+~100 m, like a GPS track or a routing-engine polyline. For every route and corridor width
+the tool times the corridor construction (simplification and buffering) and the backend
+query separately, and on MongoDB prints the winning plan to confirm the ``2dsphere`` index
+is used.
+
+Usage:
+    python -m tools.bench_along_route [--product-id 2] [--widths 2 5 10] [--runs 20]
+"""
+
+import argparse
+import statistics
+import time
+
+from config.database import backend_store as store
+from storage.compiler import compile_along_route
+from storage.geo import Corridor, distance_km
+from storage.mongo import MongoStationStore, plan_stages
+
+# Recorridos de ~1.000 km que cruzan varias provincias, como [longitud, latitud]
+ROUTES = {
+    "Buenos Aires - Rosario - Córdoba - Villa Mercedes": [
+        [-58.3816, -34.6037],
+        [-60.6393, -32.9468],
+        [-64.1888, -31.4201],
+        [-65.4572, -33.6757],
+    ],
+    "Buenos Aires - Bahía Blanca - Neuquén": [
+        [-58.3816, -34.6037],
+        [-60.2786, -36.8927],
+        [-62.2663, -38.7183],
+        [-68.0591, -38.9516],
+    ],
+    "Córdoba - Santiago del Estero - Tucumán - Salta": [
+        [-64.1888, -31.4201],
+        [-64.2615, -27.7834],
+        [-65.2226, -26.8083],
+        [-65.4117, -24.7821],
+    ],
+    "Rosario - Santa Fe - Resistencia - Formosa": [
+        [-60.6393, -32.9468],
+        [-60.7000, -31.6333],
+        [-58.9864, -27.4514],
+        [-58.1781, -26.1775],
+    ],
+}
+
+
+def densify(waypoints, step_km: float = 0.1):
+    """
+    Interpolate vertices between waypoints so consecutive vertices are ``step_km`` apart.
+
+    Args:
+        waypoints (list): ``[lon, lat]`` waypoints.
+        step_km (float): Target distance between vertices.
+
+    Returns:
+        list: The densified route.
+    """
+    route = []
+    for a, b in zip(waypoints, waypoints[1:]):
+        steps = max(1, int(distance_km(a, b) / step_km))
+        for i in range(steps):
+            t = i / steps
+            route.append([a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t])
+    route.append(list(waypoints[-1]))
+    return route
+
+
+def percentile(values, fraction: float) -> float:
+    """Return the value at the given fraction of the sorted values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments and run the benchmark.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Medir la búsqueda de estaciones en ruta.")
+    parser.add_argument("--product-id", type=int, default=2, help="Producto a buscar")
+    parser.add_argument(
+        "--widths", type=float, nargs="+", default=[2.0, 5.0, 10.0], help="Anchos en km"
+    )
+    parser.add_argument("--runs", type=int, default=20, help="Repeticiones por caso")
+    args = parser.parse_args(argv)
+
+    print(f"Backend: {type(store).__name__}")
+
+    for name, waypoints in ROUTES.items():
+        route = densify(waypoints)
+        for width in args.widths:
+            build_ms, query_ms = [], []
+            found = 0
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                corridor = Corridor(route, width)
+                built = time.perf_counter()
+                found = len(store.find_along_route(corridor, args.product_id))
+                build_ms.append((built - started) * 1000)
+                query_ms.append((time.perf_counter() - built) * 1000)
+
+            print(
+                f"{name} ({corridor.length_km:.0f} km, {len(route)} vértices -> "
+                f"{len(corridor.route) - 1} tramos), ancho {width:g} km: {found} estaciones\n"
+                f"    corredor p50 {statistics.median(build_ms):7.1f} ms  "
+                f"consulta p50 {statistics.median(query_ms):7.1f} ms  "
+                f"p95 {percentile(query_ms, 0.95):7.1f} ms"
+            )
+            if isinstance(store, MongoStationStore):
+                stages = plan_stages(store.explain(compile_along_route(corridor, args.product_id)))
+                print(f"    plan: {' > '.join(stages)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+bench_analytics.py
+
+Benchmark of the DuckDB analytics engine against the MongoDB pipelines on the same
+synthetic dataset.
+
+The tool generates ``--stations`` station documents (seeded, so every run sees the same
+data) with several products each and ``--days`` of price history, loads them into DuckDB
+and, with ``--uri``, into a scratch collection of a local MongoDB (never the configured
+cluster: the collection is dropped and recreated). Every query is checked to return the
+same result on both engines before it is timed. The price index on MongoDB is read from
+its materialized collection, so the time of the rollup that builds it is reported too.
+
+Without ``--uri`` only the DuckDB side runs, with the in-memory snapshot backend as the
+reference for results.
+
+Usage:
+    python -m tools.bench_analytics [--stations 20000] [--days 180] [--runs 10]
+        [--uri mongodb://localhost:27017 --db bench_analytics]
+"""
+
+import argparse
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from models.filters import StationFilter
+from storage.analytics import DuckDBStationStore
+from storage.mongo import MongoStationStore
+from storage.price_index import DIRTY_COLLECTION, PRICE_INDEX_COLLECTION, mark_range, rollup
+from storage.snapshot import SnapshotStationStore
+
+PROVINCES = ["BUENOS AIRES", "CORDOBA", "SANTA FE", "MENDOZA", "NEUQUEN", "SALTA", "CHUBUT"]
+FLAGS = [(1, "YPF"), (2, "SHELL C.A.P.S.A."), (3, "AXION"), (4, "PUMA"), (5, "BLANCA")]
+PRODUCTS = [(2, "Nafta (súper)"), (3, "Nafta (premium)"), (19, "Gas Oil Grado 2"), (21, "GNC")]
+
+
+def synthetic_stations(count: int, days: int, seed: int = 1) -> list:
+    """
+    Generate station documents with a price history.
+
+    Each station sells a random subset of ``PRODUCTS`` and reports a new price every few
+    days, sometimes twice on the same day.
+
+    Args:
+        count (int): Number of stations.
+        days (int): Days of history, ending today.
+        seed (int): Random seed.
+
+    Returns:
+        list: Station documents shaped like ``stations2``.
+    """
+    rng = random.Random(seed)
+    end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    stations = []
+    for station_id in range(1, count + 1):
+        flag_id, flag = rng.choice(FLAGS)
+        province = rng.choice(PROVINCES)
+        products = []
+        for product_id, product_name in rng.sample(PRODUCTS, rng.randint(1, len(PRODUCTS))):
+            price = rng.uniform(800, 1400)
+            prices = []
+            date = start + timedelta(minutes=rng.randint(0, 72 * 60))
+            while date < end:
+                price = round(price * rng.uniform(0.99, 1.03), 2)
+                prices.append({"_id": ObjectId(), "price": price, "date": date})
+                date += timedelta(hours=rng.choice([2, 30, 50, 80, 170]))
+            products.append(
+                {"productId": product_id, "productName": product_name, "prices": prices}
+            )
+        stations.append(
+            {
+                "_id": ObjectId(),
+                "stationId": station_id,
+                "stationName": f"Estación {station_id}",
+                "address": f"Ruta {rng.randint(1, 40)} km {rng.randint(1, 900)}",
+                "town": f"Localidad {rng.randint(1, 300)}",
+                "province": province,
+                "flag": flag,
+                "flagId": flag_id,
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [
+                        round(rng.uniform(-70, -55), 6),
+                        round(rng.uniform(-50, -22), 6),
+                    ],
+                },
+                "products": products,
+            }
+        )
+    return stations
+
+
+def cases(days: int) -> list:
+    """
+    Build the queries to compare.
+
+    Args:
+        days (int): Days of history, for the index ranges.
+
+    Returns:
+        list: ``(name, method, args)`` triples.
+    """
+    end = datetime.utcnow()
+    queries = [
+        ("last-prices", "find_last_prices", (StationFilter(), 20)),
+        ("last-prices limit 1000", "find_last_prices", (StationFilter(), 1000)),
+        ("last-prices producto", "find_last_prices", (StationFilter(product_id=2), 200)),
+        (
+            "last-prices provincia+bandera",
+            "find_last_prices",
+            (StationFilter(province="santa", flag="ypf"), 200),
+        ),
+        ("last-prices nombre", "find_last_prices", (StationFilter(product="nafta"), 200)),
+    ]
+    for label, province, flag in (
+        ("nacional", None, None),
+        ("provincia", "Córdoba", None),
+        ("provincia+bandera", "Santa Fe", "YPF"),
+    ):
+        for span in (30, days):
+            queries.append(
+                (
+                    f"índice {label} {span}d",
+                    "find_price_index",
+                    (2, province, flag, end - timedelta(days=span), end),
+                )
+            )
+    return queries
+
+
+def timed(store, method: str, args: tuple, runs: int) -> float:
+    """Return the median duration, in milliseconds, of ``runs`` calls."""
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        getattr(store, method)(*args)
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments, load the dataset and run the comparison.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Comparar DuckDB con MongoDB.")
+    parser.add_argument("--stations", type=int, default=20000, help="Estaciones a generar")
+    parser.add_argument("--days", type=int, default=180, help="Días de historial")
+    parser.add_argument("--runs", type=int, default=10, help="Repeticiones por consulta")
+    parser.add_argument("--seed", type=int, default=1, help="Semilla de los datos")
+    parser.add_argument("--uri", help="URI de un mongod local (se omite MongoDB si falta)")
+    parser.add_argument("--db", default="bench_analytics", help="Base de pruebas en ese mongod")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    stations = synthetic_stations(args.stations, args.days, args.seed)
+    prices = sum(len(p["prices"]) for station in stations for p in station["products"])
+    print(
+        f"{len(stations)} estaciones, {prices} precios generados "
+        f"en {time.perf_counter() - started:.1f}s"
+    )
+
+    if args.uri:
+        db = MongoClient(args.uri)[args.db]
+        collection = db["stations2"]
+        for name in ("stations2", PRICE_INDEX_COLLECTION, DIRTY_COLLECTION):
+            db.drop_collection(name)
+        collection.insert_many(stations, ordered=False)
+        reference = MongoStationStore(collection, db[PRICE_INDEX_COLLECTION])
+        reference.ensure_indexes()
+        started = time.perf_counter()
+        end = datetime.utcnow()
+        mark_range(collection, db[DIRTY_COLLECTION], end - timedelta(days=args.days + 1), end)
+        rollup(collection, db[PRICE_INDEX_COLLECTION], db[DIRTY_COLLECTION])
+        print(f"rollup del índice en MongoDB: {time.perf_counter() - started:.1f}s")
+        reference_name = "mongo"
+    else:
+        reference = SnapshotStationStore(stations)
+        reference_name = "snapshot"
+
+    engine = DuckDBStationStore(reference, lambda since: stations)
+    started = time.perf_counter()
+    engine.refresh()
+    print(f"carga en DuckDB: {time.perf_counter() - started:.1f}s")
+
+    print(f"\n{'consulta':<36}{reference_name + ' ms':>12}{'duckdb ms':>12}{'x':>8}")
+    for name, method, query_args in cases(args.days):
+        if getattr(reference, method)(*query_args) != getattr(engine, method)(*query_args):
+            print(f"{name:<36}  RESULTADOS DISTINTOS")
+            continue
+        reference_ms = timed(reference, method, query_args, args.runs)
+        engine_ms = timed(engine, method, query_args, args.runs)
+        print(
+            f"{name:<36}{reference_ms:>12.1f}{engine_ms:>12.1f}"
+            f"{reference_ms / max(engine_ms, 0.001):>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
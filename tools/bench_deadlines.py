@@ -0,0 +1,156 @@
+"""
+bench_deadlines.py
+
+Measures how much database time deadlines and disconnect cancellation save under a
+synthetic, timeout-heavy workload.
+
+Heavy route queries are issued concurrently by clients that give up after a fraction of the
+query's usual duration (``--timeout-fraction``). The same workload runs in three modes:
+
+    - ``fijo``: the previous behaviour, a fixed ``maxTimeMS`` and no cancellation, so every
+      query runs to completion after its client is gone;
+    - ``plazo``: the client sends its timeout (``X-Request-Timeout-Ms``), which becomes the
+      query's ``maxTimeMS``;
+    - ``desconexión``: the client sends no timeout and disconnects; the query is killed
+      with ``killOp`` at that moment.
+
+Queries go through ``station_store``, with the same wrappers as the routes (slow-query log
+and, if enabled, ``ResilientStore``). Each request asks for a different ``limit``, so the
+wrapper's cache and call sharing do not answer a query from an earlier one.
+
+Database time is measured as the time until the store call returns, which is when the
+server stops working on the query.
+
+Usage:
+    python -m tools.bench_deadlines [--requests 40] [--concurrency 4] [--limit 500]
+        [--timeout-fraction 0.3]
+"""
+
+import argparse
+import itertools
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo.errors import ExecutionTimeout, OperationFailure
+
+from config.database import backend_store
+from config.database import station_store as store
+from models.filters import StationFilter
+from storage.deadline import ROUTE_TIMEOUTS_MS, Deadline, use_deadline
+from storage.mongo import MongoStationStore
+from storage.resilience import INTERRUPTED, CircuitOpenError
+
+FIXED = "fijo"
+DEADLINE = "plazo"
+DISCONNECT = "desconexión"
+
+
+def run_request(mode: str, method: str, args: tuple, client_timeout_ms: float):
+    """
+    Run one query as a client that gives up after ``client_timeout_ms``.
+
+    Args:
+        mode (str): ``FIXED``, ``DEADLINE`` or ``DISCONNECT``.
+        method (str): Backend method.
+        args (tuple): Arguments of the method.
+        client_timeout_ms (float): When the client gives up.
+
+    Returns:
+        tuple: Database time in milliseconds and the outcome.
+    """
+    deadline = None
+    if mode == DEADLINE:
+        deadline = Deadline(client_timeout_ms)
+    elif mode == DISCONNECT:
+        deadline = Deadline(ROUTE_TIMEOUTS_MS[method])
+
+    disconnect = None
+    if mode == DISCONNECT:
+        disconnect = threading.Timer(client_timeout_ms / 1000, store.cancel, [deadline.comment])
+        disconnect.start()
+
+    started = time.perf_counter()
+    try:
+        with use_deadline(deadline):
+            getattr(store, method)(*args)
+        outcome = "completa"
+    except ExecutionTimeout:
+        outcome = "maxTimeMS"
+    except OperationFailure as e:
+        outcome = "cancelada" if e.code == INTERRUPTED else "error"
+    except CircuitOpenError:
+        outcome = "circuito abierto"
+    finally:
+        if disconnect is not None:
+            disconnect.cancel()
+    return (time.perf_counter() - started) * 1000, outcome
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments and run the three modes.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Medir el tiempo de base ahorrado por plazos.")
+    parser.add_argument("--requests", type=int, default=40, help="Consultas por modo")
+    parser.add_argument("--concurrency", type=int, default=4, help="Clientes concurrentes")
+    parser.add_argument("--limit", type=int, default=500, help="Límite de las consultas")
+    parser.add_argument(
+        "--timeout-fraction",
+        type=float,
+        default=0.3,
+        help="Espera del cliente, como fracción de la duración habitual de la consulta",
+    )
+    args = parser.parse_args(argv)
+
+    if not isinstance(backend_store, MongoStationStore):
+        parser.error("la medición sólo tiene sentido con STORAGE_BACKEND=mongo")
+
+    methods = ["find_stations", "find_last_prices"]
+    # Un límite distinto por consulta: ninguna se responde desde la caché de la capa de
+    # resiliencia ni se suma a otra en curso
+    limits = itertools.count(args.limit)
+    usual_ms = {}
+    for method in methods:
+        durations = [
+            run_request(FIXED, method, (StationFilter(), next(limits)), 0)[0] for _ in range(3)
+        ]
+        usual_ms[method] = statistics.median(durations)
+        print(f"{method}: {usual_ms[method]:.0f} ms habituales")
+
+    totals = {}
+    print(f"\n{'modo':<14}{'resultado':<40}{'base ms':>10}{'p50 ms':>9}{'ahorro':>9}")
+    for mode in (FIXED, DEADLINE, DISCONNECT):
+        workload = [
+            (methods[i % len(methods)], (StationFilter(), next(limits)))
+            for i in range(args.requests)
+        ]
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(
+                executor.map(
+                    lambda query: run_request(
+                        mode, query[0], query[1], usual_ms[query[0]] * args.timeout_fraction
+                    ),
+                    workload,
+                )
+            )
+        durations = [duration for duration, _ in results]
+        totals[mode] = sum(durations)
+        outcomes = ", ".join(
+            f"{outcome} {count}"
+            for outcome, count in Counter(outcome for _, outcome in results).most_common()
+        )
+        saved = 100 * (1 - totals[mode] / totals[FIXED])
+        print(
+            f"{mode:<14}{outcomes:<40}{totals[mode]:>10.0f}{statistics.median(durations):>9.0f}"
+            f"{saved:>8.0f}%"
+        )
+
+
+if __name__ == "__main__":
+    main()
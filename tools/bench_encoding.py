@@ -0,0 +1,106 @@
+"""
+bench_encoding.py
+
+Compares response size and encoding time of every negotiable encoding against the current
+``individual_serial`` + JSON path, on real responses of the configured backend.
+
+Usage:
+    python -m tools.bench_encoding [--limit 100] [--runs 20]
+"""
+
+import argparse
+import statistics
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from config.database import station_store
+from models.filters import StationFilter
+from models.stations import Station
+from schemas.encoding import CBOR, MSGPACK, _adapter, compress, encode
+from schemas.schema import list_serial
+
+
+def timed(function, runs: int):
+    """
+    Run a function several times.
+
+    Args:
+        function (callable): The function to run, without arguments.
+        runs (int): Number of runs.
+
+    Returns:
+        tuple: The last result and the median duration in milliseconds.
+    """
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = function()
+        durations.append((time.perf_counter() - started) * 1000)
+    return result, statistics.median(durations)
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments and print the comparison table.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Comparar codificaciones de respuesta.")
+    parser.add_argument("--limit", type=int, default=100, help="Estaciones por respuesta")
+    parser.add_argument("--runs", type=int, default=20, help="Repeticiones por caso")
+    args = parser.parse_args(argv)
+
+    adapter = _adapter(List[Station])
+    responses = {
+        "/stations": station_store.find_stations(StationFilter(), limit=args.limit),
+        "/last-prices": station_store.find_last_prices(StationFilter(), limit=args.limit),
+    }
+
+    for route, stations in responses.items():
+        # Camino actual de FastAPI: serializar, validar contra el modelo y volcar a JSON
+        def current():
+            validated = adapter.validate_python(list_serial(stations))
+            return JSONResponse(jsonable_encoder(validated)).body
+
+        baseline, baseline_ms = timed(current, args.runs)
+        print(f"\n{route} ({len(stations)} estaciones)")
+        print(f"  {'codificación':<28}{'bytes':>10}{'%':>8}{'ms':>9}")
+        print(f"  {'json (actual)':<28}{len(baseline):>10}{100:>8.0f}{baseline_ms:>9.2f}")
+
+        def prepared(function):
+            # Mismo punto de partida que el camino actual: documentos de la base
+            def run():
+                validated = adapter.validate_python(list_serial(stations))
+                return function(validated)
+
+            return run
+
+        cases = {
+            "json": lambda v: adapter.dump_json(v),
+            "json + gzip": lambda v: compress(adapter.dump_json(v), "gzip"),
+            "json + zstd": lambda v: compress(adapter.dump_json(v), "zstd"),
+            "msgpack": lambda v: encode(adapter.dump_python(v), MSGPACK),
+            "msgpack keys=1": lambda v: encode(adapter.dump_python(v), MSGPACK, 1),
+            "msgpack keys=1 + zstd": lambda v: compress(
+                encode(adapter.dump_python(v), MSGPACK, 1), "zstd"
+            ),
+            "cbor": lambda v: encode(adapter.dump_python(v), CBOR),
+            "cbor keys=1": lambda v: encode(adapter.dump_python(v), CBOR, 1),
+            "cbor keys=1 + gzip": lambda v: compress(
+                encode(adapter.dump_python(v), CBOR, 1), "gzip"
+            ),
+        }
+        for name, function in cases.items():
+            body, duration = timed(prepared(function), args.runs)
+            print(
+                f"  {name:<28}{len(body):>10}{100 * len(body) / len(baseline):>8.1f}"
+                f"{duration:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+chaos_resilience.py
+
+End-to-end check of the resilience layer against a local ``mongod`` that gets paused.
+
+The tool connects to the given MongoDB (it does not use the configured Atlas cluster), wraps
+the MongoDB backend in ``ResilientStore`` and runs concurrent route queries in three phases:
+normal operation, with the ``mongod`` process stopped (``SIGSTOP``), and after it is resumed
+(``SIGCONT``). For each phase it prints how requests were served (fresh, stale, 503 from the
+open circuit, or error) and their latency, and it fails if a request that had a cached
+result waited much longer than ``--slow-call-ms`` or if the circuit did not close after
+the server came back.
+
+Usage:
+    mongod --dbpath /tmp/mongo-chaos &
+    mongorestore --uri mongodb://localhost:27017 --nsInclude 'precios.*' dump/
+    python -m tools.chaos_resilience --uri mongodb://localhost:27017 --db precios \\
+        --pid $(pgrep -x mongod) [--pause 20] [--clients 8]
+"""
+
+import argparse
+import os
+import random
+import signal
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from models.filters import StationFilter
+from storage.mongo import MongoStationStore
+from storage.resilience import CircuitBreaker, CircuitOpenError, ResilientStore, track_freshness
+
+FRESH = "fresh"
+OPEN = "503"
+ERROR = "error"
+
+
+def percentile(values, fraction: float) -> float:
+    """Return the value at the given fraction of the sorted values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def make_cases(store: MongoStationStore, product_id: int):
+    """
+    Build the route queries the clients run, against real station IDs.
+
+    Args:
+        store (MongoStationStore): The backend, to pick station IDs.
+        product_id (int): Product used by the filtered queries.
+
+    Returns:
+        list: ``(name, callable)`` pairs taking the resilient store.
+    """
+    station_ids = [
+        station["stationId"]
+        for station in store.collection.find({}, {"stationId": 1, "_id": 0}).limit(20)
+    ]
+    by_product = StationFilter(product_id=product_id)
+    cases = [
+        ("stations", lambda s: s.find_stations(by_product, 20)),
+        ("last-prices", lambda s: s.find_last_prices(by_product, 20)),
+        # Límite variable: claves que en general no están en la caché
+        ("stations (sin caché)", lambda s: s.find_stations(by_product, random.randint(1, 500))),
+    ]
+    for station_id in station_ids:
+        cases.append(
+            (f"station {station_id}", lambda s, i=station_id: s.get_station(i, by_product))
+        )
+    return cases
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments and run the three phases.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Probar la capa de resiliencia pausando mongod.")
+    parser.add_argument("--uri", default="mongodb://localhost:27017", help="URI del mongod local")
+    parser.add_argument("--db", required=True, help="Base con la colección stations2")
+    parser.add_argument("--pid", type=int, required=True, help="PID del proceso mongod")
+    parser.add_argument("--product-id", type=int, default=2, help="Producto de las consultas")
+    parser.add_argument("--clients", type=int, default=8, help="Clientes concurrentes")
+    parser.add_argument("--warmup", type=float, default=10, help="Segundos antes de pausar")
+    parser.add_argument("--pause", type=float, default=20, help="Segundos con mongod pausado")
+    parser.add_argument("--recovery", type=float, default=20, help="Segundos tras reanudar")
+    parser.add_argument("--slow-call-ms", type=float, default=500, help="Llamada lenta (ms)")
+    parser.add_argument("--open-seconds", type=float, default=5, help="Circuito abierto (s)")
+    parser.add_argument(
+        "--socket-timeout-ms", type=int, default=10000, help="socketTimeoutMS del cliente"
+    )
+    args = parser.parse_args(argv)
+
+    client = MongoClient(
+        args.uri, socketTimeoutMS=args.socket_timeout_ms, serverSelectionTimeoutMS=2000
+    )
+    backend = MongoStationStore(client[args.db]["stations2"])
+    store = ResilientStore(
+        backend,
+        CircuitBreaker(open_seconds=args.open_seconds),
+        fresh_seconds=1,
+        stale_while_revalidate_seconds=5,
+        slow_call_ms=args.slow_call_ms,
+    )
+    cases = make_cases(backend, args.product_id)
+
+    phase = ["normal"]
+    results = []  # (fase, resultado, ms, tenía respaldo)
+    breaker_log = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def run_client():
+        while not stop.is_set():
+            name, query = random.choice(cases)
+            started_phase = phase[0]
+            started = time.perf_counter()
+            with track_freshness() as freshness:
+                try:
+                    query(store)
+                    outcome = freshness.get("status", FRESH)
+                except CircuitOpenError:
+                    outcome = OPEN
+                except PyMongoError:
+                    outcome = ERROR
+            duration_ms = (time.perf_counter() - started) * 1000
+            with lock:
+                results.append((started_phase, outcome, duration_ms, "sin caché" not in name))
+            time.sleep(0.01)
+
+    def watch_breaker():
+        state = None
+        while not stop.is_set():
+            if store.breaker.state != state:
+                state = store.breaker.state
+                breaker_log.append((time.monotonic(), phase[0], state))
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=run_client, daemon=True) for _ in range(args.clients)]
+    threads.append(threading.Thread(target=watch_breaker, daemon=True))
+    for thread in threads:
+        thread.start()
+
+    resumed_at = None
+    try:
+        time.sleep(args.warmup)
+        phase[0] = "pausado"
+        os.kill(args.pid, signal.SIGSTOP)
+        print(f"mongod {args.pid} pausado")
+        time.sleep(args.pause)
+    finally:
+        os.kill(args.pid, signal.SIGCONT)
+        resumed_at = time.monotonic()
+        phase[0] = "recuperación"
+        print(f"mongod {args.pid} reanudado")
+    time.sleep(args.recovery)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=args.socket_timeout_ms / 1000 + 5)
+
+    failed = False
+    print(
+        f"\n{'fase':<14}{'consultas':>10}  {'resultado':<48}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}"
+    )
+    for name in ("normal", "pausado", "recuperación"):
+        rows = [row for row in results if row[0] == name]
+        if not rows:
+            continue
+        outcomes = Counter(row[1] for row in rows)
+        durations = [row[2] for row in rows]
+        summary = ", ".join(f"{key} {count}" for key, count in outcomes.most_common())
+        print(
+            f"{name:<14}{len(rows):>10}  {summary:<48}{statistics.median(durations):>9.1f}"
+            f"{percentile(durations, 0.95):>9.1f}{max(durations):>9.1f}"
+        )
+        # Con resultado en caché, nunca más que una llamada lenta (más margen del scheduler)
+        cached = [row[2] for row in rows if row[3] and row[1] != ERROR]
+        if name == "pausado" and cached and percentile(cached, 0.95) > args.slow_call_ms * 2:
+            print(f"  FALLA: p95 con caché {percentile(cached, 0.95):.0f} ms")
+            failed = True
+
+    print("\nCircuito:")
+    for at, name, state in breaker_log:
+        print(f"  {at - breaker_log[0][0]:7.1f}s  [{name}] {state}")
+    if store.breaker.state != CircuitBreaker.CLOSED:
+        print("  FALLA: el circuito no se cerró tras reanudar mongod")
+        failed = True
+    else:
+        closed = [at for at, _, state in breaker_log if state == "closed" and at >= resumed_at]
+        if closed:
+            print(f"  cerrado {closed[0] - resumed_at:.1f}s después de reanudar")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
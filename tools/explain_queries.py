@@ -0,0 +1,92 @@
+"""
+explain_queries.py
+
+Command-line check that the compiled station queries are served by indexes.
+
+Runs ``explain`` on the pipeline of each route for a set of representative filters and
+reports the winning plan. Exits with status 1 if any query that has an indexable predicate
+falls back to a collection scan, so it can gate deployments against a staging cluster.
+
+Usage:
+    python -m tools.explain_queries [--station-id 1234] [--product-id 2] [--flag-id 1]
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+
+from models.filters import StationFilter
+from storage.compiler import (
+    compile_changes,
+    compile_last_prices,
+    compile_station,
+    compile_station_last_prices,
+    compile_stations,
+)
+from storage.mongo import MongoStationStore, plan_stages
+
+
+def representative_queries(station_id: int, product_id: int, flag_id: int) -> list:
+    """
+    Build the pipeline of each route for a set of representative filters.
+
+    Args:
+        station_id (int): Station used by the single-station routes.
+        product_id (int): Product used by the product filters.
+        flag_id (int): Flag used by the flag filters.
+
+    Returns:
+        list: ``(name, pipeline)`` pairs.
+    """
+    by_product = StationFilter(product_id=product_id)
+    by_flag = StationFilter(flag_id=flag_id)
+    return [
+        ("stations product_id", compile_stations(by_product, 20)),
+        ("stations flag_id", compile_stations(by_flag, 20)),
+        ("station", compile_station(station_id, by_product)),
+        ("last-prices", compile_last_prices(StationFilter(), 20)),
+        ("last-prices product_id", compile_last_prices(by_product, 20)),
+        ("last-prices flag_id", compile_last_prices(by_flag, 20)),
+        ("last-prices station", compile_station_last_prices(station_id, by_product)),
+        ("changes", compile_changes(datetime.utcnow() - timedelta(days=1), None, 500)),
+    ]
+
+
+def uses_index(stages: list) -> bool:
+    """True if a plan reads through an index and never scans the whole collection."""
+    return "COLLSCAN" not in stages and any(
+        stage in ("IXSCAN", "EXPRESS_IXSCAN", "IDHACK") for stage in stages
+    )
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments, explain every representative query and report.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Verificar que las consultas usen índices.")
+    parser.add_argument("--station-id", type=int, default=1, help="Estación de ejemplo")
+    parser.add_argument("--product-id", type=int, default=2, help="Producto de ejemplo")
+    parser.add_argument("--flag-id", type=int, default=1, help="Bandera de ejemplo")
+    args = parser.parse_args(argv)
+
+    # Se importa aquí para que las pruebas puedan usar las consultas sin conectarse
+    from config.database import backend_store as store
+
+    if not isinstance(store, MongoStationStore):
+        parser.error("explain sólo está disponible con STORAGE_BACKEND=mongo")
+
+    failures = 0
+    for name, pipeline in representative_queries(args.station_id, args.product_id, args.flag_id):
+        stages = plan_stages(store.explain(pipeline))
+        indexed = uses_index(stages)
+        failures += not indexed
+        print(f"{'OK ' if indexed else 'FAIL'} {name:<24} {' > '.join(stages)}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
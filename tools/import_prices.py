@@ -0,0 +1,83 @@
+"""
+import_prices.py
+
+Command-line tool that imports the Secretaría de Energía fuel-price dataset ("Precios en
+surtidor - Resolución 314/2016") into the ``stations2`` collection.
+
+The source can be the dataset URL or a local copy; it is streamed in chunks, so memory use
+depends on ``--chunk-rows`` and not on the size of the file.
+
+Usage:
+    python -m tools.import_prices precios-en-surtidor.csv [--chunk-rows 50000]
+        [--batch-size 1000] [--schedule Diurno] [--encoding utf-8] [--dry-run]
+"""
+
+import argparse
+import os
+
+from tqdm import tqdm
+
+# La importación siempre escribe en MongoDB, aunque la API corra en modo snapshot
+os.environ["STORAGE_BACKEND"] = "mongo"
+
+from config.database import collection_name, db  # noqa: E402
+from storage.importer import (  # noqa: E402
+    DEFAULT_SCHEDULE,
+    IMPORT_BATCH_SIZE,
+    IMPORT_CHUNK_ROWS,
+    import_prices,
+)
+from storage.price_index import DIRTY_COLLECTION  # noqa: E402
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments and run the import.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Importar el dataset de precios en surtidor.")
+    parser.add_argument("source", help="Ruta o URL del CSV")
+    parser.add_argument(
+        "--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS, help="Filas leídas por bloque"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Operaciones por bulk_write"
+    )
+    parser.add_argument(
+        "--schedule",
+        default=DEFAULT_SCHEDULE,
+        help="Horario a importar (tipohorario); vacío importa todos",
+    )
+    parser.add_argument("--encoding", default="utf-8", help="Codificación del archivo")
+    parser.add_argument("--dry-run", action="store_true", help="Calcular cambios sin escribir")
+    args = parser.parse_args(argv)
+
+    with tqdm(unit=" filas", unit_scale=True, desc="Importando") as bar:
+        stats = import_prices(
+            collection_name,
+            args.source,
+            schedule=args.schedule or None,
+            chunk_rows=args.chunk_rows,
+            batch_size=args.batch_size,
+            encoding=args.encoding,
+            dry_run=args.dry_run,
+            progress=bar.update,
+            dirty_collection=db[DIRTY_COLLECTION],
+        )
+
+    action = "a escribir" if args.dry_run else "escritos"
+    print(
+        f"{stats.rows} filas en {stats.seconds:.1f}s ({stats.rows_per_second:.0f} filas/s), "
+        f"{stats.skipped_rows} descartadas.\n"
+        f"Cambios {action}: {stats.stations_upserted} estaciones, "
+        f"{stats.products_added} productos nuevos, {stats.prices_added} precios, "
+        f"{len(stats.changed_stations)} estaciones modificadas."
+    )
+    if stats.prices_added and not args.dry_run:
+        print("Días pendientes marcados: correr python -m tools.rollup_price_index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+replay_slowlog.py
+
+Command-line tool that replays a slow-query capture file against a storage backend.
+
+Each captured query is re-run through the same backend method with the same parameters
+(or, with ``--raw``, the recorded pipeline is sent to MongoDB verbatim), and the recorded
+duration is compared with the median of the replays. Use it to reproduce a production
+slowdown on a local mongod or on a snapshot, and to check that a fix actually helps.
+
+Usage:
+    python -m tools.replay_slowlog logs/slow_queries.jsonl [--backend snapshot]
+        [--snapshot snapshots/stations.bson.gz] [--repeat 5] [--route /last-prices] [--raw]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+
+def parse_args(argv=None):
+    """
+    Parse the command-line arguments.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Reproducir consultas lentas registradas.")
+    parser.add_argument("logs", nargs="+", help="Archivos de registro (incluye rotados)")
+    parser.add_argument(
+        "--backend",
+        choices=("mongo", "snapshot"),
+        default=os.getenv("STORAGE_BACKEND", "mongo"),
+        help="Backend contra el que se reproducen las consultas",
+    )
+    parser.add_argument("--snapshot", help="Archivo de snapshot (con --backend snapshot)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repeticiones por consulta")
+    parser.add_argument("--route", help="Sólo reproducir esta ruta (ej: /last-prices)")
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="Ejecutar el pipeline registrado tal cual (sólo mongo) en vez de recompilarlo",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """
+    Replay every captured query and print recorded vs. replayed durations.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    args = parse_args(argv)
+    if args.raw and args.backend != "mongo":
+        sys.exit("--raw sólo está disponible con --backend mongo")
+
+    # El backend se elige al importar config.database; la reproducción no se registra a sí misma
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ["SLOW_QUERY_MS"] = "0"
+    if args.snapshot:
+        os.environ["SNAPSHOT_PATH"] = args.snapshot
+
+    from config.database import backend_store as store
+    from storage.slowlog import query_args, read_entries
+
+    replayed = 0
+    recorded_total = 0.0
+    replay_total = 0.0
+    for path in args.logs:
+        for entry in read_entries(path):
+            if args.route and entry["route"] != args.route:
+                continue
+
+            if args.raw:
+                run = lambda: store._aggregate(entry["pipeline"])  # noqa: E731
+            else:
+                method = getattr(store, entry["method"])
+                call_args = query_args(entry["method"], entry["params"])
+                run = lambda: method(*call_args)  # noqa: E731
+
+            durations = []
+            error = None
+            for _ in range(max(args.repeat, 1)):
+                started = time.perf_counter()
+                try:
+                    run()
+                except Exception as e:
+                    error = e
+                    break
+                durations.append((time.perf_counter() - started) * 1000)
+
+            recorded = entry["durationMs"]
+            if error is not None:
+                print(f"ERROR {entry['route']:<26} {entry['params']} -> {error}")
+                continue
+
+            median = statistics.median(durations)
+            replayed += 1
+            recorded_total += recorded
+            replay_total += median
+            print(
+                f"{entry['route']:<26} recorded {recorded:9.1f} ms  replay {median:9.1f} ms  "
+                f"x{median / recorded if recorded else 0:5.2f}  "
+                f"examined {entry.get('docsExamined')}  {entry['params']}"
+            )
+
+    if replayed:
+        print(
+            f"\n{replayed} consultas: registradas {recorded_total:.1f} ms, "
+            f"reproducidas {replay_total:.1f} ms (mediana de {args.repeat})"
+        )
+    else:
+        print("No hay consultas para reproducir")
+
+
+if __name__ == "__main__":
+    main()
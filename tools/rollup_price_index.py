@@ -0,0 +1,101 @@
+"""
+rollup_price_index.py
+
+Command-line job that brings the daily price index up to date.
+
+By default it only recomputes the ``(product, day)`` pairs marked dirty by the importer.
+``--from``/``--to`` (or ``--full``) mark a range first, to build the index for the first
+time or to repair it after data was corrected by other means.
+
+Usage:
+    python -m tools.rollup_price_index [--from 2024-01-01] [--to 2024-12-31]
+        [--product-id 2 ...] [--full]
+"""
+
+import argparse
+import os
+import time
+from datetime import datetime
+
+# El índice se materializa en MongoDB, aunque la API corra en modo snapshot
+os.environ["STORAGE_BACKEND"] = "mongo"
+
+from config.database import collection_name, db  # noqa: E402
+from storage.archive import archive_watermark  # noqa: E402
+from storage.price_index import (  # noqa: E402
+    DIRTY_COLLECTION,
+    PRICE_INDEX_COLLECTION,
+    ensure_indexes,
+    mark_range,
+    rollup,
+)
+
+
+def first_price_date(stations_collection) -> datetime:
+    """
+    Return the date of the oldest price still in the hot collection.
+
+    Args:
+        stations_collection: The ``stations2`` collection.
+
+    Returns:
+        datetime: The oldest price date, or now if there are no prices.
+    """
+    oldest = list(
+        stations_collection.aggregate(
+            [
+                {"$unwind": "$products"},
+                {"$unwind": "$products.prices"},
+                {"$group": {"_id": None, "date": {"$min": "$products.prices.date"}}},
+            ],
+            allowDiskUse=True,
+        )
+    )
+    return oldest[0]["date"] if oldest else datetime.utcnow()
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments and run the rollup.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Actualizar el índice diario de precios.")
+    parser.add_argument(
+        "--from", dest="date_from", type=datetime.fromisoformat, help="Recalcular desde (día)"
+    )
+    parser.add_argument(
+        "--to", dest="date_to", type=datetime.fromisoformat, help="Recalcular hasta (día)"
+    )
+    parser.add_argument(
+        "--product-id", type=int, nargs="+", help="Productos a recalcular (por defecto, todos)"
+    )
+    parser.add_argument(
+        "--full", action="store_true", help="Recalcular todo el historial no archivado"
+    )
+    args = parser.parse_args(argv)
+
+    index_collection = db[PRICE_INDEX_COLLECTION]
+    dirty_collection = db[DIRTY_COLLECTION]
+    ensure_indexes(collection_name, index_collection)
+
+    if args.full or args.date_from or args.date_to:
+        date_from = args.date_from or archive_watermark() or first_price_date(collection_name)
+        date_to = args.date_to or datetime.utcnow()
+        marked = mark_range(collection_name, dirty_collection, date_from, date_to, args.product_id)
+        print(
+            f"{marked} pares (producto, día) marcados entre {date_from:%Y-%m-%d} "
+            f"y {date_to:%Y-%m-%d}."
+        )
+
+    started = time.perf_counter()
+    totals = rollup(collection_name, index_collection, dirty_collection)
+    print(
+        f"{totals['days']} días recalculados, {totals['points']} puntos escritos, "
+        f"{totals['frozen']} días congelados omitidos, en {time.perf_counter() - started:.1f}s."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+snapshot.py
+
+Command-line tool that dumps the live ``stations2`` collection into a snapshot file for the
+offline ``STORAGE_BACKEND=snapshot`` mode.
+
+Usage:
+    python -m tools.snapshot [--output snapshots/stations.bson.gz] [--with-users]
+"""
+
+import argparse
+import os
+import time
+
+# El snapshot siempre se genera desde MongoDB, aunque la API corra en modo snapshot
+os.environ["STORAGE_BACKEND"] = "mongo"
+
+from config.database import SNAPSHOT_PATH, collection_name, users_collection  # noqa: E402
+from storage.snapshot import write_snapshot  # noqa: E402
+
+
+def main(argv=None):
+    """
+    Parse command-line arguments and write the snapshot.
+
+    Args:
+        argv (list, optional): Argument list. Defaults to ``sys.argv[1:]``.
+    """
+    parser = argparse.ArgumentParser(description="Generar un snapshot de la base de estaciones.")
+    parser.add_argument("--output", default=SNAPSHOT_PATH, help="Archivo de salida")
+    parser.add_argument(
+        "--with-users",
+        action="store_true",
+        help="Incluir la colección de usuarios (con contraseñas hasheadas)",
+    )
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    counts = write_snapshot(
+        collection_name,
+        args.output,
+        users_collection=users_collection if args.with_users else None,
+    )
+    print(
+        f"Snapshot {args.output}: {counts['stations']} estaciones, {counts['users']} usuarios "
+        f"en {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()